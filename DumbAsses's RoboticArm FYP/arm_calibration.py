@@ -0,0 +1,196 @@
+"""
+Pixel-to-arm calibration for cottonv2.py
+
+A calibration file lists a few marked points, each seen by the camera at a
+pixel and measured in arm coordinates. The servo angles used to reach the
+point can be recorded too:
+
+    {
+      "points": [
+        {"pixel": [42, 31], "arm": [-120.0, 260.0], "servos": [118, 72, 95]},
+        ...
+      ]
+    }
+
+From these, pixel -> arm (x, y) is fitted as a homography (at least 4
+points; the camera sees the work surface as a plane). Servo angles are not
+projective, so each servo gets a least-squares polynomial in the pixel
+coordinates instead: quadratic with 6 or more points, affine with 3 to 5.
+
+Both are evaluated once for every pixel of the 320x240 detector frame, so
+looking a target up is a single table read. The table is cached next to
+the calibration file (.npz, keyed by a hash of the file's contents), and
+ArmCalibration.reload_if_changed() picks up an edited calibration file
+without restarting.
+
+Usage (fit, report the error at the marked points and write the cache):
+    python arm_calibration.py [CALIBRATION_JSON]
+"""
+
+import hashlib
+import json
+import os
+import sys
+
+import cv2
+import numpy as np
+
+CALIBRATION_FILE = "arm_calibration.json"
+TABLE_SIZE = (320, 240)      # (width, height) of the detector frame
+RELOAD_CHECK_SECONDS = 1.0   # How often reload_if_changed() looks at the file
+
+
+def polynomial_terms(u, v, degree):
+    """Design matrix columns for an affine (1) or quadratic (2) fit"""
+    terms = [np.ones_like(u), u, v]
+    if degree == 2:
+        terms += [u * u, u * v, v * v]
+    return np.stack(terms, axis=-1)
+
+
+def fit_calibration(points):
+    """Returns (homography, servo_coefficients or None, servo_degree)"""
+    if len(points) < 4:
+        raise ValueError(f"need at least 4 calibration points, got {len(points)}")
+    pixels = np.array([p["pixel"] for p in points], np.float64)
+    arm = np.array([p["arm"] for p in points], np.float64)
+    homography, _ = cv2.findHomography(pixels, arm, 0)
+    if homography is None:
+        raise ValueError("calibration points are degenerate (collinear?)")
+
+    servo_coefficients, degree = None, 0
+    if all("servos" in p for p in points):
+        servos = np.array([p["servos"] for p in points], np.float64)
+        degree = 2 if len(points) >= 6 else 1
+        design = polynomial_terms(pixels[:, 0], pixels[:, 1], degree)
+        servo_coefficients, *_ = np.linalg.lstsq(design, servos, rcond=None)
+    return homography, servo_coefficients, degree
+
+
+def build_table(homography, servo_coefficients, degree, size=TABLE_SIZE):
+    """Dense (height, width, 2 + servos) float32 table: arm x, arm y, then servo angles"""
+    width, height = size
+    v, u = np.mgrid[0:height, 0:width].astype(np.float64)
+    pixels = np.stack([u, v], axis=-1).reshape(-1, 1, 2)
+    arm = cv2.perspectiveTransform(pixels, homography).reshape(height, width, 2)
+    planes = [arm]
+    if servo_coefficients is not None:
+        planes.append(polynomial_terms(u, v, degree) @ servo_coefficients)
+    return np.concatenate(planes, axis=-1).astype(np.float32)
+
+
+def cache_path(calibration_path):
+    return os.path.splitext(calibration_path)[0] + ".npz"
+
+
+def load_table(calibration_path, size=TABLE_SIZE):
+    """
+    Table for a calibration file, from the cache when the file is unchanged.
+    Returns (table, points).
+    """
+    with open(calibration_path, "rb") as f:
+        raw = f.read()
+    digest = hashlib.sha256(raw + repr(size).encode()).hexdigest()
+    points = json.loads(raw)["points"]
+
+    cached = cache_path(calibration_path)
+    try:
+        with np.load(cached) as data:
+            if str(data["digest"]) == digest:
+                return data["table"], points
+    except (OSError, KeyError, ValueError):
+        pass
+
+    table = build_table(*fit_calibration(points), size=size)
+    try:
+        np.savez(cached, table=table, digest=np.array(digest))
+    except OSError as e:
+        print(f"⚠️ Could not cache calibration table: {e}")
+    return table, points
+
+
+class ArmCalibration:
+    def __init__(self, path=CALIBRATION_FILE, size=TABLE_SIZE):
+        self.path = path
+        self.size = size
+        self.table = None
+        self.mtime = None
+        self.last_check = 0.0
+        self.load()
+
+    @property
+    def loaded(self):
+        return self.table is not None
+
+    @property
+    def has_servos(self):
+        return self.table is not None and self.table.shape[2] > 2
+
+    def load(self):
+        """(Re)load the table; keeps the previous one if the file is missing or invalid"""
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+            self.table, points = load_table(self.path, self.size)
+            self.mtime = mtime
+            print(f"📐 Arm calibration loaded from {self.path} ({len(points)} points"
+                  f"{', with servo angles' if self.has_servos else ''})")
+            return True
+        except FileNotFoundError:
+            return False
+        except (OSError, ValueError, KeyError, TypeError, cv2.error) as e:
+            print(f"✗ Arm calibration {self.path} not loaded: {e}")
+            return False
+
+    def reload_if_changed(self, now):
+        """Reload after the calibration file changes; checked at most every RELOAD_CHECK_SECONDS"""
+        if now - self.last_check < RELOAD_CHECK_SECONDS:
+            return False
+        self.last_check = now
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError:
+            return False
+        if mtime == self.mtime:
+            return False
+        # Record the attempt so a broken file is not re-parsed every second
+        self.mtime = mtime
+        return self.load()
+
+    def lookup(self, x, y):
+        """Table entry for a detector pixel: [arm x, arm y, servo angles...]"""
+        width, height = self.size
+        return self.table[min(max(int(y), 0), height - 1), min(max(int(x), 0), width - 1)]
+
+    def annotate(self, targets):
+        """Add "arm_x"/"arm_y" (and "servos") to each target dict in place"""
+        if self.table is None:
+            return
+        for target in targets:
+            entry = self.lookup(target["x"], target["y"])
+            target["arm_x"] = round(float(entry[0]), 1)
+            target["arm_y"] = round(float(entry[1]), 1)
+            if len(entry) > 2:
+                target["servos"] = [int(round(float(a))) for a in entry[2:]]
+
+
+def main():
+    path = sys.argv[1] if len(sys.argv) > 1 else CALIBRATION_FILE
+    calibration = ArmCalibration(path)
+    if not calibration.loaded:
+        print(f"✗ No usable calibration in {path}")
+        sys.exit(1)
+    with open(path) as f:
+        points = json.load(f)["points"]
+    height, width, planes = calibration.table.shape
+    print(f"   Table {width}x{height}x{planes} cached in {cache_path(path)}")
+    for p in points:
+        entry = calibration.lookup(*p["pixel"])
+        error = np.hypot(entry[0] - p["arm"][0], entry[1] - p["arm"][1])
+        line = f"  pixel {tuple(p['pixel'])}: arm ({entry[0]:.1f}, {entry[1]:.1f}), error {error:.2f}"
+        if "servos" in p:
+            line += f", servos {[int(round(float(a))) for a in entry[2:]]} (marked {p['servos']})"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
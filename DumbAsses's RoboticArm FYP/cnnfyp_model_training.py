@@ -22,73 +22,21 @@ with zipfile.ZipFile(zip_file, 'r') as zip_ref:
 
 print("✅ Extracted to:", extract_dir)
 
+# Show contents to verify
+os.listdir(extract_dir)
 
+# Step 3: Automatically find 'images' and 'masks' folders (anywhere in the zip)
+from unet_preprocess import find_sources, preprocess  # Upload unet_preprocess.py next to the notebook
 
-# Step 3: Unzip and prepare folders
-import zipfile
-import os
-
-# Unzip the uploaded file
-import zipfile
-zip_path = list(uploaded.keys())[0]  # get uploaded zip filename
-with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-    zip_ref.extractall("raw_dataset")
+sources = find_sources(extract_dir)
+print("✅ Found", len(sources), "images", "with masks" if sources and sources[0][2] else "(masks will be generated)")
 
-# Show contents to verify
-os.listdir("raw_dataset")
-
-# Step 3: Automatically find 'images' and 'masks' folders
-image_dir = None
-mask_dir = None
-
-for root, dirs, files in os.walk(extract_dir):
-    for d in dirs:
-        d_path = os.path.join(root, d)
-        if 'image' in d.lower():
-            image_dir = d_path
-        elif 'mask' in d.lower():
-            mask_dir = d_path
-
-print("✅ Found folders:")
-print("Images:", image_dir)
-print("Masks:", mask_dir)
-
-# Step 3: Automatically find 'images' and 'masks' folders
-image_dir = None
-mask_dir = None
-
-for root, dirs, files in os.walk(extract_dir):
-    for d in dirs:
-        d_path = os.path.join(root, d)
-        if 'image' in d.lower():
-            image_dir = d_path
-        elif 'mask' in d.lower():
-            mask_dir = d_path
-
-print("✅ Found folders:")
-print("Images:", image_dir)
-print("Masks:", mask_dir)
-
-# Step 4: Resize and save to clean format
-from PIL import Image
+# Step 4: Resize into one packed shard (images.npy, masks.npy, manifest.json)
+# Parallel, and cached: re-running only processes new or changed images.
 import shutil
 
 output_dir = 'resized_dataset'
-resized_images_dir = os.path.join(output_dir, 'images')
-resized_masks_dir = os.path.join(output_dir, 'masks')
-
-os.makedirs(resized_images_dir, exist_ok=True)
-os.makedirs(resized_masks_dir, exist_ok=True)
-
-def resize_images(input_dir, output_dir, size=(128, 128)):
-    for filename in os.listdir(input_dir):
-        if filename.lower().endswith(('.png', '.jpg', '.jpeg')):
-            img = Image.open(os.path.join(input_dir, filename)).convert('RGB')
-            img = img.resize(size)
-            img.save(os.path.join(output_dir, filename))
-
-resize_images(image_dir, resized_images_dir)
-resize_images(mask_dir, resized_masks_dir)
+preprocess(extract_dir, output_dir, size=128)
 
 print("✅ Resizing completed and saved to:", output_dir)
 
@@ -111,10 +59,10 @@ pip install tensorflow numpy scikit-learn matplotlib
 import os
 import numpy as np
 import matplotlib.pyplot as plt
-from tensorflow.keras.preprocessing.image import load_img, img_to_array
 from sklearn.model_selection import train_test_split
 import tensorflow as tf
 from tensorflow.keras import layers, models
+from unet_preprocess import load_shard
 
 # --- PARAMETERS ---
 IMG_HEIGHT = 128
@@ -122,27 +70,10 @@ IMG_WIDTH = 128
 IMG_CHANNELS = 3
 DATASET_PATH = '/content/resized_dataset'
 
+# uint8 images (0-255) and 0/1 masks: the model scales its input itself
 def load_dataset():
-    image_dir = os.path.join(DATASET_PATH, 'images')
-    mask_dir = os.path.join(DATASET_PATH, 'masks')
-
-    image_files = sorted(os.listdir(image_dir))
-    mask_files = sorted(os.listdir(mask_dir))
-
-    images = []
-    masks = []
-
-    for img_name, mask_name in zip(image_files, mask_files):
-        img = load_img(os.path.join(image_dir, img_name), target_size=(IMG_HEIGHT, IMG_WIDTH))
-        img = img_to_array(img) / 255.0
-        images.append(img)
-
-        mask = load_img(os.path.join(mask_dir, mask_name), color_mode='grayscale', target_size=(IMG_HEIGHT, IMG_WIDTH))
-        mask = img_to_array(mask) / 255.0
-        mask = (mask > 0.5).astype(np.float32)  # Ensure binary mask
-        masks.append(mask)
-
-    return np.array(images), np.array(masks)
+    images, masks, _ = load_shard(DATASET_PATH)  # Written by Step 4
+    return images, masks[..., np.newaxis]
 
 # ✅ Load dataset
 X, y = load_dataset()
@@ -150,162 +81,37 @@ print(f"Images shape: {X.shape}, Masks shape: {y.shape}")
 
 X_train, X_val, y_train, y_val = train_test_split(X, y, test_size=0.2, random_state=42)
 
-import os
-import cv2
-import numpy as np
-from sklearn.model_selection import train_test_split
-from PIL import Image
-
-# --- CONFIG ---
-dataset_folder = '/content/raw_dataset/New folder (2)'  # Folder with all raw images
-output_folder = '/content/unet_dataset'
-IMG_HEIGHT = 128
-IMG_WIDTH = 128
-
-# --- Create output directories ---
-def create_output_dirs():
-    for split in ['train', 'val', 'test']:
-        for subfolder in ['images', 'masks']:
-            os.makedirs(os.path.join(output_folder, split, subfolder), exist_ok=True)
-
-# --- Generate mask from image (using color thresholding) ---
-def generate_mask(image):
-    # Convert to HSV for better color segmentation
-    hsv = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
-
-    # Example: mask for white cotton (tune thresholds as needed)
-    lower_white = np.array([0, 0, 200])
-    upper_white = np.array([180, 55, 255])
-    mask = cv2.inRange(hsv, lower_white, upper_white)
-
-    return mask
-
-# --- Resize and save ---
-def save_resized(image, mask, img_save_path, mask_save_path):
-    image = cv2.resize(image, (IMG_WIDTH, IMG_HEIGHT))
-    mask = cv2.resize(mask, (IMG_WIDTH, IMG_HEIGHT))
-
-    cv2.imwrite(img_save_path, image)
-    cv2.imwrite(mask_save_path, mask)
-
-# --- Main processing ---
-def process_and_split():
-    create_output_dirs()
-
-    all_filenames = sorted([f for f in os.listdir(dataset_folder) if f.endswith(('.jpg', '.png'))])
-    train_files, temp_files = train_test_split(all_filenames, test_size=0.3, random_state=42)
-    val_files, test_files = train_test_split(temp_files, test_size=0.5, random_state=42)
-
-    dataset = {
-        'train': train_files,
-        'val': val_files,
-        'test': test_files
-    }
-
-    for split, files in dataset.items():
-        for filename in files:
-            img_path = os.path.join(dataset_folder, filename)
-            image = cv2.imread(img_path)
-
-            if image is None:
-                print(f"Error loading image: {filename}")
-                continue
-
-            mask = generate_mask(image)
-
-            # Define save paths
-            img_save_path = os.path.join(output_folder, split, 'images', filename)
-            mask_save_path = os.path.join(output_folder, split, 'masks', filename)
-
-            save_resized(image, mask, img_save_path, mask_save_path)
-
-    print("✅ All images processed, masks generated, and dataset split successfully.")
-
-# --- Run it ---
-process_and_split()
-
 import os
 import numpy as np
 import matplotlib.pyplot as plt
 import cv2
 from sklearn.model_selection import train_test_split
-from tensorflow.keras.preprocessing.image import img_to_array, load_img
 from tensorflow.keras import layers, models
 import tensorflow as tf
+from unet_preprocess import preprocess  # Upload unet_preprocess.py next to the notebook
+from unet_input import make_datasets, confusion_counts, scores  # and unet_input.py
 
 # --- PARAMETERS ---
 IMG_HEIGHT = 128
 IMG_WIDTH = 128
 IMG_CHANNELS = 3
 RAW_IMAGE_DIR = '/content/raw_dataset/New folder (2)'  # Your folder with raw images
-DATASET_PATH = '/content/resized_dataset'
-
-# --- Create folders ---
-def create_dataset_folders():
-    os.makedirs(os.path.join(DATASET_PATH, 'images'), exist_ok=True)
-    os.makedirs(os.path.join(DATASET_PATH, 'masks'), exist_ok=True)
-
-# --- Generate binary mask (based on white color) ---
-def generate_mask(image):
-    hsv = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
-    lower_white = np.array([0, 0, 200])
-    upper_white = np.array([180, 40, 255])
-    mask = cv2.inRange(hsv, lower_white, upper_white)
-    return mask
+DATASET_PATH = '/content/unet_shard'
 
-# --- Preprocess and save all images + masks ---
+# --- Preprocess all images + masks ---
+# Parallel, and cached: re-running only processes new or changed images.
+# Same as: python unet_preprocess.py RAW_IMAGE_DIR DATASET_PATH
 def preprocess_and_save():
-    create_dataset_folders()
-    image_files = sorted([f for f in os.listdir(RAW_IMAGE_DIR) if f.endswith(('.png', '.jpg'))])
-
-    for file in image_files:
-        img_path = os.path.join(RAW_IMAGE_DIR, file)
-        image = cv2.imread(img_path)
-        if image is None:
-            continue
-
-        mask = generate_mask(image)
-
-        image = cv2.resize(image, (IMG_WIDTH, IMG_HEIGHT))
-        mask = cv2.resize(mask, (IMG_WIDTH, IMG_HEIGHT))
-
-        img_save_path = os.path.join(DATASET_PATH, 'images', file)
-        mask_save_path = os.path.join(DATASET_PATH, 'masks', file)
-
-        cv2.imwrite(img_save_path, image)
-        cv2.imwrite(mask_save_path, mask)
-
-    print("✅ Images and masks processed and saved.")
-
-# --- LOAD IMAGES AND MASKS ---
-def load_dataset():
-    image_dir = os.path.join(DATASET_PATH, 'images')
-    mask_dir = os.path.join(DATASET_PATH, 'masks')
-
-    image_files = sorted(os.listdir(image_dir))
-    mask_files = sorted(os.listdir(mask_dir))
-
-    images = []
-    masks = []
-
-    for img_name, mask_name in zip(image_files, mask_files):
-        img = load_img(os.path.join(image_dir, img_name), target_size=(IMG_HEIGHT, IMG_WIDTH))
-        img = img_to_array(img) / 255.0
-        images.append(img)
-
-        mask = load_img(os.path.join(mask_dir, mask_name), color_mode='grayscale', target_size=(IMG_HEIGHT, IMG_WIDTH))
-        mask = img_to_array(mask) / 255.0
-        mask = (mask > 0.5).astype(np.float32)  # Ensure binary mask
-        masks.append(mask)
-
-    return np.array(images), np.array(masks)
+    preprocess(RAW_IMAGE_DIR, DATASET_PATH, size=IMG_HEIGHT)
 
 # --- U-NET MODEL ---
 def unet_model(input_size=(IMG_HEIGHT, IMG_WIDTH, IMG_CHANNELS)):
+    # Takes 0-255 pixels (uint8 data is never converted to float on the host)
     inputs = layers.Input(input_size)
+    scaled = layers.Rescaling(1.0 / 255)(inputs)
 
     # Encoder
-    c1 = layers.Conv2D(16, 3, activation='relu', padding='same')(inputs)
+    c1 = layers.Conv2D(16, 3, activation='relu', padding='same')(scaled)
     c1 = layers.Conv2D(16, 3, activation='relu', padding='same')(c1)
     p1 = layers.MaxPooling2D()(c1)
 
@@ -343,17 +149,18 @@ def unet_model(input_size=(IMG_HEIGHT, IMG_WIDTH, IMG_CHANNELS)):
 
 # --- RUN ALL STEPS ---
 preprocess_and_save()
-X, y = load_dataset()
-X_train, X_val, y_train, y_val = train_test_split(X, y, test_size=0.2, random_state=42)
+# Streams batches from the memory-mapped shard (see unet_input.py), so the dataset
+# does not have to fit in RAM; images and masks stay uint8 until the model / loss.
+train_ds, val_ds, train_count, val_count = make_datasets(DATASET_PATH, batch_size=8)
+print(f"Training on {train_count} images, validating on {val_count}")
 
 model = unet_model()
 model.compile(optimizer='adam', loss='binary_crossentropy', metrics=['accuracy'])
 
 # --- TRAINING ---
 history = model.fit(
-    X_train, y_train,
-    validation_data=(X_val, y_val),
-    batch_size=8,
+    train_ds,
+    validation_data=val_ds,
     epochs=15
 )
 
@@ -366,6 +173,7 @@ plt.show()
 
 # --- PREDICT AND VISUALIZE ---
 def show_predictions(X, y_true, model, count=5):
+    count = min(count, len(X))
     preds = model.predict(X[:count])
     for i in range(count):
         plt.figure(figsize=(12, 3))
@@ -380,22 +188,15 @@ def show_predictions(X, y_true, model, count=5):
         plt.title("Prediction")
         plt.show()
 
-show_predictions(X_val, y_val, model)
+X_val_batch, y_val_batch = next(iter(val_ds))
+show_predictions(X_val_batch.numpy(), y_val_batch.numpy(), model)
 
-from sklearn.metrics import precision_score, recall_score, f1_score
-from sklearn.metrics import confusion_matrix, ConfusionMatrixDisplay
+from sklearn.metrics import ConfusionMatrixDisplay
 
 # --- EVALUATION METRICS ---
-def evaluate_model(X, y_true, model):
-    preds = model.predict(X)
-    preds = (preds > 0.5).astype(np.uint8)  # Binarize predictions
-
-    y_true_flat = y_true.flatten()
-    preds_flat = preds.flatten()
-
-    precision = precision_score(y_true_flat, preds_flat)
-    recall = recall_score(y_true_flat, preds_flat)
-    f1 = f1_score(y_true_flat, preds_flat)
+# Pixel counts are accumulated batch by batch (confusion_counts), not on the whole set at once
+def evaluate_model(dataset, model):
+    _, precision, recall, f1 = scores(confusion_counts(model, dataset))
 
     print(f"📈 Precision: {precision:.4f}")
     print(f"📈 Recall: {recall:.4f}")
@@ -404,7 +205,7 @@ def evaluate_model(X, y_true, model):
     return precision, recall, f1
 
 # --- CALL METRIC FUNCTION ---
-precision, recall, f1 = evaluate_model(X_val, y_val, model)
+precision, recall, f1 = evaluate_model(val_ds, model)
 
 # --- PLOT METRICS ---
 plt.figure(figsize=(6, 4))
@@ -419,24 +220,17 @@ for i, v in enumerate(metrics):
 plt.show()
 
 # --- EVALUATION METRICS + CONFUSION MATRIX ---
-def evaluate_model(X, y_true, model):
-    preds = model.predict(X)
-    preds = (preds > 0.5).astype(np.uint8)  # Binarize predictions
-
-    y_true_flat = y_true.flatten()
-    preds_flat = preds.flatten()
+def evaluate_model(dataset, model):
+    cm = confusion_counts(model, dataset)
 
     # Metrics
-    precision = precision_score(y_true_flat, preds_flat)
-    recall = recall_score(y_true_flat, preds_flat)
-    f1 = f1_score(y_true_flat, preds_flat)
+    _, precision, recall, f1 = scores(cm)
 
     print(f"📈 Precision: {precision:.4f}")
     print(f"📈 Recall: {recall:.4f}")
     print(f"📈 F1 Score: {f1:.4f}")
 
     # Confusion Matrix
-    cm = confusion_matrix(y_true_flat, preds_flat)
     disp = ConfusionMatrixDisplay(confusion_matrix=cm, display_labels=["Background (0)", "Cotton (1)"])
     disp.plot(cmap='Blues', values_format='d')
     plt.title("Confusion Matrix")
@@ -445,23 +239,13 @@ def evaluate_model(X, y_true, model):
     return precision, recall, f1, cm
 
 # Call it
-precision, recall, f1, cm = evaluate_model(X_val, y_val, model)
-
-X_train, X_val, y_train, y_val = train_test_split(X, y, test_size=0.2, random_state=42)
-
-from sklearn.metrics import precision_score, recall_score, f1_score, confusion_matrix, ConfusionMatrixDisplay
-
-def evaluate_model(X, y_true, model, title="Validation"):
-    preds = model.predict(X)
-    preds = (preds > 0.5).astype(np.uint8)
+precision, recall, f1, cm = evaluate_model(val_ds, model)
 
-    y_true_flat = y_true.flatten()
-    preds_flat = preds.flatten()
+from sklearn.metrics import ConfusionMatrixDisplay
 
-    acc = np.mean(preds_flat == y_true_flat)
-    precision = precision_score(y_true_flat, preds_flat)
-    recall = recall_score(y_true_flat, preds_flat)
-    f1 = f1_score(y_true_flat, preds_flat)
+def evaluate_model(dataset, model, title="Validation"):
+    cm = confusion_counts(model, dataset)
+    acc, precision, recall, f1 = scores(cm)
 
     print(f"📊 Evaluation on {title} Set:")
     print(f"✅ Accuracy:  {acc:.4f}")
@@ -470,7 +254,6 @@ def evaluate_model(X, y_true, model, title="Validation"):
     print(f"✅ F1 Score:  {f1:.4f}")
 
     # Confusion Matrix
-    cm = confusion_matrix(y_true_flat, preds_flat)
     disp = ConfusionMatrixDisplay(confusion_matrix=cm, display_labels=["Background (0)", "Cotton (1)"])
     disp.plot(cmap='Blues', values_format='d')
     plt.title(f"{title} Confusion Matrix")
@@ -479,10 +262,10 @@ def evaluate_model(X, y_true, model, title="Validation"):
     return acc, precision, recall, f1
 
 # Evaluate on Training Set
-train_acc, train_precision, train_recall, train_f1 = evaluate_model(X_train, y_train, model, title="Training")
+train_acc, train_precision, train_recall, train_f1 = evaluate_model(train_ds, model, title="Training")
 
 # Evaluate on Validation Set
-val_acc, val_precision, val_recall, val_f1 = evaluate_model(X_val, y_val, model, title="Validation")
+val_acc, val_precision, val_recall, val_f1 = evaluate_model(val_ds, model, title="Validation")
 
 # Comparison Plot
 metrics_names = ['Accuracy', 'Precision', 'Recall', 'F1-Score']
@@ -505,8 +288,9 @@ plt.grid(axis='y', linestyle='--', alpha=0.7)
 plt.show()
 
 # --- SAVE MODEL AS .h5 ---
-model.save("unet_model.h5")
-print("✅ Model saved as unet_model.h5")
+# "_u8": takes 0-255 pixels. unet_model.h5/.tflite from before the Rescaling layer take 0-1.
+model.save("unet_model_u8.h5")
+print("✅ Model saved as unet_model_u8.h5")
 
 import cv2
 import numpy as np
@@ -517,7 +301,7 @@ IMG_HEIGHT = 128
 IMG_WIDTH = 128
 
 # --- Load the trained model (.h5) ---
-model = load_model("/content/unet_model.h5")
+model = load_model("/content/unet_model_u8.h5")
 
 # --- Start webcam ---
 cap = cv2.VideoCapture(0)  # Use 0 for default webcam
@@ -532,9 +316,9 @@ while True:
         print("❌ Failed to grab frame.")
         break
 
-    # Resize and preprocess input
+    # Resize and preprocess input (the model scales 0-255 pixels itself)
     resized = cv2.resize(frame, (IMG_WIDTH, IMG_HEIGHT))
-    input_img = resized.astype(np.float32) / 255.0
+    input_img = resized.astype(np.float32)
     input_img = np.expand_dims(input_img, axis=0)  # Add batch dimension
 
     # Predict mask
@@ -566,20 +350,20 @@ cv2.destroyAllWindows()
 import tensorflow as tf
 
 # Load your trained .h5 model
-model = tf.keras.models.load_model('unet_model.h5')
+model = tf.keras.models.load_model('unet_model_u8.h5')
 
 # Convert to .tflite
 converter = tf.lite.TFLiteConverter.from_keras_model(model)
 tflite_model = converter.convert()
 
 # Save .tflite model
-with open('unet_model.tflite', 'wb') as f:
+with open('unet_model_u8.tflite', 'wb') as f:
     f.write(tflite_model)
 
-print("✅ Model converted and saved as unet_model.tflite")
+print("✅ Model converted and saved as unet_model_u8.tflite (input: 0-255 float32 pixels)")
 
 from google.colab import files
-files.download('/content/unet_model.tflite')
+files.download('/content/unet_model_u8.tflite')
 
 # Zip your folder
 !zip -r unet_segmentation_project.zip unet_segmentation_project
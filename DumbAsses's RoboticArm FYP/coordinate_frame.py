@@ -0,0 +1,135 @@
+"""
+Compact binary cotton_coordinates frames for the arm WebSocket channel.
+
+Opt-in, so older arm firmware keeps getting JSON: an arm that sends
+"ARM_READY:BIN" after connecting receives version 1 frames instead of the
+JSON text message, and one that also lists BIN2 ("ARM_READY:BIN,BIN2")
+receives version 2 frames while a calibration is loaded. Each broadcast is
+encoded once per version and shared by every binary client (see
+ws_broadcast.Broadcaster variants).
+
+Version 1 carries detector pixels only. Layout, little-endian:
+  header   <BBHIBBB  magic 0xC0, version 1, seq, timestamp ms,
+                     target count, changed count, removed count (11 bytes)
+  targets  <HHHH     id, x, y, area per target (x, y and area saturate at
+                     0..65535)
+  changed  <H        ids of new or moved targets
+  removed  <H        ids of targets that disappeared
+
+Version 2 adds the calibrated position (see arm_calibration.py) to every
+target:
+  header   <BBHIBBBB as version 1 (version 2), then the servo count (12 bytes)
+  targets  <HHHHhh   id, x, y, area, arm x, arm y in tenths of the
+                     calibration's arm units (saturating at +-3276.7),
+           then      one uint8 angle in degrees per servo
+  changed, removed   as version 1
+
+seq wraps at 16 bits and the timestamp (milliseconds on the sender's
+monotonic clock) at 32 bits. Targets keep the JSON order, oldest id first.
+See coordinate_frame_benchmark.py for size and speed against JSON.
+"""
+
+import struct
+
+ARM_READY_PREFIX = "ARM_READY:"
+FRAME_MAGIC = 0xC0
+FRAME_VERSION = 1      # Pixels only
+ARM_FRAME_VERSION = 2  # Pixels plus calibrated arm position and servo angles
+HEADER = struct.Struct('<BBHIBBB')
+ARM_HEADER = struct.Struct('<BBHIBBBB')
+MAX_COUNT = 255  # Counts are one byte each
+
+
+def arm_capabilities(message):
+    """Capabilities announced in an "ARM_READY:..." message, or None for other messages"""
+    if not isinstance(message, str) or not message.startswith(ARM_READY_PREFIX):
+        return None
+    return set(message[len(ARM_READY_PREFIX):].split(","))
+
+
+def saturate(value, low=0, high=0xFFFF):
+    """Clamp to the range of a target field (uint16 by default)"""
+    return min(max(int(value), low), high)
+
+
+def arm_tenths(value):
+    """An arm coordinate as a saturating int16 in tenths"""
+    return saturate(round(10 * value), -0x8000, 0x7FFF)
+
+
+def encode_coordinates(coordinates, changed=(), removed=(), seq=0, timestamp_ms=0,
+                       version=FRAME_VERSION):
+    """
+    Binary frame for a list of {"id", "x", "y", "area"} targets. Version 2
+    needs "arm_x"/"arm_y" on every target (ArmCalibration.annotate), and
+    sends the first target's number of "servos" for all of them.
+    """
+    coordinates = coordinates[:MAX_COUNT]
+    changed = list(changed)[:MAX_COUNT]
+    removed = list(removed)[:MAX_COUNT]
+    servo_count = len(coordinates[0].get("servos", ())) if coordinates else 0
+    values = []
+    for c in coordinates:
+        values += (c.get("id", 0) & 0xFFFF, saturate(c["x"]), saturate(c["y"]), saturate(c["area"]))
+        if version == ARM_FRAME_VERSION:
+            values += (arm_tenths(c["arm_x"]), arm_tenths(c["arm_y"]))
+            values += [saturate(a, 0, 0xFF) for a in c.get("servos", ())[:servo_count]]
+    values += [i & 0xFFFF for i in changed]
+    values += [i & 0xFFFF for i in removed]
+    counts = (FRAME_MAGIC, version, seq & 0xFFFF, int(timestamp_ms) & 0xFFFFFFFF,
+              len(coordinates), len(changed), len(removed))
+    if version == ARM_FRAME_VERSION:
+        header = ARM_HEADER.pack(*counts, servo_count)
+        target_format = "HHHHhh" + "B" * servo_count
+    elif version == FRAME_VERSION:
+        header = HEADER.pack(*counts)
+        target_format = "HHHH"
+    else:
+        raise ValueError(f"unknown coordinate frame version {version}")
+    layout = "<" + target_format * len(coordinates) + "H" * (len(changed) + len(removed))
+    return header + struct.pack(layout, *values)
+
+
+def decode_coordinates(data):
+    """
+    Parse a binary frame (either version) into the JSON message's shape,
+    with "seq" and "timestamp_ms" in place of the ISO timestamp. Raises
+    ValueError on a malformed frame.
+    """
+    if len(data) < HEADER.size:
+        raise ValueError("coordinate frame too short")
+    magic, version = data[0], data[1]
+    if magic != FRAME_MAGIC or version not in (FRAME_VERSION, ARM_FRAME_VERSION):
+        raise ValueError(f"not a coordinate frame (magic {magic:#x}, version {version})")
+    if version == ARM_FRAME_VERSION:
+        if len(data) < ARM_HEADER.size:
+            raise ValueError("coordinate frame too short")
+        _, _, seq, timestamp_ms, count, n_changed, n_removed, servo_count = ARM_HEADER.unpack_from(data)
+        header_size, target_format = ARM_HEADER.size, "HHHHhh" + "B" * servo_count
+    else:
+        _, _, seq, timestamp_ms, count, n_changed, n_removed = HEADER.unpack_from(data)
+        header_size, target_format = HEADER.size, "HHHH"
+    layout = "<" + target_format * count + "H" * (n_changed + n_removed)
+    if len(data) != header_size + struct.calcsize(layout):
+        raise ValueError("coordinate frame length does not match its counts")
+    values = struct.unpack_from(layout, data, header_size)
+    fields = len(target_format)
+    coordinates = []
+    for i in range(0, fields * count, fields):
+        target = {"id": values[i], "x": values[i + 1], "y": values[i + 2], "area": values[i + 3]}
+        if version == ARM_FRAME_VERSION:
+            target["arm_x"] = values[i + 4] / 10
+            target["arm_y"] = values[i + 5] / 10
+            if servo_count:
+                target["servos"] = list(values[i + 6:i + fields])
+        coordinates.append(target)
+    targets = fields * count
+    return {
+        "type": "cotton_coordinates",
+        "seq": seq,
+        "timestamp_ms": timestamp_ms,
+        "coordinates": coordinates,
+        "count": count,
+        "changed": list(values[targets:targets + n_changed]),
+        "removed": list(values[targets + n_changed:]),
+    }
@@ -0,0 +1,85 @@
+"""
+Microbenchmark: binary coordinate frames vs. the JSON cotton_coordinates message.
+
+For 1, 3 and 10 targets, reports the bytes on the wire (WebSocket framing
+included) and the time to serialize and parse one message on this machine.
+The parse cost on the ESP32 is dominated the same way: ArduinoJson has to
+tokenize every character, while the binary frame is read at fixed offsets.
+
+Usage:
+    python coordinate_frame_benchmark.py [--repeat N]
+"""
+
+import json
+import random
+import sys
+import time
+from datetime import datetime
+
+from coordinate_frame import decode_coordinates, encode_coordinates
+
+
+def websocket_bytes(payload_length):
+    """Server-to-client frame size: 2 byte header, +2 from 126 bytes, +8 from 64 KiB (no mask)"""
+    if payload_length < 126:
+        return payload_length + 2
+    return payload_length + (4 if payload_length < 65536 else 10)
+
+
+def sample_targets(count, rng):
+    return [{"id": i + 1, "x": rng.randint(0, 319), "y": rng.randint(0, 239), "area": rng.randint(100, 5000)}
+            for i in range(count)]
+
+
+def json_encode(coordinates):
+    """As CottonDetector.broadcast_coordinates builds it"""
+    return json.dumps({
+        "type": "cotton_coordinates",
+        "timestamp": datetime.now().isoformat(),
+        "coordinates": coordinates,
+        "count": len(coordinates),
+        "changed": [c["id"] for c in coordinates],
+        "removed": []
+    })
+
+
+def binary_encode(coordinates):
+    return encode_coordinates(coordinates, [c["id"] for c in coordinates], (), 1, 123456)
+
+
+def time_per_call(function, argument, repeat):
+    function(argument)  # Warm-up
+    started = time.perf_counter()
+    for _ in range(repeat):
+        function(argument)
+    return 1e6 * (time.perf_counter() - started) / repeat
+
+
+def main():
+    args = sys.argv[1:]
+    repeat = int(args[args.index("--repeat") + 1]) if "--repeat" in args else 20000
+    rng = random.Random(0)
+
+    print("⏱️  Coordinate message benchmark (JSON text vs. binary frame)")
+    print(f"  {'targets':>7s} {'format':7s} {'bytes':>6s} {'on wire':>8s} {'encode µs':>10s} {'parse µs':>9s}")
+    ok = True
+    for count in (1, 3, 10):
+        coordinates = sample_targets(count, rng)
+        text, frame = json_encode(coordinates), binary_encode(coordinates)
+        decoded = decode_coordinates(frame)
+        ok &= decoded["coordinates"] == coordinates and decoded["changed"] == [c["id"] for c in coordinates]
+
+        rows = [
+            ("JSON", len(text.encode("utf-8")), json_encode, json.loads, text),
+            ("binary", len(frame), binary_encode, decode_coordinates, frame),
+        ]
+        for label, size, encode, parse, payload in rows:
+            encode_us = time_per_call(encode, coordinates, repeat)
+            parse_us = time_per_call(parse, payload, repeat)
+            print(f"  {count:7d} {label:7s} {size:6d} {websocket_bytes(size):8d} {encode_us:10.2f} {parse_us:9.2f}")
+    print(f"\nRound trip {'exact ✅' if ok else 'MISMATCH ❌'}")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Allocation-free white (cotton) segmentation for cottonv2.py
+
+CottonSegmenter produces the same mask as the original
+resize -> BGR2HSV -> inRange -> open -> dilate pipeline, but:
+  - every intermediate image is preallocated and written with dst=
+  - the structuring elements are built once
+  - open(5x5) followed by dilate(5x5) is fused into erode(5x5) + dilate(9x9),
+    since two 5x5 rectangular dilations equal one 9x9 dilation
+  - frames that are already the working size skip the resize entirely
+  - with use_lut (the default), the HSV conversion is skipped. The white
+    range ignores hue, so a pixel passes when V = max(B,G,R) >= lower V and
+    S <= upper S. For each V that is simply min(B,G,R) >= some threshold.
+    That per-V threshold is read off OpenCV's own HSV conversion at
+    startup, so the mask is bit-identical.
+
+Buffers are reused between calls: a returned mask is only valid until the
+next segment() call, and one segmenter must not be shared between threads.
+See cotton_segmentation_benchmark.py for timings.
+"""
+
+import cv2
+import numpy as np
+
+SEGMENT_SIZE = (320, 240)  # (width, height) the detector works at
+LOWER_WHITE = (0, 0, 200)  # HSV
+UPPER_WHITE = (180, 40, 255)
+KERNEL_SIZE = 5
+
+
+def build_min_lut(lower, upper):
+    """
+    Per-V threshold on min(B,G,R) equivalent to inRange on HSV, for ranges
+    that accept every hue. An entry above V means "never passes", since
+    min(B,G,R) <= V.
+    """
+    v, low = np.meshgrid(np.arange(256), np.arange(256), indexing='ij')
+    # B = V, G = R = min: the hue-independent part of the HSV conversion
+    pixels = np.stack([v, low, low], axis=-1).astype(np.uint8)
+    passes = cv2.inRange(cv2.cvtColor(pixels, cv2.COLOR_BGR2HSV),
+                         np.array(lower, np.uint8), np.array(upper, np.uint8)) > 0
+    passes &= low <= v
+    lut = np.full(256, 255, dtype=np.uint8)
+    for value in range(256):
+        passing = np.flatnonzero(passes[value])
+        if len(passing):
+            # Raising min lowers saturation, so the passing mins form one run up to V
+            assert passing[-1] - passing[0] + 1 == len(passing)
+            lut[value] = passing[0]
+    return lut
+
+
+class CottonSegmenter:
+    def __init__(self, size=SEGMENT_SIZE, lower=LOWER_WHITE, upper=UPPER_WHITE,
+                 kernel_size=KERNEL_SIZE, use_lut=True):
+        width, height = size
+        self.size = size
+        self.lower = np.array(lower, np.uint8)
+        self.upper = np.array(upper, np.uint8)
+
+        # Cached structuring elements: erode(k) then dilate(2k-1) == open(k) then dilate(k)
+        self.erode_kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (kernel_size, kernel_size))
+        self.dilate_kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (2 * kernel_size - 1,) * 2)
+
+        # Preallocated working images
+        self.small = np.empty((height, width, 3), np.uint8)
+        self.hsv = np.empty((height, width, 3), np.uint8)
+        self.planes = [np.empty((height, width), np.uint8) for _ in range(3)]
+        self.vmax = np.empty((height, width), np.uint8)
+        self.vmin = np.empty((height, width), np.uint8)
+        self.threshold = np.empty((height, width), np.uint8)
+        self.raw_mask = np.empty((height, width), np.uint8)
+        self.eroded = np.empty((height, width), np.uint8)
+        self.mask = np.empty((height, width), np.uint8)
+
+        # The LUT path only applies when the range accepts every hue
+        hue_free = lower[0] == 0 and upper[0] >= 180 and lower[1] == 0 and upper[2] == 255
+        self.min_lut = build_min_lut(lower, upper) if use_lut and hue_free else None
+
+    @property
+    def uses_lut(self):
+        return self.min_lut is not None
+
+    def resize(self, frame):
+        """Frame at the working size: the frame itself if it already is, else an internal buffer"""
+        if (frame.shape[1], frame.shape[0]) == self.size:
+            return frame
+        cv2.resize(frame, self.size, dst=self.small)
+        return self.small
+
+    def threshold_mask(self, small):
+        """White-pixel mask of a working-size BGR image (internal buffer)"""
+        if self.min_lut is None:
+            cv2.cvtColor(small, cv2.COLOR_BGR2HSV, dst=self.hsv)
+            cv2.inRange(self.hsv, self.lower, self.upper, dst=self.raw_mask)
+            return self.raw_mask
+
+        b, g, r = self.planes
+        cv2.split(small, self.planes)
+        cv2.max(b, g, dst=self.vmax)
+        cv2.max(self.vmax, r, dst=self.vmax)
+        cv2.min(b, g, dst=self.vmin)
+        cv2.min(self.vmin, r, dst=self.vmin)
+        cv2.LUT(self.vmax, self.min_lut, dst=self.threshold)
+        cv2.compare(self.vmin, self.threshold, cv2.CMP_GE, dst=self.raw_mask)
+        return self.raw_mask
+
+    def segment(self, frame):
+        """
+        Returns (small, mask): the working-size frame and its cleaned-up
+        mask. Both may be internal buffers, overwritten by the next call.
+        """
+        small = self.resize(frame)
+        raw = self.threshold_mask(small)
+        cv2.erode(raw, self.erode_kernel, dst=self.eroded)
+        cv2.dilate(self.eroded, self.dilate_kernel, dst=self.mask)
+        return small, self.mask
@@ -0,0 +1,110 @@
+"""
+Microbenchmark: CottonSegmenter vs. the original detect_cotton segmentation.
+
+Runs both on the same frames, checks that the masks are bit-identical and
+reports the time per frame. Use frames recorded with
+    python cottonv2.py --record frames/
+or, without a directory, synthetic QVGA and VGA frames with white blobs.
+
+Usage:
+    python cotton_segmentation_benchmark.py [FRAMES_DIR] [--repeat N]
+"""
+
+import glob
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+from cotton_segmentation import CottonSegmenter
+
+
+def legacy_segment(frame):
+    """The segmentation steps of the original CottonDetector.detect_cotton"""
+    frame = cv2.resize(frame, (320, 240))
+    hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
+    lower_white = np.array([0, 0, 200])
+    upper_white = np.array([180, 40, 255])
+    mask = cv2.inRange(hsv, lower_white, upper_white)
+    kernel = np.ones((5,5), np.uint8)
+    mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, kernel)
+    mask = cv2.morphologyEx(mask, cv2.MORPH_DILATE, kernel)
+    return frame, mask
+
+
+def synthetic_frames(count, size, rng):
+    """Textured background with bright, slightly tinted blobs, JPEG round-tripped"""
+    width, height = size
+    frames = []
+    for _ in range(count):
+        frame = rng.integers(40, 170, (height, width, 3), dtype=np.uint8)
+        for _ in range(rng.integers(3, 12)):
+            center = (int(rng.integers(0, width)), int(rng.integers(0, height)))
+            color = tuple(int(c) for c in rng.integers(190, 256, 3))
+            cv2.circle(frame, center, int(rng.integers(4, width // 12)), color, -1)
+        frame = cv2.GaussianBlur(frame, (5, 5), 0)
+        ok, jpeg = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, 12])
+        frames.append(cv2.imdecode(jpeg, cv2.IMREAD_COLOR))
+    return frames
+
+
+def time_per_frame(segment, frames, repeat):
+    segment(frames[0])  # Warm-up
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for frame in frames:
+            segment(frame)
+    return 1e6 * (time.perf_counter() - started) / (repeat * len(frames))
+
+
+def run(name, frames, repeat):
+    engines = {
+        "engine (HSV)": CottonSegmenter(use_lut=False),
+        "engine (LUT)": CottonSegmenter(use_lut=True),
+    }
+    identical = True
+    for frame in frames:
+        _, expected = legacy_segment(frame)
+        for engine in engines.values():
+            identical &= bool(np.array_equal(engine.segment(frame)[1], expected))
+
+    h, w = frames[0].shape[:2]
+    print(f"\n{name}: {len(frames)} frames at {w}x{h}, masks {'identical ✅' if identical else 'DIFFER ❌'}")
+    baseline = time_per_frame(legacy_segment, frames, repeat)
+    print(f"  {'original':14s} {baseline:8.1f} µs/frame")
+    for label, engine in engines.items():
+        us = time_per_frame(engine.segment, frames, repeat)
+        print(f"  {label:14s} {us:8.1f} µs/frame  ({baseline / us:.1f}x)")
+    return identical
+
+
+def main():
+    args = sys.argv[1:]
+    repeat = 20
+    if "--repeat" in args:
+        i = args.index("--repeat")
+        repeat = int(args[i + 1])
+        del args[i:i + 2]
+
+    print(f"⏱️  Cotton segmentation benchmark (OpenCV {cv2.__version__}, {cv2.getNumThreads()} thread(s))")
+    ok = True
+    if args:
+        paths = sorted(glob.glob(os.path.join(args[0], "*.jpg")))
+        frames = [f for f in (cv2.imread(p) for p in paths) if f is not None]
+        if not frames:
+            print(f"❌ No JPEG frames in {args[0]}")
+            sys.exit(2)
+        # Recordings can mix sizes; benchmark each size separately
+        for shape in sorted({f.shape for f in frames}):
+            ok &= run(f"Recorded ({args[0]})", [f for f in frames if f.shape == shape], repeat)
+    else:
+        rng = np.random.default_rng(0)
+        ok &= run("Synthetic QVGA (ESP32-CAM default)", synthetic_frames(40, (320, 240), rng), repeat)
+        ok &= run("Synthetic VGA", synthetic_frames(40, (640, 480), rng), repeat)
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
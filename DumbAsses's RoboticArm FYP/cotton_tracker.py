@@ -0,0 +1,153 @@
+"""
+Temporal tracking of cotton blobs for cottonv2.py
+
+Each blob becomes a Track with a stable id and a constant-velocity Kalman
+filter (x and y are filtered independently with the same covariance), so
+positions are smoothed and can be predicted on frames where detection is
+skipped. Detections are matched to predicted tracks greedily by distance
+within MAX_MATCH_DISTANCE.
+
+A track is reported once it has been seen MIN_HITS times, and dropped after
+MAX_MISSES detection frames without a match. changes() tells the caller
+which reported targets are new or have moved since they were last sent, and
+which have disappeared, so the arm only needs a message when something
+changed.
+
+All times are time.monotonic() seconds; positions are in detector pixels
+(320x240). A track predicted past the frame edge is reported at the edge.
+"""
+
+import math
+
+import numpy as np
+
+MAX_MATCH_DISTANCE = 40.0  # px between a predicted track and a detection
+MIN_HITS = 2               # Detections before a track is reported
+MAX_MISSES = 3             # Detection frames without a match before a track is dropped
+CHANGE_PIXELS = 3.0        # Movement that makes a target worth resending
+CHANGE_AREA = 0.25         # Relative area change that makes a target worth resending
+AREA_SMOOTHING = 0.3       # EWMA weight of a new area measurement
+
+PROCESS_NOISE = 200.0      # px/s^2, how quickly a blob may change velocity (arm/camera motion)
+MEASUREMENT_NOISE = 2.0    # px, centroid jitter between frames
+INITIAL_SPEED = 100.0      # px/s, uncertainty of a new track's velocity
+
+FRAME_WIDTH, FRAME_HEIGHT = 320, 240  # Detector frame; reported positions stay inside it
+
+
+class Track:
+    def __init__(self, track_id, x, y, area, now):
+        self.id = track_id
+        # Rows: position, velocity; columns: x, y
+        self.state = np.array([[x, y], [0.0, 0.0]])
+        self.covariance = np.diag([MEASUREMENT_NOISE ** 2, INITIAL_SPEED ** 2])
+        self.area = float(area)
+        self.time = now
+        self.hits = 1
+        self.misses = 0
+        self.sent = None  # (x, y, area) last sent to the arm
+
+    def predict(self, now):
+        dt = now - self.time
+        if dt <= 0:
+            return
+        transition = np.array([[1.0, dt], [0.0, 1.0]])
+        q = PROCESS_NOISE ** 2
+        noise = q * np.array([[dt ** 4 / 4, dt ** 3 / 2], [dt ** 3 / 2, dt ** 2]])
+        self.state = transition @ self.state
+        self.covariance = transition @ self.covariance @ transition.T + noise
+        self.time = now
+
+    def correct(self, x, y, area):
+        gain = self.covariance[:, 0] / (self.covariance[0, 0] + MEASUREMENT_NOISE ** 2)
+        self.state += np.outer(gain, np.array([x, y]) - self.state[0])
+        self.covariance -= np.outer(gain, self.covariance[0])
+        self.area += AREA_SMOOTHING * (area - self.area)
+        self.hits += 1
+        self.misses = 0
+
+    @property
+    def position(self):
+        return self.state[0, 0], self.state[0, 1]
+
+    def as_target(self):
+        x, y = self.position
+        x = min(max(int(round(x)), 0), FRAME_WIDTH - 1)
+        y = min(max(int(round(y)), 0), FRAME_HEIGHT - 1)
+        return {"id": self.id, "x": x, "y": y, "area": int(self.area)}
+
+    def moved_since_sent(self):
+        if self.sent is None:
+            return True
+        x, y = self.position
+        sent_x, sent_y, sent_area = self.sent
+        return (math.hypot(x - sent_x, y - sent_y) >= CHANGE_PIXELS
+                or abs(self.area - sent_area) > CHANGE_AREA * max(sent_area, 1.0))
+
+
+class CottonTracker:
+    def __init__(self):
+        self.tracks = []
+        self.next_id = 1
+        self.removed = []  # Reported tracks dropped since the last changes()
+
+    def predict(self, now):
+        """Advance every track to now (frames without detection)"""
+        for track in self.tracks:
+            track.predict(now)
+
+    def update(self, detections, now):
+        """Feed one frame's detections ({"x", "y", "area"} dicts)"""
+        self.predict(now)
+
+        # Greedy nearest-first matching within the gate
+        pairs = []
+        for ti, track in enumerate(self.tracks):
+            tx, ty = track.position
+            for di, d in enumerate(detections):
+                distance = math.hypot(d["x"] - tx, d["y"] - ty)
+                if distance <= MAX_MATCH_DISTANCE:
+                    pairs.append((distance, ti, di))
+        pairs.sort()
+        matched_tracks, matched_detections = set(), set()
+        for _, ti, di in pairs:
+            if ti in matched_tracks or di in matched_detections:
+                continue
+            matched_tracks.add(ti)
+            matched_detections.add(di)
+            d = detections[di]
+            self.tracks[ti].correct(d["x"], d["y"], d["area"])
+
+        kept = []
+        for ti, track in enumerate(self.tracks):
+            if ti not in matched_tracks:
+                track.misses += 1
+                if track.misses > MAX_MISSES:
+                    if track.sent is not None:
+                        self.removed.append(track.id)
+                    continue
+            kept.append(track)
+        self.tracks = kept
+
+        for di, d in enumerate(detections):
+            if di not in matched_detections:
+                self.tracks.append(Track(self.next_id, d["x"], d["y"], d["area"], now))
+                self.next_id += 1
+
+    def targets(self):
+        """Reported (confirmed) targets, oldest track first so the first target stays put"""
+        return [track.as_target() for track in self.tracks if track.hits >= MIN_HITS]
+
+    def changes(self):
+        """
+        (changed ids, removed ids) since the previous call. Changed targets
+        are new or moved; both are marked as sent.
+        """
+        changed = []
+        for track in self.tracks:
+            if track.hits >= MIN_HITS and track.moved_since_sent():
+                x, y = track.position
+                track.sent = (x, y, track.area)
+                changed.append(track.id)
+        removed, self.removed = self.removed, []
+        return changed, removed
@@ -1,24 +1,72 @@
+import argparse
 import cv2
 import numpy as np
 import asyncio
 import websockets
 import json
+import os
+import sys
 import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import io
 from PIL import Image
 
+# ws_broadcast.py is shared with the motor servers and lives in ../ESP32
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "ESP32"))
+from ws_broadcast import Broadcaster
+from cotton_segmentation import CottonSegmenter
+from cotton_tracker import CottonTracker
+from coordinate_frame import ARM_FRAME_VERSION, arm_capabilities, encode_coordinates
+from arm_calibration import ArmCalibration, CALIBRATION_FILE
+
 # WebSocket server configuration
 WEBSOCKET_HOST = "0.0.0.0"  # Listen on all interfaces
 WEBSOCKET_PORT_COMMANDS = 8765  # Port for ESP32 robotic arm commands
 WEBSOCKET_PORT_CAMERA = 8766    # Port for ESP32-CAM stream
 
+# Detection runs on a worker thread (OpenCV releases the GIL); one frame in flight at a time.
+# Keep this at 1: the segmenter reuses its buffers between frames.
+DETECTION_WORKERS = 1
+
+# Settings marked with a --flag are the defaults of the command-line options (parse_args)
+
+# --record DIR saves every processed camera JPEG (for cotton_segmentation_benchmark.py)
+RECORD_DIR = None
+
+# Run detection on every Nth processed frame; the tracker predicts blob positions in between
+# (--detect-every N, 1 detects every frame)
+DETECT_EVERY_N = 3
+
+# The arm only gets a message when a target appears, moves or disappears, plus this refresh
+# while targets are visible (wroom32.ino drops coordinates older than 500 ms)
+TARGET_REFRESH_SECONDS = 0.3
+
+# With a calibration file (--calibration FILE, default arm_calibration.json) targets also carry
+# arm coordinates and servo angles from a precomputed table; editing the file reloads it.
+# JSON arms and binary arms that announce BIN2 receive them; BIN-only arms get pixels (warned)
+CALIBRATION_PATH = CALIBRATION_FILE
+
+# Display: redrawn only when a new frame arrives, at most DISPLAY_FPS times a second.
+# --headless runs without a window (and skips drawing annotations) for rigs with no display.
+HEADLESS = False
+DISPLAY_FPS = 15
+GUI_POLL_SECONDS = 0.1  # How often an idle window still handles GUI events and the 'q' key
+CAMERA_TIMEOUT_SECONDS = 5
+WINDOW_NAME = 'Cotton Detection - WebSocket Stream'
+
 class CottonDetector:
     def __init__(self):
         self.current_frame = None
         self.frame_lock = threading.Lock()
-        self.connected_arm_clients = set()
+        # Notified on every new display frame; frame_generation counts them
+        self.frame_ready = threading.Condition(self.frame_lock)
+        self.frame_generation = 0
+        self.annotate = not HEADLESS
+        self.camera_timed_out = False
+        # Latest-value outbox per arm: only the newest coordinates are worth sending
+        self.connected_arm_clients = Broadcaster(latest_only=True, on_evict=self.on_arm_evicted)
         self.connected_camera_clients = set()
         self.latest_coordinates = []
         self.websocket_loop = None
@@ -26,24 +74,34 @@ class CottonDetector:
         self.camera_server_running = False
         self.last_frame_time = 0
         
+        # Latest-frame-wins detection: one frame in flight, at most one newer frame waiting
+        self.detect_executor = ThreadPoolExecutor(max_workers=DETECTION_WORKERS,
+                                                  thread_name_prefix="cotton-detect")
+        self.detect_task = None
+        self.pending_frame = None
+        self.frames_received = 0
+        self.frames_skipped = 0
+        self.detect_ms = 0.0  # Smoothed decode + detection time
+        self.segmenter = CottonSegmenter()
+        self.frames_recorded = 0
+        self.frames_processed = 0
+        self.tracker = CottonTracker()
+        self.calibration = ArmCalibration(CALIBRATION_PATH)
+        self.last_target_broadcast = 0.0
+        self.coordinate_seq = 0
+        self.started = time.monotonic()
+        if RECORD_DIR:
+            os.makedirs(RECORD_DIR, exist_ok=True)
+        
     def detect_cotton(self, frame):
         """Detect cotton in the frame and return coordinates"""
         try:
-            # Resize for performance
-            frame = cv2.resize(frame, (320, 240))
-            
-            # Convert to HSV for robust white detection
-            hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
-            
-            # Define range for white color in HSV
-            lower_white = np.array([0, 0, 200])
-            upper_white = np.array([180, 40, 255])
-            mask = cv2.inRange(hsv, lower_white, upper_white)
-            
-            # Morphological operations to remove noise
-            kernel = np.ones((5,5), np.uint8)
-            mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, kernel)
-            mask = cv2.morphologyEx(mask, cv2.MORPH_DILATE, kernel)
+            # Resize, white threshold (HSV 0-180, 0-40, 200-255) and open + dilate,
+            # all into preallocated buffers (see cotton_segmentation.py)
+            small, mask = self.segmenter.segment(frame)
+            # The result is drawn on and displayed, so it must not be the segmenter's buffer;
+            # a frame already at 320x240 is drawn on in place. Headless, nothing is drawn.
+            frame = small if small is frame or not self.annotate else small.copy()
             
             # Find contours (cotton blobs)
             contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
@@ -57,6 +115,8 @@ class CottonDetector:
                     cx = x + w // 2
                     cy = y + h // 2
                     cotton_coords.append({"x": cx, "y": cy, "area": int(area)})
+                    if not self.annotate:
+                        continue
                     
                     # Draw bounding box
                     cv2.rectangle(frame, (x, y), (x + w, y + h), (0, 255, 0), 2)
@@ -75,19 +135,34 @@ class CottonDetector:
     async def handle_arm_client(self, websocket):
         """Handle WebSocket connections from robotic arm ESP32"""
         print(f"✓ Robotic arm connected: {websocket.remote_address}")
-        self.connected_arm_clients.add(websocket)
+        channel = self.connected_arm_clients.add(websocket)
         
         try:
             async for message in websocket:
                 print(f"📥 Received from arm ESP32: {message}")
+                capabilities = arm_capabilities(message)
+                if capabilities is not None:
+                    # Firmware that understands binary frames gets those instead of JSON;
+                    # BIN2 also takes the calibrated arm position (version 2 frames)
+                    if "BIN2" in capabilities:
+                        channel.format = "bin2"
+                    else:
+                        channel.format = "bin" if "BIN" in capabilities else None
+                    self.check_arm_format(channel)
         except websockets.exceptions.ConnectionClosed:
             pass
         except Exception as e:
             print(f"✗ Arm client handling error: {e}")
         finally:
-            self.connected_arm_clients.discard(websocket)
+            self.connected_arm_clients.remove(websocket)
             print(f"✗ Robotic arm disconnected: {websocket.remote_address}")
     
+    def check_arm_format(self, channel):
+        """Warn when a calibrated deployment has an arm that only reads pixel (version 1) frames"""
+        if self.calibration.loaded and channel.format == "bin":
+            print(f"⚠️ Robotic arm {channel.websocket.remote_address} only reads version 1 binary frames: "
+                  f"it gets pixels, not the calibrated arm position (update its firmware to announce BIN2)")
+    
     async def handle_camera_client(self, websocket):
         """Handle WebSocket connections from camera ESP32"""
         print(f"✓ ESP32-CAM connected: {websocket.remote_address}")
@@ -116,92 +191,183 @@ class CottonDetector:
             print(f"✗ ESP32-CAM disconnected: {websocket.remote_address}")
     
     async def process_camera_frame(self, frame_data):
-        """Process received camera frame from ESP32-CAM"""
-        try:
-            # Convert bytes to numpy array
-            nparr = np.frombuffer(frame_data, np.uint8)
-            
-            # Decode JPEG
-            frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-            
-            if frame is not None:
-                # Update current frame thread-safely
-                with self.frame_lock:
-                    self.current_frame = frame.copy()
-                    self.last_frame_time = time.time()
-                
-                # Process for cotton detection
-                cotton_coords, processed_frame, mask = self.detect_cotton(frame)
-                
-                # Update latest coordinates
-                self.latest_coordinates = cotton_coords
-                
-                # Send coordinates to robotic arm
-                if cotton_coords:
-                    await self.broadcast_coordinates(cotton_coords)
-                    coord_str = ", ".join([f"({c['x']},{c['y']})" for c in cotton_coords])
-                    print(f"🎯 Cotton coordinates: [{coord_str}]")
-                
-                # Update display frame
-                with self.frame_lock:
-                    self.current_frame = processed_frame
+        """Hand a camera frame to the detection worker without blocking the loop"""
+        self.frames_received += 1
+        # Every received frame counts for the camera timeout, displayed or not (--headless)
+        self.last_frame_time = time.time()
+        self.camera_timed_out = False
+        if self.detect_task is not None and not self.detect_task.done():
+            # Busy: keep only the newest frame; an older waiting one is skipped
+            if self.pending_frame is not None:
+                self.frames_skipped += 1
+            self.pending_frame = frame_data
+            return
+        self.detect_task = asyncio.ensure_future(self.detection_loop(frame_data))
+    
+    def decode_and_detect(self, frame_data, detect=True):
+        """
+        Worker thread: decode the JPEG and run cotton detection. Without
+        detect, only decode and resize for display; the coordinates are then
+        None. Headless, nothing displays the frame, so it is not decoded at all.
+        """
+        started = time.perf_counter()
+        if detect or self.annotate:
+            frame = cv2.imdecode(np.frombuffer(frame_data, np.uint8), cv2.IMREAD_COLOR)
+            if frame is None:
+                return None
+        if detect:
+            cotton_coords, processed_frame, mask = self.detect_cotton(frame)
+        elif self.annotate:
+            small = self.segmenter.resize(frame)
+            cotton_coords, processed_frame = None, small.copy() if small is not frame else small
+        else:
+            cotton_coords, processed_frame = None, None
+        seconds = time.perf_counter() - started
+        if RECORD_DIR:
+            path = os.path.join(RECORD_DIR, f"frame_{self.frames_recorded:06d}.jpg")
+            with open(path, "wb") as f:
+                f.write(frame_data)
+            self.frames_recorded += 1
+        return cotton_coords, processed_frame, seconds
+    
+    async def detection_loop(self, frame_data):
+        """Detect frames one at a time, always moving on to the newest waiting frame"""
+        loop = asyncio.get_running_loop()
+        while frame_data is not None:
+            try:
+                detect = self.frames_processed % DETECT_EVERY_N == 0
+                self.frames_processed += 1
+                result = await loop.run_in_executor(self.detect_executor, self.decode_and_detect,
+                                                    frame_data, detect)
+                if result is not None:
+                    cotton_coords, processed_frame, seconds = result
+                    if detect:
+                        self.detect_ms = 0.9 * self.detect_ms + 0.1 * 1000 * seconds if self.detect_ms else 1000 * seconds
+                    
+                    # Track blobs: correct with detections, or predict in between
+                    now = time.monotonic()
+                    if cotton_coords is not None:
+                        self.tracker.update(cotton_coords, now)
+                    else:
+                        self.tracker.predict(now)
+                    targets = self.tracker.targets()
+                    if self.calibration.reload_if_changed(now):
+                        for channel in list(self.connected_arm_clients.channels.values()):
+                            self.check_arm_format(channel)
+                    self.calibration.annotate(targets)
+                    self.latest_coordinates = targets
+                    
+                    # Send coordinates to robotic arm when they changed (or are due a refresh)
+                    changed, removed = self.tracker.changes()
+                    refresh = targets and now - self.last_target_broadcast >= TARGET_REFRESH_SECONDS
+                    if changed or removed or refresh:
+                        self.last_target_broadcast = now
+                        await self.broadcast_coordinates(targets, changed, removed)
+                    if changed or removed:
+                        coord_str = ", ".join([f"#{c['id']}({c['x']},{c['y']})" for c in targets])
+                        gone = f" (lost {', '.join(f'#{i}' for i in removed)})" if removed else ""
+                        print(f"🎯 Cotton coordinates: [{coord_str}]{gone}")
+                    
+                    # Hand the frame to the display thread; it is never modified after this
+                    if self.annotate:
+                        self.draw_targets(processed_frame, targets)
+                    self.publish_frame(processed_frame if self.annotate else None)
+            except Exception as e:
+                print(f"✗ Error processing camera frame: {e}")
             
-        except Exception as e:
-            print(f"✗ Error processing camera frame: {e}")
+            frame_data, self.pending_frame = self.pending_frame, None
     
-    async def broadcast_coordinates(self, coordinates):
-        """Send coordinates to all connected robotic arm clients"""
-        if self.connected_arm_clients and coordinates:
+    async def broadcast_coordinates(self, coordinates, changed=(), removed=()):
+        """
+        Send the tracked targets to all connected robotic arm clients.
+        coordinates are every current target (oldest id first, so the arm's
+        coordinates[0] stays on the same cotton); changed/removed list the ids
+        that are new or moved, and that disappeared. An empty list with
+        removed ids tells the arm its target is gone. With a calibration, the
+        targets also carry arm_x/arm_y and servos, in JSON and in version 2
+        binary frames; version 1 frames stay in pixels.
+        """
+        if self.connected_arm_clients and (coordinates or removed):
+            self.coordinate_seq = (self.coordinate_seq + 1) & 0xFFFF
+            timestamp_ms = 1000 * (time.monotonic() - self.started)
+            frame = encode_coordinates(coordinates, changed, removed, self.coordinate_seq, timestamp_ms)
+            variants = {"bin": frame, "bin2": frame}
+            if self.calibration.loaded:
+                variants["bin2"] = encode_coordinates(coordinates, changed, removed, self.coordinate_seq,
+                                                      timestamp_ms, ARM_FRAME_VERSION)
             message = {
                 "type": "cotton_coordinates",
                 "timestamp": datetime.now().isoformat(),
                 "coordinates": coordinates,
-                "count": len(coordinates)
+                "count": len(coordinates),
+                "changed": list(changed),
+                "removed": list(removed)
             }
             
-            # Send to all connected arm clients
-            disconnected_clients = set()
-            for client in self.connected_arm_clients:
-                try:
-                    await client.send(json.dumps(message))
-                except websockets.exceptions.ConnectionClosed:
-                    disconnected_clients.add(client)
-                except Exception as e:
-                    print(f"✗ Error sending to arm client: {e}")
-                    disconnected_clients.add(client)
-            
-            # Remove disconnected clients
-            self.connected_arm_clients -= disconnected_clients
+            # Serialize once per format and queue for every arm; each arm's writer task does the send
+            self.connected_arm_clients.broadcast(json.dumps(message), variants)
+    
+    def draw_targets(self, frame, targets):
+        """Label tracked targets (smoothed or predicted positions) with their ids"""
+        for target in targets:
+            center = (target["x"], target["y"])
+            radius = max(6, int((target["area"] / np.pi) ** 0.5))
+            cv2.circle(frame, center, radius, (255, 255, 0), 1)
+            cv2.putText(frame, f"#{target['id']}", (center[0] + radius, center[1]),
+                       cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 0), 1)
+    
+    def on_arm_evicted(self, websocket, reason):
+        print(f"⚠️ Dropping slow arm client {websocket.remote_address}: {reason}")
+    
+    def publish_frame(self, frame):
+        """Make frame the display frame (None shows the placeholder) and wake the display thread"""
+        with self.frame_ready:
+            self.current_frame = frame
+            self.frame_generation += 1
+            self.frame_ready.notify_all()
+    
+    def check_camera_timeout(self):
+        """Warn once and clear the display when the camera has gone quiet"""
+        if (self.last_frame_time > 0 and not self.camera_timed_out
+                and time.time() - self.last_frame_time > CAMERA_TIMEOUT_SECONDS):
+            print(f"⚠️ No camera frames received for {CAMERA_TIMEOUT_SECONDS} seconds")
+            self.publish_frame(None)
+            self.camera_timed_out = True
     
     def display_loop(self):
-        """Display camera feed in separate thread"""
+        """
+        Display camera feed in separate thread. Sleeps until a new frame is
+        published and shows only the newest one, at most DISPLAY_FPS times a
+        second; an idle window still wakes every GUI_POLL_SECONDS for GUI
+        events and the 'q' key.
+        """
         print("📺 Starting display loop...")
         
+        # Built once; shown whenever there is no camera frame
+        placeholder = np.zeros((240, 320, 3), dtype=np.uint8)
+        cv2.putText(placeholder, "Waiting for camera...", (50, 120), 
+                   cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
+        frame_interval = 1.0 / DISPLAY_FPS
+        shown_generation = -1
+        
         while True:
             try:
-                with self.frame_lock:
-                    if self.current_frame is not None:
-                        display_frame = self.current_frame.copy()
-                    else:
-                        display_frame = None
+                with self.frame_ready:
+                    self.frame_ready.wait_for(lambda: self.frame_generation != shown_generation,
+                                              timeout=GUI_POLL_SECONDS)
+                    generation, display_frame = self.frame_generation, self.current_frame
                 
-                if display_frame is not None:
-                    cv2.imshow('Cotton Detection - WebSocket Stream', display_frame)
-                else:
-                    # Show waiting message
-                    waiting_frame = np.zeros((240, 320, 3), dtype=np.uint8)
-                    cv2.putText(waiting_frame, "Waiting for camera...", (50, 120), 
-                               cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
-                    cv2.imshow('Cotton Detection - WebSocket Stream', waiting_frame)
+                wait_ms = 1
+                if generation != shown_generation:
+                    cv2.imshow(WINDOW_NAME, placeholder if display_frame is None else display_frame)
+                    shown_generation = generation
+                    # FPS cap: frames published meanwhile are coalesced into the newest
+                    wait_ms = max(1, int(1000 * frame_interval))
                 
-                # Check for frame timeout
-                if time.time() - self.last_frame_time > 5 and self.last_frame_time > 0:
-                    print("⚠️ No camera frames received for 5 seconds")
-                    with self.frame_lock:
-                        self.current_frame = None
+                self.check_camera_timeout()
                 
                 # Exit on 'q' key
-                if cv2.waitKey(30) & 0xFF == ord('q'):
+                if cv2.waitKey(wait_ms) & 0xFF == ord('q'):
                     print("🛑 Stopping system...")
                     break
                     
@@ -273,23 +439,55 @@ class CottonDetector:
             time.sleep(2)
         
         # Start display in separate thread
-        print("📺 Starting display system...")
-        display_thread = threading.Thread(target=self.display_loop)
-        display_thread.daemon = True
-        display_thread.start()
+        if HEADLESS:
+            print("🖥️ Headless mode: no display window")
+        else:
+            print("📺 Starting display system...")
+            display_thread = threading.Thread(target=self.display_loop)
+            display_thread.daemon = True
+            display_thread.start()
         
         # Keep main thread alive
         try:
             while True:
                 time.sleep(1)
+                if HEADLESS:
+                    self.check_camera_timeout()
                 # Show status periodically
                 if time.time() % 30 < 1:  # Every 30 seconds
                     print(f"📊 Status - Arm clients: {len(self.connected_arm_clients)}, "
-                          f"Camera clients: {len(self.connected_camera_clients)}")
+                          f"Camera clients: {len(self.connected_camera_clients)}, "
+                          f"Detection: {self.detect_ms:.1f} ms/frame (every {DETECT_EVERY_N}), "
+                          f"tracking {len(self.latest_coordinates)} targets, "
+                          f"skipped {self.frames_skipped}/{self.frames_received} frames")
         except KeyboardInterrupt:
             print("\n🛑 Shutting down...")
 
+def positive_int(text):
+    value = int(text)
+    if value < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {value}")
+    return value
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Cotton detection on the ESP32-CAM WebSocket stream")
+    parser.add_argument("--record", metavar="DIR", default=RECORD_DIR,
+                        help="save every processed camera JPEG in DIR")
+    parser.add_argument("--detect-every", metavar="N", type=positive_int, default=DETECT_EVERY_N,
+                        help=f"run detection on every Nth frame (default {DETECT_EVERY_N})")
+    parser.add_argument("--calibration", metavar="FILE", default=CALIBRATION_PATH,
+                        help=f"pixel-to-arm calibration file (default {CALIBRATION_PATH})")
+    parser.add_argument("--headless", action="store_true", help="run without a display window")
+    return parser.parse_args()
+
+
 if __name__ == "__main__":
+    args = parse_args()
+    RECORD_DIR = args.record
+    DETECT_EVERY_N = args.detect_every
+    CALIBRATION_PATH = args.calibration
+    HEADLESS = args.headless
     try:
         detector = CottonDetector()
         detector.run()
@@ -5,6 +5,8 @@ import time
 from datetime import datetime
 import random
 
+from coordinate_frame import arm_capabilities, encode_coordinates
+
 # WebSocket server configuration
 WEBSOCKET_HOST = "0.0.0.0"  # Listen on all interfaces
 WEBSOCKET_PORT = 8765
@@ -12,7 +14,10 @@ WEBSOCKET_PORT = 8765
 class TestWebSocketServer:
     def __init__(self):
         self.connected_clients = set()
+        self.binary_clients = set()  # Clients that said "ARM_READY:BIN"
         self.running = False
+        self.seq = 0
+        self.started = time.monotonic()
         
     async def handle_client(self, websocket):
         """Handle WebSocket client connections"""
@@ -32,6 +37,13 @@ class TestWebSocketServer:
             # Keep connection alive and wait for disconnection
             async for message in websocket:
                 print(f"📥 Received from ESP32: {message}")
+                capabilities = arm_capabilities(message)
+                if capabilities is not None:
+                    if "BIN" in capabilities:
+                        self.binary_clients.add(websocket)
+                        print(f"📦 {websocket.remote_address} gets binary coordinate frames")
+                    else:
+                        self.binary_clients.discard(websocket)
                 
         except websockets.exceptions.ConnectionClosed:
             print(f"✗ ESP32 disconnected normally: {websocket.remote_address}")
@@ -39,6 +51,7 @@ class TestWebSocketServer:
             print(f"✗ Client handling error: {e}")
         finally:
             self.connected_clients.discard(websocket)
+            self.binary_clients.discard(websocket)
             print(f"✗ ESP32 removed from client list: {websocket.remote_address}")
     
     async def send_dummy_coordinates(self):
@@ -51,6 +64,7 @@ class TestWebSocketServer:
                 
                 for i in range(num_cotton):
                     cotton = {
+                        "id": i + 1,
                         "x": random.randint(50, 270),    # Random X between 50-270
                         "y": random.randint(50, 190),    # Random Y between 50-190
                         "area": random.randint(150, 500) # Random area
@@ -62,14 +76,20 @@ class TestWebSocketServer:
                     "type": "cotton_coordinates",
                     "timestamp": datetime.now().isoformat(),
                     "coordinates": dummy_coordinates,
-                    "count": len(dummy_coordinates)
+                    "count": len(dummy_coordinates),
+                    "changed": [c["id"] for c in dummy_coordinates],
+                    "removed": []
                 }
                 
-                # Send to all connected clients
+                # Serialize once per format, then send to all connected clients
+                self.seq = (self.seq + 1) & 0xFFFF
+                text = json.dumps(message)
+                frame = encode_coordinates(dummy_coordinates, message["changed"], (), self.seq,
+                                           1000 * (time.monotonic() - self.started))
                 disconnected_clients = set()
                 for client in self.connected_clients.copy():
                     try:
-                        await client.send(json.dumps(message))
+                        await client.send(frame if client in self.binary_clients else text)
                         coord_str = ", ".join([f"({c['x']},{c['y']})" for c in dummy_coordinates])
                         print(f"📨 Sent coordinates to {client.remote_address}: [{coord_str}]")
                     except websockets.exceptions.ConnectionClosed:
@@ -81,6 +101,7 @@ class TestWebSocketServer:
                 
                 # Remove disconnected clients
                 self.connected_clients -= disconnected_clients
+                self.binary_clients -= disconnected_clients
                 
                 # Wait before sending next coordinates
                 await asyncio.sleep(5)  # Send every 5 seconds
@@ -0,0 +1,85 @@
+"""
+Streaming tf.data input pipeline for the U-Net notebook (cnnfyp_model_training.py)
+
+Reads the shard written by unet_preprocess.py (images.npy / masks.npy,
+memory-mapped) instead of loading every image into Python lists:
+  row indices -> shuffle (train only) -> batch -> read rows from the
+  memory-mapped shard (parallel) -> prefetch
+Only the rows of the batches in flight are resident, so memory use does
+not depend on the dataset size, and images are decoded, resized and
+masked once, by unet_preprocess.py, not again on every run.
+
+Examples stay uint8 up to the model: images 0-255, masks unpacked from
+bits to 0/1 per batch. The model scales images itself (a Rescaling layer,
+see unet_model in the notebook); masks become float32 per batch, for the
+loss.
+
+The train/validation split is by a hash of each file name: it does not
+depend on row order, and adding images never moves existing ones between
+the splits. It is computed on every call, so changing val_percent always
+takes effect.
+"""
+
+import numpy as np
+import tensorflow as tf
+
+from unet_preprocess import load_shard, unpack_masks
+
+VAL_PERCENT = 20
+AUTOTUNE = tf.data.AUTOTUNE
+
+
+def is_validation(name, val_percent=VAL_PERCENT):
+    """Deterministic split: a file is in validation if its name hashes below val_percent"""
+    return tf.strings.to_hash_bucket_fast(name, 100) < val_percent
+
+
+def make_datasets(shard_dir, batch_size=8, val_percent=VAL_PERCENT, seed=42):
+    """Returns (train_ds, val_ds, train_count, val_count) of batched (image, mask) pairs"""
+    images, packed_masks, names = load_shard(shard_dir, unpack=False)
+    if not names:
+        raise ValueError(f"no preprocessed images in {shard_dir}")
+    size = images.shape[1]
+    in_val = is_validation(tf.constant(names), val_percent).numpy()
+    train_rows, val_rows = np.flatnonzero(~in_val), np.flatnonzero(in_val)
+
+    def read_rows(rows):
+        # Sorted rows read the memory-mapped files front to back; order within a batch does not matter
+        rows = np.sort(rows)
+        return images[rows], unpack_masks(packed_masks[rows])[..., np.newaxis]
+
+    def to_tensors(rows):
+        batch_images, batch_masks = tf.numpy_function(read_rows, [rows], (tf.uint8, tf.uint8))
+        batch_images = tf.ensure_shape(batch_images, (None, size, size, 3))
+        batch_masks = tf.ensure_shape(batch_masks, (None, size, size, 1))
+        return batch_images, tf.cast(batch_masks, tf.float32)
+
+    def split(rows, shuffle):
+        # Known sizes (from the row lists) give Keras its steps per epoch
+        ds = tf.data.Dataset.from_tensor_slices(rows)
+        if shuffle:
+            ds = ds.shuffle(len(rows), seed=seed, reshuffle_each_iteration=True)
+        return ds.batch(batch_size).map(to_tensors, num_parallel_calls=AUTOTUNE).prefetch(AUTOTUNE)
+
+    return split(train_rows, True), split(val_rows, False), len(train_rows), len(val_rows)
+
+
+def confusion_counts(model, dataset, threshold=0.5):
+    """Pixel confusion matrix [[tn, fp], [fn, tp]] over a dataset, one batch at a time"""
+    counts = np.zeros((2, 2), np.int64)
+    for images, masks in dataset:
+        predicted = model.predict_on_batch(images) > threshold
+        truth = np.asarray(masks) > 0.5
+        counts += [[np.sum(~truth & ~predicted), np.sum(~truth & predicted)],
+                   [np.sum(truth & ~predicted), np.sum(truth & predicted)]]
+    return counts
+
+
+def scores(counts):
+    """(accuracy, precision, recall, f1) from confusion_counts(); 0 where undefined"""
+    (tn, fp), (fn, tp) = counts
+    accuracy = (tp + tn) / max(counts.sum(), 1)
+    precision = tp / max(tp + fp, 1)
+    recall = tp / max(tp + fn, 1)
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+    return accuracy, precision, recall, f1
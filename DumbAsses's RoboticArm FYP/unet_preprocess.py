@@ -0,0 +1,259 @@
+"""
+Parallel, cached preprocessing for the U-Net cotton dataset (cnnfyp_model_training.py)
+
+Does what the notebook's resize_images / process_and_split /
+preprocess_and_save steps did, in a process pool, into one packed shard
+instead of thousands of small PNGs. The source is either:
+  - a folder of raw images: masks are generated at full resolution with the
+    notebook's white threshold (HSV 0-180, 0-40, 200-255), or
+  - a folder with 'images' and 'masks' subfolders (found anywhere below it,
+    like the notebook's discovery step), paired by file name stem.
+
+Output in OUT_DIR:
+  images.npy     uint8 (N, size, size, 3), RGB like the notebook's load_img
+  masks.npy      uint8 (N, size, size / 8), 0/1 masks (resized, then > 127)
+                 bit-packed along each row with np.packbits
+  manifest.json  settings, and per row: file name, size/mtime, content hash
+
+Nothing is stored as float: a 128x128 example takes 48 KiB + 2 KiB instead
+of 192 KiB + 64 KiB as float32. Scaling to [0, 1] happens in the model.
+Both .npy files can be opened memory-mapped (load_shard). On a re-run,
+files whose size and mtime are unchanged are not read at all; files whose
+stat changed are hashed and only reprocessed if their contents changed.
+When nothing changed, the shard is left as it is.
+
+Usage:
+    python unet_preprocess.py SOURCE_DIR [OUT_DIR] [--workers N] [--size PIXELS]
+"""
+
+import hashlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+
+IMAGE_SIZE = 128
+LOWER_WHITE = (0, 0, 200)  # HSV, as in the notebook's generate_mask
+UPPER_WHITE = (180, 40, 255)
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+MANIFEST_VERSION = 2  # 2: bit-packed masks
+DEFAULT_OUT_DIR = "unet_dataset"
+
+
+def find_sources(source_dir):
+    """[(name, image path, mask path or None)] sorted by name"""
+    image_dir = mask_dir = None
+    for root, dirs, _ in os.walk(source_dir):
+        for d in dirs:
+            if 'image' in d.lower() and image_dir is None:
+                image_dir = os.path.join(root, d)
+            elif 'mask' in d.lower() and mask_dir is None:
+                mask_dir = os.path.join(root, d)
+
+    def listing(folder):
+        return sorted(f for f in os.listdir(folder) if f.lower().endswith(IMAGE_EXTENSIONS))
+
+    if image_dir is None or mask_dir is None:
+        return [(f, os.path.join(source_dir, f), None) for f in listing(source_dir)]
+
+    masks = {os.path.splitext(f)[0]: os.path.join(mask_dir, f) for f in listing(mask_dir)}
+    sources = []
+    for f in listing(image_dir):
+        mask = masks.get(os.path.splitext(f)[0])
+        if mask is None:
+            print(f"⚠️ No mask for {f}, skipped")
+            continue
+        sources.append((f, os.path.join(image_dir, f), mask))
+    return sources
+
+
+def file_stat(image_path, mask_path):
+    paths = [image_path] if mask_path is None else [image_path, mask_path]
+    return [v for st in map(os.stat, paths) for v in (st.st_size, st.st_mtime_ns)]
+
+
+def generate_mask(image):
+    """White (cotton) mask of a BGR image, 0/255"""
+    hsv = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
+    return cv2.inRange(hsv, np.array(LOWER_WHITE), np.array(UPPER_WHITE))
+
+
+def preprocess_one(task):
+    """
+    Worker: returns (hash, image, mask). image/mask are None when the
+    contents hash to known_hash (unchanged) or cannot be decoded.
+    """
+    image_path, mask_path, size, known_hash = task
+    with open(image_path, "rb") as f:
+        image_bytes = f.read()
+    mask_bytes = b""
+    if mask_path is not None:
+        with open(mask_path, "rb") as f:
+            mask_bytes = f.read()
+    digest = hashlib.sha1(image_bytes + mask_bytes).hexdigest()
+    if digest == known_hash:
+        return digest, None, None
+
+    image = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        return digest, None, None
+    if mask_path is None:
+        mask = generate_mask(image)
+    else:
+        mask = cv2.imdecode(np.frombuffer(mask_bytes, np.uint8), cv2.IMREAD_GRAYSCALE)
+        if mask is None:
+            return digest, None, None
+
+    image = cv2.cvtColor(cv2.resize(image, (size, size)), cv2.COLOR_BGR2RGB)
+    mask = np.packbits(cv2.resize(mask, (size, size)) > 127, axis=-1)
+    return digest, image, mask
+
+
+def _init_worker():
+    cv2.setNumThreads(1)  # One process per core already
+
+
+def load_manifest(out_dir, settings):
+    """Previous manifest if it was made with the same settings, else None"""
+    try:
+        with open(os.path.join(out_dir, "manifest.json")) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return manifest if manifest.get("settings") == settings else None
+
+
+def write_manifest(out_dir, settings, files):
+    with open(os.path.join(out_dir, "manifest.json"), "w") as f:
+        json.dump({"settings": settings, "files": files}, f)
+
+
+def unpack_masks(packed):
+    """uint8 0/1 masks (..., size, size) from bit-packed rows (..., size, size / 8)"""
+    return np.unpackbits(packed, axis=-1, count=packed.shape[-2])  # Masks are square
+
+
+def load_shard(out_dir, mmap=True, unpack=True):
+    """
+    (images, masks, names) from a preprocessed shard. images are memory-mapped
+    by default; masks are unpacked to uint8 0/1 (1 byte per pixel) unless
+    unpack is False, which returns the packed (memory-mapped) array.
+    """
+    mode = "r" if mmap else None
+    images = np.load(os.path.join(out_dir, "images.npy"), mmap_mode=mode)
+    masks = np.load(os.path.join(out_dir, "masks.npy"), mmap_mode=mode)
+    with open(os.path.join(out_dir, "manifest.json")) as f:
+        names = [entry["name"] for entry in json.load(f)["files"]]
+    return images, unpack_masks(masks) if unpack else masks, names
+
+
+def preprocess(source_dir, out_dir=DEFAULT_OUT_DIR, size=IMAGE_SIZE, workers=None):
+    """Bring the shard in out_dir up to date with source_dir; returns the number of rows"""
+    started = time.perf_counter()
+    os.makedirs(out_dir, exist_ok=True)
+    sources = find_sources(source_dir)
+    settings = {
+        "version": MANIFEST_VERSION,
+        "size": size,
+        "masks": "generated" if sources and sources[0][2] is None else "files",
+        "lower": list(LOWER_WHITE),
+        "upper": list(UPPER_WHITE),
+    }
+    manifest = load_manifest(out_dir, settings)
+    previous = {} if manifest is None else {e["name"]: (row, e) for row, e in enumerate(manifest["files"])}
+
+    stats = {name: file_stat(image, mask) for name, image, mask in sources}
+    if manifest is not None and [e["name"] for e in manifest["files"]] == [s[0] for s in sources] \
+            and all(e["stat"] == stats[e["name"]] for e in manifest["files"]):
+        print(f"✅ {len(sources)} files unchanged, shard up to date "
+              f"({time.perf_counter() - started:.2f} s)")
+        return len(sources)
+
+    # Files with a new stat are hashed (in the pool); only changed contents are reprocessed
+    tasks, unchanged = [], {}
+    for name, image_path, mask_path in sources:
+        old = previous.get(name)
+        if old is not None and old[1]["stat"] == stats[name]:
+            unchanged[name] = old[1]["hash"]
+        else:
+            tasks.append((name, (image_path, mask_path, size, old[1]["hash"] if old else None)))
+
+    results = {}
+    if tasks:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+            chunksize = max(1, len(tasks) // (4 * (workers or os.cpu_count() or 1)))
+            for (name, _), result in zip(tasks, pool.map(preprocess_one, [t for _, t in tasks],
+                                                        chunksize=chunksize)):
+                results[name] = result
+
+    old_images = old_masks = None
+    if manifest is not None:
+        old_images, old_masks, _ = load_shard(out_dir, unpack=False)
+
+    rows = []  # (name, source: ("old", row) or ("new", image, mask), hash)
+    for name, _, _ in sources:
+        if name in unchanged:
+            rows.append((name, ("old", previous[name][0]), unchanged[name]))
+            continue
+        digest, image, mask = results[name]
+        if image is not None:
+            rows.append((name, ("new", image, mask), digest))
+        elif name in previous and previous[name][1]["hash"] == digest:
+            rows.append((name, ("old", previous[name][0]), digest))
+        else:
+            print(f"⚠️ Could not decode {name}, skipped")
+
+    files = [{"name": name, "stat": stats[name], "hash": digest} for name, _, digest in rows]
+    if manifest is not None and len(rows) == len(manifest["files"]) \
+            and all(source == ("old", i) for i, (_, source, _) in enumerate(rows)):
+        # Only stats changed (touched or copied files): the shard is still right
+        write_manifest(out_dir, settings, files)
+        print(f"✅ {len(rows)} files unchanged in content, shard up to date "
+              f"({time.perf_counter() - started:.2f} s)")
+        return len(rows)
+
+    # Write the new shard next to the old one, then swap it in
+    images_tmp = os.path.join(out_dir, "images.tmp.npy")
+    masks_tmp = os.path.join(out_dir, "masks.tmp.npy")
+    images = np.lib.format.open_memmap(images_tmp, "w+", np.uint8, (len(rows), size, size, 3))
+    masks = np.lib.format.open_memmap(masks_tmp, "w+", np.uint8, (len(rows), size, (size + 7) // 8))
+    for i, (_, source, _) in enumerate(rows):
+        if source[0] == "old":
+            images[i], masks[i] = old_images[source[1]], old_masks[source[1]]
+        else:
+            images[i], masks[i] = source[1], source[2]
+    images.flush()
+    masks.flush()
+    del images, masks, old_images, old_masks
+
+    os.replace(images_tmp, os.path.join(out_dir, "images.npy"))
+    os.replace(masks_tmp, os.path.join(out_dir, "masks.npy"))
+    write_manifest(out_dir, settings, files)
+
+    processed = sum(1 for _, source, _ in rows if source[0] == "new")
+    print(f"✅ {len(rows)} images in {out_dir} ({processed} processed, {len(rows) - processed} reused) "
+          f"in {time.perf_counter() - started:.2f} s")
+    return len(rows)
+
+
+def main():
+    args = sys.argv[1:]
+    options = {}
+    for flag in ("--workers", "--size"):
+        if flag in args:
+            i = args.index(flag)
+            options[flag] = int(args[i + 1])
+            del args[i:i + 2]
+    if not args:
+        print(__doc__)
+        sys.exit(2)
+    preprocess(args[0], args[1] if len(args) > 1 else DEFAULT_OUT_DIR,
+               size=options.get("--size", IMAGE_SIZE), workers=options.get("--workers"))
+
+
+if __name__ == "__main__":
+    main()
@@ -99,12 +99,30 @@ const unsigned long COORDINATE_TIMEOUT = 500;  // Reduced from 2000ms to 500ms
 const unsigned long DIRECTION_MEMORY_TIMEOUT = 1000; // Reduced from 3000ms to 1000ms
 const unsigned long NO_DATA_TIMEOUT = 1000;  // Reduced from 3000ms to 1000ms
 
+// Binary coordinate frames (see coordinate_frame.py), requested with "ARM_READY:BIN,BIN2":
+// header magic(1) version(1) seq(2) timestamp_ms(4) count(1) changed(1) removed(1),
+// then count x {id, x, y, area} uint16, then changed/removed ids, all little-endian.
+// Version 2 (sent while the server has a calibration) adds a servo count byte to the
+// header, and to each target arm x/y (int16, tenths) plus one uint8 angle per servo.
+#define COORD_FRAME_MAGIC 0xC0
+#define COORD_FRAME_VERSION 1
+#define COORD_ARM_FRAME_VERSION 2
+#define COORD_HEADER_SIZE 11
+#define COORD_ARM_HEADER_SIZE 12
+#define COORD_TARGET_SIZE 8
+#define COORD_ARM_TARGET_SIZE 12
+
+// Calibrated servo angles used from a target: base, shoulder, elbow
+#define TARGET_SERVOS 3
+
 // Current target coordinates and state management
 struct CottonTarget {
   int x;
   int y;
   int area;
   bool is_centered;
+  int servos[TARGET_SERVOS];  // Calibrated pose, valid when servo_count == TARGET_SERVOS
+  int servo_count;
 };
 
 CottonTarget current_target;
@@ -113,6 +131,7 @@ bool centering_in_progress = false;
 unsigned long last_coordinate_update = 0;
 unsigned long last_data_received = 0;
 bool auto_home_triggered = false;
+bool calibrated_pickup = false;  // Arm already at the calibrated reach pose; pickup skips lowering
 
 // System states
 enum ArmState {
@@ -248,6 +267,8 @@ void webSocketEvent(WStype_t type, uint8_t * payload, size_t length) {
       // Reset state on new connection
       current_state = IDLE;
       has_target = false;
+      // Ask for binary coordinate frames instead of JSON, with the calibrated pose when available
+      webSocket.sendTXT("ARM_READY:BIN,BIN2");
       break;
       
     case WStype_TEXT:
@@ -255,6 +276,10 @@ void webSocketEvent(WStype_t type, uint8_t * payload, size_t length) {
       handleCoordinateMessage((char*)payload);
       break;
       
+    case WStype_BIN:
+      handleCoordinateFrame(payload, length);
+      break;
+      
     case WStype_ERROR:
       Serial.printf("✗ WebSocket Error: %s\n", payload);
       websocket_connected = false;
@@ -279,78 +304,161 @@ void handleCoordinateMessage(const char* message) {
   // Check if it's a cotton coordinates message
   if (doc["type"] == "cotton_coordinates") {
     JsonArray coordinates = doc["coordinates"];
-    
-    // Update last coordinate update time
-    last_coordinate_update = millis();
-    last_data_received = millis();
-    auto_home_triggered = false;
-    
     if (coordinates.size() > 0) {
       // Take the first detected cotton object
       JsonObject firstCotton = coordinates[0];
-      
-      current_target.x = firstCotton["x"];
-      current_target.y = firstCotton["y"];
-      current_target.area = firstCotton["area"];
-      current_target.is_centered = isTargetAtPickupPosition(current_target.x, current_target.y);
-      
-      has_target = true;
-      
-      Serial.printf("🎯 Target at (%d, %d) - Pickup position: (%d, %d) - ", 
-                    current_target.x, current_target.y, TARGET_X, TARGET_Y);
-      
-      if (current_target.is_centered) {
-        Serial.println("AT PICKUP POSITION ✓");
-        // Only start picking if we're in IDLE or CENTERING state (NOT after dropping)
-        if (current_state == IDLE || current_state == CENTERING_TARGET) {
-          Serial.println("🤏 Target is at pickup position, preparing for pickup...");
-          
-          // Keep shoulder at mean position (no pre-lowering)
-          moveServoSmoothly(servo2, servo2_pos, SERVO2_MEAN);
-          servo2_pos = SERVO2_MEAN;
-          
-          // Elbow to mean position
-          moveServoSmoothly(servo3, servo3_pos, SERVO3_MEAN);
-          servo3_pos = SERVO3_MEAN;
-          
-          // Remove delay - go directly to pickup
-          current_state = PICKING_COTTON;
-          has_target = false;
-        } else {
-          // If not in correct state, ignore this target to prevent multiple cycles
-          Serial.println("⚠️ Ignoring target - arm is busy with current cycle");
-          has_target = false;
-        }
+      // Servo angles are only present when the server has an arm calibration
+      JsonArray servos = firstCotton["servos"];
+      int angles[TARGET_SERVOS];
+      int servo_count = 0;
+      for (JsonVariant angle : servos) {
+        if (servo_count == TARGET_SERVOS) break;
+        angles[servo_count++] = angle.as<int>();
+      }
+      applyCoordinates(true, firstCotton["x"].as<int>(), firstCotton["y"].as<int>(), firstCotton["area"].as<int>(),
+                       angles, servo_count);
+    } else {
+      applyCoordinates(false, 0, 0, 0, NULL, 0);
+    }
+  }
+}
+
+static uint16_t readU16(const uint8_t* p) {
+  return p[0] | (p[1] << 8);
+}
+
+void handleCoordinateFrame(const uint8_t* payload, size_t length) {
+  if (length < COORD_HEADER_SIZE || payload[0] != COORD_FRAME_MAGIC ||
+      (payload[1] != COORD_FRAME_VERSION && payload[1] != COORD_ARM_FRAME_VERSION)) {
+    Serial.printf("✗ Unknown binary frame (%u bytes)\n", (unsigned)length);
+    return;
+  }
+  bool calibrated = payload[1] == COORD_ARM_FRAME_VERSION;
+  size_t header_size = calibrated ? COORD_ARM_HEADER_SIZE : COORD_HEADER_SIZE;
+  uint8_t frame_servos = calibrated && length >= header_size ? payload[11] : 0;
+  size_t target_size = calibrated ? COORD_ARM_TARGET_SIZE + frame_servos : COORD_TARGET_SIZE;
+  uint8_t count = payload[8];
+  if (length < header_size + (size_t)count * target_size) {
+    Serial.println("✗ Truncated coordinate frame");
+    return;
+  }
+  if (count > 0) {
+    // Take the first detected cotton object (skip its id)
+    const uint8_t* first = payload + header_size;
+    int angles[TARGET_SERVOS];
+    int servo_count = 0;
+    if (calibrated) {
+      Serial.printf("📐 Arm position (%.1f, %.1f)\n",
+                    (int16_t)readU16(first + 8) / 10.0, (int16_t)readU16(first + 10) / 10.0);
+      while (servo_count < frame_servos && servo_count < TARGET_SERVOS) {
+        angles[servo_count] = first[COORD_ARM_TARGET_SIZE + servo_count];
+        servo_count++;
+      }
+    }
+    applyCoordinates(true, readU16(first + 2), readU16(first + 4), readU16(first + 6), angles, servo_count);
+  } else {
+    applyCoordinates(false, 0, 0, 0, NULL, 0);
+  }
+}
+
+void applyCoordinates(bool found, int x, int y, int area, const int* servos, int servo_count) {
+  // Update last coordinate update time
+  last_coordinate_update = millis();
+  last_data_received = millis();
+  auto_home_triggered = false;
+  
+  if (found) {
+    current_target.x = x;
+    current_target.y = y;
+    current_target.area = area;
+    current_target.is_centered = isTargetAtPickupPosition(current_target.x, current_target.y);
+    current_target.servo_count = servo_count;
+    for (int i = 0; i < servo_count && i < TARGET_SERVOS; i++) {
+      current_target.servos[i] = constrain(servos[i], 0, 180);
+    }
+    
+    has_target = true;
+    
+    // With a calibrated pose, reach for the target directly instead of centering it
+    if (current_target.servo_count == TARGET_SERVOS) {
+      if (current_state == IDLE || current_state == CENTERING_TARGET) {
+        moveToCalibratedPose();
       } else {
-        Serial.printf("NOT AT PICKUP POSITION (off by %d,%d)\n", 
-                      current_target.x - TARGET_X, current_target.y - TARGET_Y);
-        // Only start centering if we're in IDLE state
-        if (current_state == IDLE) {
-          Serial.println("🎯 Starting positioning process...");
-          current_state = CENTERING_TARGET;
-          // Reset direction memory when starting new centering
-          last_direction = {0, 0, 0, millis()};
-        } else {
-          // If not in IDLE, ignore this target
-          Serial.println("⚠️ Ignoring target - arm is busy");
-          has_target = false;
-        }
+        Serial.println("⚠️ Ignoring target - arm is busy with current cycle");
+        has_target = false;
+      }
+      return;
+    }
+    
+    Serial.printf("🎯 Target at (%d, %d) - Pickup position: (%d, %d) - ", 
+                  current_target.x, current_target.y, TARGET_X, TARGET_Y);
+    
+    if (current_target.is_centered) {
+      Serial.println("AT PICKUP POSITION ✓");
+      // Only start picking if we're in IDLE or CENTERING state (NOT after dropping)
+      if (current_state == IDLE || current_state == CENTERING_TARGET) {
+        Serial.println("🤏 Target is at pickup position, preparing for pickup...");
+        
+        // Keep shoulder at mean position (no pre-lowering)
+        moveServoSmoothly(servo2, servo2_pos, SERVO2_MEAN);
+        servo2_pos = SERVO2_MEAN;
+        
+        // Elbow to mean position
+        moveServoSmoothly(servo3, servo3_pos, SERVO3_MEAN);
+        servo3_pos = SERVO3_MEAN;
+        
+        // Remove delay - go directly to pickup
+        current_state = PICKING_COTTON;
+        has_target = false;
+      } else {
+        // If not in correct state, ignore this target to prevent multiple cycles
+        Serial.println("⚠️ Ignoring target - arm is busy with current cycle");
+        has_target = false;
       }
     } else {
-      // No targets detected
-      if (has_target) {
-        Serial.println("📭 No cotton detected - target lost");
+      Serial.printf("NOT AT PICKUP POSITION (off by %d,%d)\n", 
+                    current_target.x - TARGET_X, current_target.y - TARGET_Y);
+      // Only start centering if we're in IDLE state
+      if (current_state == IDLE) {
+        Serial.println("🎯 Starting positioning process...");
+        current_state = CENTERING_TARGET;
+        // Reset direction memory when starting new centering
+        last_direction = {0, 0, 0, millis()};
+      } else {
+        // If not in IDLE, ignore this target
+        Serial.println("⚠️ Ignoring target - arm is busy");
         has_target = false;
-        if (current_state == CENTERING_TARGET) {
-          Serial.println("🔍 Lost target during positioning, attempting recovery...");
-          // Try to recover using last known direction
-          recoverLostTarget();
-        }
+      }
+    }
+  } else {
+    // No targets detected
+    if (has_target) {
+      Serial.println("📭 No cotton detected - target lost");
+      has_target = false;
+      if (current_state == CENTERING_TARGET) {
+        Serial.println("🔍 Lost target during positioning, attempting recovery...");
+        // Try to recover using last known direction
+        recoverLostTarget();
       }
     }
   }
 }
 
+void moveToCalibratedPose() {
+  Serial.printf("📐 Moving to calibrated pose: base %d, shoulder %d, elbow %d\n",
+                current_target.servos[0], current_target.servos[1], current_target.servos[2]);
+  moveServoSmoothly(servo1, servo1_pos, current_target.servos[0]);
+  servo1_pos = current_target.servos[0];
+  moveServoSmoothly(servo2, servo2_pos, current_target.servos[1]);
+  servo2_pos = current_target.servos[1];
+  moveServoSmoothly(servo3, servo3_pos, current_target.servos[2]);
+  servo3_pos = current_target.servos[2];
+  
+  calibrated_pickup = true;
+  current_state = PICKING_COTTON;
+  has_target = false;
+}
+
 const char* getZoneName(int x, int y) {
   for (int i = 0; i < NUM_ZONES; i++) {
     if (x >= zones[i].min_x && x <= zones[i].max_x &&
@@ -440,17 +548,21 @@ void moveToZone(const char* zone_name) {
 void pickUpCotton() {
   Serial.println("🤏 Picking up cotton...");
   
-  // Step 1: Lower shoulder 5 degrees below mean for pickup
-  int pickup_shoulder_pos = SERVO2_MEAN - 5;  // 5 degrees lower (45)
-  if (pickup_shoulder_pos < SERVO2_DOWN) pickup_shoulder_pos = SERVO2_DOWN;
-  
-  Serial.printf("🔧 Lowering shoulder 5° for pickup: %d -> %d\n", servo2_pos, pickup_shoulder_pos);
-  moveServoSmoothly(servo2, servo2_pos, pickup_shoulder_pos);
-  servo2_pos = pickup_shoulder_pos;
-  
-  // Step 2: Lower elbow for pickup reach
-  moveServoSmoothly(servo3, servo3_pos, SERVO3_DOWN);  // Elbow down (170)
-  servo3_pos = SERVO3_DOWN;
+  // Steps 1-2 reach the fixed pickup position; a calibrated pose is already there
+  if (!calibrated_pickup) {
+    // Step 1: Lower shoulder 5 degrees below mean for pickup
+    int pickup_shoulder_pos = SERVO2_MEAN - 5;  // 5 degrees lower (45)
+    if (pickup_shoulder_pos < SERVO2_DOWN) pickup_shoulder_pos = SERVO2_DOWN;
+    
+    Serial.printf("🔧 Lowering shoulder 5° for pickup: %d -> %d\n", servo2_pos, pickup_shoulder_pos);
+    moveServoSmoothly(servo2, servo2_pos, pickup_shoulder_pos);
+    servo2_pos = pickup_shoulder_pos;
+    
+    // Step 2: Lower elbow for pickup reach
+    moveServoSmoothly(servo3, servo3_pos, SERVO3_DOWN);  // Elbow down (170)
+    servo3_pos = SERVO3_DOWN;
+  }
+  calibrated_pickup = false;
   
   // Step 3: Position wrist
   moveServoSmoothly(servo4, servo4_pos, SERVO4_MEAN);  // Wrist level (150)
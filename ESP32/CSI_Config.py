@@ -0,0 +1,12 @@
+"""
+Detector settings shared by the CSI scripts.
+
+Kept free of sockets, argv parsing and global state so the offline tools
+(CSI_Offline_Analyzer.py, CSI_Spectral_Benchmark.py) can import them
+without setting up the live receiver.
+"""
+
+CSI_WINDOW_SIZE = 200 # Number of CSI packets to hold for analysis
+MOTION_THRESHOLD = 25 # An empirical threshold. You WILL need to adjust this!
+NUM_SUBCARRIERS = 64  # Values kept per packet (LLTF)
+BATCH_SIZE = 32       # Max packets drained from the socket per detector update
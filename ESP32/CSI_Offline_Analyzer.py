@@ -0,0 +1,217 @@
+"""
+Offline CSI motion detector analysis.
+
+Runs the same mean-variance detector as CSI_UDP_Receiver.py over a recording
+made with "--record DIR", sweeping window sizes and thresholds. The
+recording is read one memory-mapped chunk at a time, so its length is not
+limited by RAM.
+
+Usage:
+    python CSI_Offline_Analyzer.py RECORD_DIR [LABELS.csv] [--plot]
+
+LABELS.csv lists motion intervals as "start,end" Unix timestamps, one per
+line ('#' starts a comment). With labels, an ROC curve is computed for each
+window size; without them, the score distribution is summarised instead.
+"""
+
+import os
+import sys
+import time
+import numpy as np
+
+from CSI_Recorder import load_recording
+from CSI_Config import CSI_WINDOW_SIZE, MOTION_THRESHOLD
+
+# --- Configuration ---
+WINDOW_SIZES = [50, 100, CSI_WINDOW_SIZE, 400]  # Window sizes to sweep
+BLOCK_ROWS = 250_000  # Frames per block within a chunk; bounds the temporaries
+ROC_POINTS = 1000     # Max points written per ROC curve
+
+
+def rolling_motion_score(amplitude, window):
+    """
+    Mean per-subcarrier variance over each trailing window of frames, i.e.
+    CSIWindowBank.mean_variance() evaluated after every packet.
+    Frames before the first full window score NaN.
+    """
+    n = len(amplitude)
+    scores = np.full(n, np.nan)
+    for start in range(window - 1, n, BLOCK_ROWS):
+        stop = min(n, start + BLOCK_ROWS)
+        x = np.asarray(amplitude[start - window + 1:stop], dtype=np.float64)
+
+        # Windowed sums from prefix sums; E[x^2] only needs the subcarrier mean
+        c1 = np.zeros((len(x) + 1, x.shape[1]))
+        np.cumsum(x, axis=0, out=c1[1:])
+        c2 = np.zeros(len(x) + 1)
+        np.cumsum((x * x).mean(axis=1), out=c2[1:])
+
+        mean = (c1[window:] - c1[:-window]) / window
+        mean_sq = (c2[window:] - c2[:-window]) / window
+        scores[start:stop] = mean_sq - (mean * mean).mean(axis=1)
+    return scores
+
+
+class FusedScorer:
+    """
+    Fused motion score of a recording, fed one memory-mapped chunk at a time.
+
+    Between chunks it keeps only the last window - 1 frames of each source
+    (so windows continue across chunk boundaries) and each source's latest
+    score. Links are averaged the way detect_motion does: at every packet,
+    each source contributes its most recent score.
+    """
+
+    def __init__(self, window):
+        self.window = window
+        self.tails = {}   # Source key -> last window - 1 amplitude rows
+        self.latest = {}  # Source key -> most recent score (NaN until its window is full)
+
+    def push(self, chunk):
+        """Fused score for every frame of the chunk, in arrival order (NaN until ready)."""
+        sources = np.asarray(chunk["source"])
+        n = len(sources)
+        held = {}
+        for key in np.unique(sources):
+            rows = np.flatnonzero(sources == key)
+            x = np.asarray(chunk["amplitude"][rows], dtype=np.float64)
+            if key in self.tails:
+                x = np.concatenate([self.tails[key], x])
+            self.tails[key] = x[max(0, len(x) - (self.window - 1)):]
+            scores = rolling_motion_score(x, self.window)[-len(rows):]
+
+            # Each score holds until the source's next packet
+            idx = np.searchsorted(rows, np.arange(n), side="right") - 1
+            held[key] = np.where(idx >= 0, scores[np.maximum(idx, 0)], self.latest.get(key, np.nan))
+            self.latest[key] = scores[-1]
+
+        stacked = np.array([held[key] if key in held else np.full(n, score)
+                            for key, score in self.latest.items()])
+        with np.errstate(invalid="ignore"):
+            ready = ~np.isnan(stacked)
+            return np.where(ready, stacked, 0.0).sum(axis=0) / ready.sum(axis=0)
+
+
+def score_recording(chunks, window):
+    """
+    (times, fused scores) of every frame with a ready score. Amplitudes are
+    read one chunk at a time; only the two result columns are kept in RAM.
+    """
+    scorer = FusedScorer(window)
+    times, fused = [], []
+    for chunk in chunks:
+        scores = scorer.push(chunk)
+        ready = ~np.isnan(scores)
+        times.append(np.asarray(chunk["t"])[ready])
+        fused.append(scores[ready])
+    return np.concatenate(times), np.concatenate(fused)
+
+
+def load_labels(path):
+    """Reads motion intervals as an (n, 2) array of [start, end] timestamps."""
+    rows = []
+    with open(path) as f:
+        for line in f:
+            line = line.split("#", 1)[0].strip()
+            if line:
+                start, end = line.split(",")[:2]
+                rows.append((float(start), float(end)))
+    return np.array(rows, dtype=np.float64).reshape(-1, 2)
+
+
+def label_times(times, intervals):
+    """True where a timestamp falls inside any labelled motion interval."""
+    intervals = intervals[np.argsort(intervals[:, 0])]
+    idx = np.searchsorted(intervals[:, 0], times, side="right") - 1
+    inside = idx >= 0
+    inside[inside] = times[inside] <= intervals[idx[inside], 1]
+    return inside
+
+
+def roc_curve(scores, labels):
+    """
+    ROC over every distinct threshold in one sort.
+    Returns (fpr, tpr, thresholds, auc).
+    """
+    order = np.argsort(-scores, kind="stable")
+    s = scores[order]
+    y = labels[order]
+    tp = np.cumsum(y)
+    fp = np.cumsum(~y)
+    # Last index of each run of equal scores
+    cut = np.r_[np.flatnonzero(np.diff(s)), len(s) - 1]
+    positives = max(int(tp[-1]), 1)
+    negatives = max(int(fp[-1]), 1)
+    tpr = np.r_[0.0, tp[cut] / positives]
+    fpr = np.r_[0.0, fp[cut] / negatives]
+    thresholds = np.r_[np.inf, s[cut]]
+    auc = float(np.sum(np.diff(fpr) * (tpr[1:] + tpr[:-1]) / 2))
+    return fpr, tpr, thresholds, auc
+
+
+def main():
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    if not args:
+        print(__doc__)
+        return
+    directory = args[0]
+    labels_path = args[1] if len(args) > 1 else None
+    show_plot = "--plot" in sys.argv
+
+    started = time.perf_counter()
+    chunks = load_recording(directory)
+    if not chunks:
+        print(f"❌ No recorded CSI frames in {directory}")
+        return
+    total = sum(len(chunk) for chunk in chunks)
+    sources = set().union(*(np.unique(np.asarray(chunk["source"])) for chunk in chunks))
+    span = max(chunk["t"].max() for chunk in chunks) - min(chunk["t"].min() for chunk in chunks)
+    print(f"📂 Mapped {total} frames in {len(chunks)} chunk(s) from {len(sources)} source(s), "
+          f"{span / 3600:.2f} h of data in {time.perf_counter() - started:.2f} s")
+
+    intervals = load_labels(labels_path) if labels_path else None
+    curves = {}
+    for window in WINDOW_SIZES:
+        started = time.perf_counter()
+        times, fused = score_recording(chunks, window)
+        elapsed = time.perf_counter() - started
+        if len(fused) == 0:
+            print(f"window={window:4d}: not enough frames")
+            continue
+
+        if intervals is None:
+            p50, p95, p99 = np.percentile(fused, [50, 95, 99])
+            over = np.mean(fused > MOTION_THRESHOLD)
+            print(f"window={window:4d}: p50={p50:.2f} p95={p95:.2f} p99={p99:.2f} "
+                  f"above {MOTION_THRESHOLD}: {over:.1%}  ({elapsed:.2f} s)")
+            continue
+
+        labels = label_times(times, intervals)
+        fpr, tpr, thresholds, auc = roc_curve(fused, labels)
+        curves[window] = (fpr, tpr, auc)
+        best = np.argmax(tpr - fpr)  # Youden's J
+        at_current = np.searchsorted(-thresholds, -MOTION_THRESHOLD, side="right") - 1
+        print(f"window={window:4d}: AUC={auc:.3f}  best threshold={thresholds[best]:.2f} "
+              f"(TPR={tpr[best]:.2f}, FPR={fpr[best]:.2f})  "
+              f"at {MOTION_THRESHOLD}: TPR={tpr[at_current]:.2f}, FPR={fpr[at_current]:.2f}  "
+              f"({elapsed:.2f} s)")
+
+        keep = np.unique(np.linspace(0, len(fpr) - 1, ROC_POINTS).astype(int))
+        np.savetxt(os.path.join(directory, f"roc_window{window}.csv"),
+                   np.column_stack([thresholds, fpr, tpr])[keep], delimiter=",",
+                   header="threshold,fpr,tpr", comments="")
+
+    if curves and show_plot:
+        import matplotlib.pyplot as plt
+        for window, (fpr, tpr, auc) in curves.items():
+            plt.plot(fpr, tpr, label=f"window={window} (AUC {auc:.3f})")
+        plt.plot([0, 1], [0, 1], "k--", alpha=0.3)
+        plt.xlabel("False positive rate")
+        plt.ylabel("True positive rate")
+        plt.title("CSI motion detector ROC")
+        plt.legend()
+        plt.show()
+
+
+if __name__ == "__main__":
+    main()
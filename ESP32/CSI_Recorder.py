@@ -0,0 +1,97 @@
+import os
+import glob
+import numpy as np
+
+# --- Configuration ---
+RECORD_CHUNK_ROWS = 200_000  # Rows per .npy chunk file (~53 MB at 64 subcarriers)
+RECORD_FLUSH_SECONDS = 5     # How often dirty pages are flushed to disk
+SOURCE_KEY_LEN = 17          # Fits a MAC string ("aa:bb:cc:dd:ee:ff") or an IPv4 address
+
+
+def record_dtype(num_subcarriers=64):
+    """Fixed-width row layout of a CSI recording."""
+    return np.dtype([
+        ("t", np.float64),                              # Unix time of arrival
+        ("source", f"S{SOURCE_KEY_LEN}"),               # Source key (MAC or IP)
+        ("amplitude", np.float32, (num_subcarriers,)),  # LLTF amplitude per subcarrier
+    ])
+
+
+class CSIRecorder:
+    """
+    Appends timestamped CSI frames to memory-mapped .npy chunk files.
+
+    Each chunk is preallocated to RECORD_CHUNK_ROWS rows; unused rows keep
+    t == 0 and are skipped by load_recording, so a crash never corrupts the
+    rows already written.
+    """
+
+    def __init__(self, directory, num_subcarriers=64, chunk_rows=RECORD_CHUNK_ROWS):
+        self.directory = directory
+        self.dtype = record_dtype(num_subcarriers)
+        self.chunk_rows = chunk_rows
+        os.makedirs(directory, exist_ok=True)
+        # Continue numbering after any chunks already in the directory
+        self.chunk_index = len(glob.glob(os.path.join(directory, "csi_*.npy")))
+        self.chunk = None
+        self.row = 0
+        self.rows_written = 0
+        self.last_flush = 0.0
+        self._open_chunk()
+
+    def _open_chunk(self):
+        if self.chunk is not None:
+            self.chunk.flush()
+            del self.chunk
+        path = os.path.join(self.directory, f"csi_{self.chunk_index:05d}.npy")
+        self.chunk = np.lib.format.open_memmap(path, mode="w+", dtype=self.dtype,
+                                               shape=(self.chunk_rows,))
+        self.chunk_index += 1
+        self.row = 0
+        print(f"💾 Recording CSI to {path}")
+
+    def append(self, timestamps, sources, amplitudes):
+        """
+        Write a batch of frames. timestamps and sources are 1-D sequences,
+        amplitudes is a (batch, subcarriers) array.
+        """
+        n = len(amplitudes)
+        start = 0
+        while start < n:
+            if self.row == self.chunk_rows:
+                self._open_chunk()
+            take = min(n - start, self.chunk_rows - self.row)
+            rows = self.chunk[self.row:self.row + take]
+            rows["t"] = timestamps[start:start + take]
+            rows["source"] = sources[start:start + take]
+            rows["amplitude"] = amplitudes[start:start + take]
+            self.row += take
+            start += take
+        self.rows_written += n
+
+        now = float(timestamps[-1]) if n else 0.0
+        if now - self.last_flush > RECORD_FLUSH_SECONDS:
+            self.chunk.flush()
+            self.last_flush = now
+
+    def close(self):
+        if self.chunk is not None:
+            self.chunk.flush()
+            del self.chunk
+            self.chunk = None
+        print(f"💾 Recorded {self.rows_written} CSI frames to {self.directory}")
+
+
+def load_recording(directory):
+    """
+    Memory-maps every chunk in a recording directory.
+    Returns a list of read-only structured arrays holding only written rows.
+    """
+    chunks = []
+    for path in sorted(glob.glob(os.path.join(directory, "csi_*.npy"))):
+        chunk = np.load(path, mmap_mode="r")
+        # Written rows form a prefix of the chunk
+        filled = int(np.count_nonzero(chunk["t"] > 0))
+        if filled:
+            chunks.append(chunk[:filled])
+    return chunks
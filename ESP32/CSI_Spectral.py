@@ -0,0 +1,165 @@
+"""
+Spectral (STFT) activity stage for the CSI receiver.
+
+Packets are averaged into fixed-rate samples, projected onto the strongest
+principal components across subcarriers, and a Hann-windowed FFT over the
+last SPECTRAL_WINDOW_SECONDS runs once per hop. The energy in the breathing
+and walking bands decides the reported state.
+
+Per-packet work is a running sum into the current sample bin; the FFT and
+the occasional PCA refresh only happen once per hop, so the cost per packet
+stays bounded however fast packets arrive (see CSI_Spectral_Benchmark.py).
+"""
+
+import time
+import numpy as np
+
+# --- Configuration ---
+SPECTRAL_RATE = 20             # Resampled rate (Hz); packets are averaged per bin
+SPECTRAL_WINDOW_SECONDS = 25.6 # STFT window; long enough to resolve breathing
+SPECTRAL_HOP_SECONDS = 1.0     # One spectral event per source per hop
+PCA_COMPONENTS = 3             # Principal components kept across subcarriers
+PCA_REFRESH_HOPS = 10          # Hops between PCA refits (refitting is lazy)
+MAX_GAP_SAMPLES = 10           # Gaps up to this long are filled by holding the last sample
+SPECTRAL_BUDGET_US = 50        # Target mean CPU time per packet (microseconds)
+
+# Frequency bands (Hz) and decision thresholds; tune on recorded data
+BREATHING_BAND = (0.1, 0.6)
+WALKING_BAND = (0.6, 3.0)
+AC_BAND_START = 0.05           # Anything slower is treated as drift
+WALKING_FRACTION = 0.5         # Walking band share of AC energy to report walking
+BREATHING_FRACTION = 0.3       # Breathing band share of AC energy to report breathing
+BREATHING_PEAK_RATIO = 4.0     # Breathing peak vs. median power in the AC bands
+
+
+class SpectralDetector:
+    """
+    Incremental STFT + PCA activity detector for one CSI source.
+    """
+
+    def __init__(self, num_subcarriers=64, rate=SPECTRAL_RATE,
+                 window_seconds=SPECTRAL_WINDOW_SECONDS, hop_seconds=SPECTRAL_HOP_SECONDS):
+        self.rate = rate
+        self.num_subcarriers = num_subcarriers
+        self.n = int(round(window_seconds * rate))
+        self.hop = max(1, int(round(hop_seconds * rate)))
+
+        # Resampled amplitudes and their PCA projection, both ring buffers
+        self.samples = np.zeros((self.n, num_subcarriers), dtype=np.float32)
+        self.projected = np.zeros((self.n, PCA_COMPONENTS), dtype=np.float32)
+        self.head = 0
+        self.filled = 0
+        self.since_hop = 0
+        self.hops = 0
+        self.components = None  # (subcarriers, PCA_COMPONENTS) or None until first fit
+
+        # Current resampling bin
+        self.bin_id = None
+        self.bin_sum = np.zeros(num_subcarriers, dtype=np.float64)
+        self.bin_count = 0
+
+        # Everything the FFT needs that does not depend on the data
+        self.window = np.hanning(self.n).astype(np.float32)[:, np.newaxis]
+        freqs = np.fft.rfftfreq(self.n, 1.0 / rate)
+        self.freqs = freqs
+        self.ac_band = freqs >= AC_BAND_START
+        self.breathing_band = (freqs >= BREATHING_BAND[0]) & (freqs < BREATHING_BAND[1])
+        self.walking_band = (freqs >= WALKING_BAND[0]) & (freqs < WALKING_BAND[1])
+        self.order = np.arange(self.n)
+
+        # CPU accounting for the budget check
+        self.packets = 0
+        self.busy_seconds = 0.0
+
+    def push(self, times, frames):
+        """
+        Feed frames (one source, arrival order) with their Unix timestamps.
+        Returns a list of spectral events produced by completed hops.
+        """
+        started = time.perf_counter()
+        events = []
+        bins = np.floor(np.asarray(times) * self.rate).astype(np.int64)
+        starts = np.r_[0, np.flatnonzero(np.diff(bins)) + 1]
+        sums = np.add.reduceat(np.asarray(frames, dtype=np.float64), starts, axis=0)
+        counts = np.diff(np.r_[starts, len(bins)])
+
+        # A batch only spans a handful of bins, so this loop is short
+        for bin_id, bin_sum, count in zip(bins[starts], sums, counts):
+            if bin_id != self.bin_id:
+                if self.bin_id is not None and self.bin_count:
+                    self._close_bin(bin_id, events)
+                self.bin_id = bin_id
+                self.bin_sum[:] = 0.0
+                self.bin_count = 0
+            self.bin_sum += bin_sum
+            self.bin_count += int(count)
+
+        self.packets += len(bins)
+        self.busy_seconds += time.perf_counter() - started
+        return events
+
+    def _close_bin(self, next_bin_id, events):
+        sample = self.bin_sum / self.bin_count
+        # Hold the sample across short gaps (dropped packets); restart after long ones
+        gap = int(next_bin_id - self.bin_id)
+        if gap > MAX_GAP_SAMPLES:
+            self.filled = 0
+            self.since_hop = 0
+            gap = 1
+        for _ in range(gap):
+            self._append(sample, events)
+
+    def _append(self, sample, events):
+        self.samples[self.head] = sample
+        if self.components is not None:
+            self.projected[self.head] = sample @ self.components
+        self.head = (self.head + 1) % self.n
+        self.filled = min(self.n, self.filled + 1)
+        self.since_hop += 1
+        if self.filled == self.n and self.since_hop >= self.hop:
+            self.since_hop = 0
+            events.append(self._analyze())
+
+    def _refit_pca(self, ordered):
+        """Top principal components of the window across subcarriers."""
+        centered = ordered - ordered.mean(axis=0)
+        cov = centered.T @ centered
+        _, vectors = np.linalg.eigh(cov)
+        self.components = np.ascontiguousarray(vectors[:, ::-1][:, :PCA_COMPONENTS], dtype=np.float32)
+        # Re-project the whole ring so every sample uses the same basis
+        self.projected[:] = self.samples @ self.components
+
+    def _analyze(self):
+        ordered_idx = (self.head + self.order) % self.n
+        if self.components is None or self.hops % PCA_REFRESH_HOPS == 0:
+            self._refit_pca(self.samples[ordered_idx])
+        self.hops += 1
+
+        x = self.projected[ordered_idx]
+        x = (x - x.mean(axis=0)) * self.window
+        power = (np.abs(np.fft.rfft(x, axis=0)) ** 2).sum(axis=1)
+
+        ac = power[self.ac_band].sum() or 1.0
+        breathing = power[self.breathing_band]
+        walking_fraction = power[self.walking_band].sum() / ac
+        breathing_fraction = breathing.sum() / ac
+        peak = int(np.argmax(breathing))
+        peak_ratio = breathing[peak] / (np.median(power[self.ac_band]) or 1.0)
+
+        if walking_fraction > WALKING_FRACTION:
+            state = "walking"
+        elif breathing_fraction > BREATHING_FRACTION and peak_ratio > BREATHING_PEAK_RATIO:
+            state = "breathing"
+        else:
+            state = "still"
+
+        return {
+            "time": (self.bin_id + 1) / self.rate,
+            "state": state,
+            "breathing_bpm": float(self.freqs[self.breathing_band][peak] * 60),
+            "breathing_fraction": float(breathing_fraction),
+            "walking_fraction": float(walking_fraction),
+        }
+
+    def cost_per_packet_us(self):
+        return 1e6 * self.busy_seconds / max(self.packets, 1)
@@ -0,0 +1,85 @@
+"""
+Benchmark for the CSI spectral stage.
+
+Feeds synthetic CSI (breathing, then walking, then an empty room) through
+SpectralDetector at several packet rates, in receiver-sized batches, and
+checks the mean CPU time per packet against SPECTRAL_BUDGET_US.
+
+Usage:
+    python CSI_Spectral_Benchmark.py [SECONDS]
+"""
+
+import sys
+import time
+import numpy as np
+
+from CSI_Spectral import SpectralDetector, SPECTRAL_BUDGET_US
+from CSI_Config import BATCH_SIZE, NUM_SUBCARRIERS
+
+PACKET_RATES = [100, 300, 1000]  # Packets per second to simulate
+
+
+def synthetic_csi(rate, seconds, rng):
+    """
+    Amplitudes with a 0.25 Hz breathing component in the first third,
+    1.5 Hz walking in the second and only noise in the last.
+    """
+    n = int(rate * seconds)
+    t = 1.7e9 + np.sort(rng.uniform(0, seconds, n))  # Jittered arrivals
+    rel = t - t[0]
+    gains = rng.normal(1.0, 0.3, NUM_SUBCARRIERS)
+    signal = np.zeros(n)
+    third = seconds / 3
+    breathing = rel < third
+    walking = (rel >= third) & (rel < 2 * third)
+    signal[breathing] = 3.0 * np.sin(2 * np.pi * 0.25 * rel[breathing])
+    signal[walking] = 6.0 * np.sin(2 * np.pi * 1.5 * rel[walking]) * rng.uniform(0.5, 1.5, walking.sum())
+    amp = 50 + signal[:, np.newaxis] * gains + rng.normal(0, 1.0, (n, NUM_SUBCARRIERS))
+    return t, amp.astype(np.float32), third
+
+
+def run(rate, seconds, rng):
+    times, amp, third = synthetic_csi(rate, seconds, rng)
+    detector = SpectralDetector(NUM_SUBCARRIERS)
+    events = []
+    worst_batch = 0.0
+    for i in range(0, len(times), BATCH_SIZE):
+        started = time.perf_counter()
+        events += detector.push(times[i:i + BATCH_SIZE], amp[i:i + BATCH_SIZE])
+        worst_batch = max(worst_batch, time.perf_counter() - started)
+
+    # Score states only where the whole STFT window lies inside one segment
+    start = times[0]
+    window = detector.n / detector.rate
+    correct = total = 0
+    for event in events:
+        t = event["time"] - start
+        for lo, expected in ((0, "breathing"), (third, "walking"), (2 * third, "still")):
+            if lo + window <= t <= lo + third:
+                total += 1
+                correct += event["state"] == expected
+    return detector, len(events), correct, total, worst_batch
+
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 180.0
+    rng = np.random.default_rng(0)
+    print(f"⏱️  Spectral stage benchmark: {seconds:.0f} s of CSI per rate, "
+          f"budget {SPECTRAL_BUDGET_US} µs/packet")
+    print("-" * 72)
+    ok = True
+    for rate in PACKET_RATES:
+        detector, n_events, correct, total, worst = run(rate, seconds, rng)
+        cost = detector.cost_per_packet_us()
+        within = cost <= SPECTRAL_BUDGET_US
+        ok &= within
+        print(f"{rate:5d} pkt/s: {cost:6.1f} µs/packet "
+              f"({100 * cost * rate / 1e6:.2f}% of a core), worst batch {1e3 * worst:.2f} ms, "
+              f"{n_events} events, {correct}/{total} states correct "
+              f"{'✅' if within else '❌ over budget'}")
+    print("-" * 72)
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,49 +1,220 @@
+import argparse
 import socket
+import threading
 import numpy as np
-import matplotlib.pyplot as plt
-from collections import deque
 import time
 
+from CSI_Config import BATCH_SIZE, CSI_WINDOW_SIZE, MOTION_THRESHOLD, NUM_SUBCARRIERS
+from CSI_Spectral import SpectralDetector
+
 # --- Configuration ---
 UDP_IP = "0.0.0.0"  # Listen on all available network interfaces
 UDP_PORT = 12345    # Must match the port in the ESP32 code
-CSI_WINDOW_SIZE = 200 # Number of CSI packets to hold for analysis
-MOTION_THRESHOLD = 25 # An empirical threshold. You WILL need to adjust this!
+PLOT_FPS = 20         # Render rate of the live plot, independent of packet rate
+INITIAL_SOURCES = 4   # Windows preallocated for CSI nodes; grows on demand
+
+# Nodes may prefix each packet with MAGIC + 6-byte MAC so several radios behind
+# one IP (or a node whose IP changes) keep separate windows. Without the prefix
+# the sender's IP address identifies the source.
+CSI_MAC_MAGIC = b"CSIM"
+CSI_MAC_HEADER_LEN = len(CSI_MAC_MAGIC) + 6
+
+# ESP32 CSI buffer layouts, selected by payload length in bytes.
+# Each subcarrier is two int8 values: imaginary part first, then real part.
+# Every layout is a list of (segment name, number of subcarriers) in buffer order.
+# Note: 384 bytes is also HT40 without STBC (LLTF + 128 HT-LTF); the HT20
+# STBC layout is assumed since that is what CSI_UDP_Logger.c enables on 20 MHz.
+CSI_SEGMENT_LAYOUTS = {
+    128: [("lltf", 64)],
+    256: [("lltf", 64), ("ht_ltf", 64)],
+    384: [("lltf", 64), ("ht_ltf", 64), ("stbc_ht_ltf", 64)],
+    640: [("lltf", 64), ("ht_ltf", 128), ("stbc_ht_ltf", 128)],
+}
+
+
+class CSIWindowBank:
+    """
+    Sliding windows of CSI frames for several sources at once, stored as one
+    (source x time x subcarrier) NumPy ring buffer.
+
+    Running per-subcarrier sums and sums of squares are updated as frames
+    enter and leave each window, so the variance costs O(subcarriers) per
+    packet instead of rebuilding and re-reducing the whole window.
+    """
+
+    def __init__(self, window_size=CSI_WINDOW_SIZE, num_subcarriers=NUM_SUBCARRIERS,
+                 capacity=INITIAL_SOURCES):
+        self.window_size = window_size
+        self.num_subcarriers = num_subcarriers
+        self.source_index = {}  # Source key -> row in the arrays below
+        self._allocate(capacity)
+
+    def _allocate(self, capacity):
+        """(Re)allocate per-source arrays, keeping existing sources."""
+        old = getattr(self, 'buffer', None)
+        n = 0 if old is None else len(self.source_index)
+        buffer = np.zeros((capacity, self.window_size, self.num_subcarriers), dtype=np.float64)
+        sums = np.zeros((capacity, self.num_subcarriers), dtype=np.float64)
+        sums_sq = np.zeros((capacity, self.num_subcarriers), dtype=np.float64)
+        head = np.zeros(capacity, dtype=np.int64)    # Next slot to overwrite
+        count = np.zeros(capacity, dtype=np.int64)   # Number of valid slots
+        pushed = np.zeros(capacity, dtype=np.int64)  # Frames since last exact resync
+        if n:
+            buffer[:n] = self.buffer[:n]
+            sums[:n] = self.sum[:n]
+            sums_sq[:n] = self.sum_sq[:n]
+            head[:n] = self.head[:n]
+            count[:n] = self.count[:n]
+            pushed[:n] = self.pushed[:n]
+        self.buffer, self.sum, self.sum_sq = buffer, sums, sums_sq
+        self.head, self.count, self.pushed = head, count, pushed
+
+    def source_id(self, key):
+        """Index of a source, registering it on first sight."""
+        idx = self.source_index.get(key)
+        if idx is None:
+            idx = len(self.source_index)
+            if idx == len(self.buffer):
+                self._allocate(2 * len(self.buffer))
+            self.source_index[key] = idx
+            print(f"New CSI source: {key}")
+        return idx
+
+    @property
+    def num_sources(self):
+        return len(self.source_index)
+
+    def push_batch(self, source_ids, frames):
+        """
+        Add a batch of frames; source_ids[i] is the source index of frames[i].
+        Frames of one source must be in arrival order.
+        """
+        source_ids = np.asarray(source_ids, dtype=np.int64)
+        frames = np.asarray(frames, dtype=np.float64).reshape(-1, self.num_subcarriers)
+        if len(frames) == 0:
+            return
+        w = self.window_size
+
+        # Group by source, keeping arrival order inside each group
+        order = np.argsort(source_ids, kind='stable')
+        src = source_ids[order]
+        frames = frames[order]
+        sources, starts, counts = np.unique(src, return_index=True, return_counts=True)
+        rank = np.arange(len(src)) - np.repeat(starts, counts)
+
+        # Only the newest window_size frames of each source can survive the batch
+        skip = np.repeat(np.maximum(counts - w, 0), counts)
+        keep = rank >= skip
+        src, frames, rank = src[keep], frames[keep], (rank - skip)[keep]
+        added = np.minimum(counts, w)
+
+        # Slots that still hold a valid (oldest) frame are evicted. A window
+        # that is not full has head == count, so its first w - count slots are empty.
+        rows = (self.head[src] + rank) % w
+        evict = rank >= (w - self.count[src])
+        if evict.any():
+            old = self.buffer[src[evict], rows[evict]]
+            np.subtract.at(self.sum, src[evict], old)
+            np.subtract.at(self.sum_sq, src[evict], old * old)
+
+        self.buffer[src, rows] = frames
+        np.add.at(self.sum, src, frames)
+        np.add.at(self.sum_sq, src, frames * frames)
+        self.head[sources] = (self.head[sources] + added) % w
+        self.count[sources] = np.minimum(self.count[sources] + added, w)
+
+        # Re-derive the sums exactly once per window to stop float drift.
+        # Empty slots are zero, so summing the whole window is always exact.
+        self.pushed[sources] += added
+        stale = sources[self.pushed[sources] >= w]
+        if len(stale):
+            window = self.buffer[stale]
+            self.sum[stale] = window.sum(axis=1)
+            self.sum_sq[stale] = np.einsum('stc,stc->sc', window, window)
+            self.pushed[stale] = 0
+
+    def is_full(self):
+        """Boolean mask of sources whose window is full."""
+        n = self.num_sources
+        return self.count[:n] == self.window_size
+
+    def variance(self):
+        """(sources x subcarriers) population variance of each window."""
+        n = self.num_sources
+        count = np.maximum(self.count[:n], 1)[:, np.newaxis]
+        mean = self.sum[:n] / count
+        return np.maximum(self.sum_sq[:n] / count - mean * mean, 0.0)
+
+    def mean_variance(self):
+        """Motion score of each source: mean of its per-subcarrier variances."""
+        return self.variance().mean(axis=1)
+
 
 # --- Global Variables ---
-csi_data_deque = deque(maxlen=CSI_WINDOW_SIZE)
+csi_windows = CSIWindowBank()
 last_motion_time = 0
+latest_csi = None      # Most recent LLTF amplitude frame (any source), read by the renderer
+latest_csi_seq = 0     # Bumped by the ingest thread on every new frame
+stop_event = threading.Event()
+spectral_detectors = {}  # Source index -> SpectralDetector
+spectral_states = {}     # Source index -> last reported spectral state
+
+def decode_csi(data: bytes):
+    """
+    Decodes a raw ESP32 CSI buffer into per-subcarrier amplitude and phase.
+
+    Returns (amplitude, phase, segments) where segments maps each segment
+    name to a slice into the two arrays, or None if the buffer is unusable.
+    """
+    # View the buffer as (imag, real) int8 pairs without copying
+    if len(data) < 2 * NUM_SUBCARRIERS or len(data) % 2:
+        return None
+    iq = np.frombuffer(data, dtype=np.int8).reshape(-1, 2)
+    csi = iq[:, 1].astype(np.float32) + 1j * iq[:, 0].astype(np.float32)
+
+    layout = CSI_SEGMENT_LAYOUTS.get(len(data))
+    if layout is None:
+        # Unknown layout: the LLTF block always comes first
+        layout = [("lltf", NUM_SUBCARRIERS)]
+        if len(csi) > NUM_SUBCARRIERS:
+            layout.append(("extra", len(csi) - NUM_SUBCARRIERS))
 
-# --- Matplotlib Setup for Real-time Plotting ---
-plt.ion()
-fig, ax = plt.subplots()
-line, = ax.plot([], [], alpha=0.8)
-ax.set_ylim(-128, 127) # Raw CSI values are signed 8-bit integers
-ax.set_xlim(0, 64)      # ESP32 provides 64 subcarriers of data for LLTF
-ax.set_title("Real-time CSI Amplitude (First 64 Subcarriers)")
-ax.set_xlabel("Subcarrier Index")
-ax.set_ylabel("Amplitude (I value)")
-fig.canvas.draw()
-plt.show(block=False)
+    amplitude = np.abs(csi)
+    phase = np.angle(csi)
+    segments = {}
+    start = 0
+    for name, length in layout:
+        seg = slice(start, start + length)
+        # Unwrap within a segment only; segments are separate training fields
+        phase[seg] = np.unwrap(phase[seg])
+        segments[name] = seg
+        start += length
+
+    return amplitude, phase, segments
+
+
+def split_source(data: bytes, addr):
+    """
+    Returns (source key, CSI payload) for a received packet.
+    """
+    if (data[:len(CSI_MAC_MAGIC)] == CSI_MAC_MAGIC
+            and len(data) - CSI_MAC_HEADER_LEN in CSI_SEGMENT_LAYOUTS):
+        mac = data[len(CSI_MAC_MAGIC):CSI_MAC_HEADER_LEN].hex(':')
+        return mac, data[CSI_MAC_HEADER_LEN:]
+    return addr[0], data
 
 
 def process_csi_data(data: bytes):
     """
     Processes a raw CSI byte packet from the ESP32.
+    Returns the LLTF amplitude of each subcarrier used for motion detection.
     """
     try:
-        # The ESP32 sends raw bytes. We interpret them as signed 8-bit integers.
-        # CSI data consists of I and Q values for each subcarrier.
-        csi_raw = np.frombuffer(data, dtype=np.int8)
-
-        # The data represents complex numbers (I + jQ).
-        # For this visualization and simple motion detection, we'll just use the
-        # 'I' values from the first 64 subcarriers (LLTF format).
-        # This corresponds to the first 64 bytes of the payload.
-        if len(csi_raw) >= 64:
-            return csi_raw[:64]
-        else:
+        decoded = decode_csi(data)
+        if decoded is None:
             return None
+        amplitude, _, segments = decoded
+        return amplitude[segments["lltf"]]
 
     except Exception as e:
         print(f"Error processing CSI data: {e}")
@@ -51,73 +222,218 @@ def process_csi_data(data: bytes):
 
 def detect_motion():
     """
-    Analyzes the variance in the CSI data deque to detect motion.
+    Fuses the per-link CSI variances into one motion score.
     """
     global last_motion_time
-    # Wait until the buffer is full to have a stable baseline
-    if len(csi_data_deque) < CSI_WINDOW_SIZE:
+    # Only links with a full window have a stable baseline
+    ready = csi_windows.is_full()
+    if not ready.any():
         return
 
-    # Convert deque to a NumPy array for efficient calculation
-    # Shape will be (CSI_WINDOW_SIZE, 64_subcarriers)
-    csi_matrix = np.array(csi_data_deque)
-
-    # Calculate the variance for each subcarrier across the time window
-    variances = np.var(csi_matrix, axis=0)
-
-    # Calculate the mean of these variances. This gives a single value
-    # representing the overall signal instability.
-    mean_variance = np.mean(variances)
+    # The windows keep running sums, so each link's mean variance is
+    # available without touching its buffer. Averaging across the ready
+    # links gives a single value for the overall signal instability.
+    link_scores = csi_windows.mean_variance()[ready]
+    fused_score = float(link_scores.mean())
 
     # Check if the instability exceeds our threshold
-    if mean_variance > MOTION_THRESHOLD:
+    if fused_score > MOTION_THRESHOLD:
         # To avoid constant printing, only report motion once per second
         current_time = time.time()
         if current_time - last_motion_time > 1:
-            print(f"MOTION DETECTED! (Variance: {mean_variance:.2f})")
+            active = int((link_scores > MOTION_THRESHOLD).sum())
+            print(f"MOTION DETECTED! (Variance: {fused_score:.2f}, "
+                  f"{active}/{len(link_scores)} links)")
             last_motion_time = current_time
 
+class CSIPlot:
+    """
+    Live CSI amplitude plot that redraws only the line artist (blitting).
+    matplotlib is imported here so headless runs never load it.
+    """
+
+    def __init__(self):
+        import matplotlib.pyplot as plt
+        self.plt = plt
+
+        plt.ion()
+        self.fig, self.ax = plt.subplots()
+        self.line, = self.ax.plot(np.arange(NUM_SUBCARRIERS), np.zeros(NUM_SUBCARRIERS),
+                                  alpha=0.8, animated=True)
+        self.ax.set_ylim(0, 182)    # |I + jQ| for signed 8-bit I and Q
+        self.ax.set_xlim(0, 64)      # ESP32 provides 64 subcarriers of data for LLTF
+        self.ax.set_title("Real-time CSI Amplitude (LLTF, 64 Subcarriers)")
+        self.ax.set_xlabel("Subcarrier Index")
+        self.ax.set_ylabel("Amplitude |H|")
+        plt.show(block=False)
+
+        self.background = None
+        # A full redraw (first show, resize) invalidates the cached background
+        self.fig.canvas.mpl_connect('draw_event', self._on_draw)
+        self.fig.canvas.draw()
+
+    def _on_draw(self, event):
+        self.background = self.fig.canvas.copy_from_bbox(self.ax.bbox)
+        self.ax.draw_artist(self.line)
+
+    def is_open(self):
+        return self.plt.fignum_exists(self.fig.number)
+
+    def update(self, csi_values):
+        canvas = self.fig.canvas
+        if self.background is not None:
+            canvas.restore_region(self.background)
+            self.line.set_ydata(csi_values)
+            self.ax.draw_artist(self.line)
+            canvas.blit(self.ax.bbox)
+        canvas.flush_events()
+
+    def close(self):
+        self.plt.close('all')
+
+
+def detect_activity(source_ids, times, frames):
+    """
+    Feeds the spectral stage per source and reports activity changes.
+    """
+    for idx in np.unique(source_ids):
+        detector = spectral_detectors.get(idx)
+        if detector is None:
+            detector = spectral_detectors[idx] = SpectralDetector(NUM_SUBCARRIERS)
+        rows = source_ids == idx
+        for event in detector.push(times[rows], frames[rows]):
+            # Events arrive every hop; only print when the state changes
+            if spectral_states.get(idx) != event["state"]:
+                spectral_states[idx] = event["state"]
+                detail = f", ~{event['breathing_bpm']:.0f} breaths/min" if event["state"] == "breathing" else ""
+                print(f"ACTIVITY [source {idx}]: {event['state']}{detail}")
+
+
+def ingest_loop(sock, recorder=None):
+    """
+    Receives CSI packets and runs detection; never waits on the GUI.
+    """
+    global latest_csi, latest_csi_seq
+
+    batch = np.empty((BATCH_SIZE, NUM_SUBCARRIERS), dtype=np.float64)
+    batch_sources = np.empty(BATCH_SIZE, dtype=np.int64)
+    batch_times = np.empty(BATCH_SIZE, dtype=np.float64)
+    batch_keys = [None] * BATCH_SIZE
+    while not stop_event.is_set():
+        try:
+            # Block for the first packet, then drain whatever else is queued
+            # so the window and detector are updated once per batch.
+            sock.settimeout(0.5)
+            try:
+                data, addr = sock.recvfrom(4096)
+            except socket.timeout:
+                continue
+            sock.setblocking(False)
+            n = 0
+            while True:
+                source, payload = split_source(data, addr)
+                csi_values = process_csi_data(payload)
+                if csi_values is not None:
+                    batch[n] = csi_values
+                    batch_sources[n] = csi_windows.source_id(source)
+                    batch_times[n] = time.time()
+                    if recorder is not None:
+                        batch_keys[n] = source
+                    n += 1
+                if n == BATCH_SIZE:
+                    break
+                try:
+                    data, addr = sock.recvfrom(4096)
+                except BlockingIOError:
+                    break
+
+            if n:
+                csi_windows.push_batch(batch_sources[:n], batch[:n])
+                if recorder is not None:
+                    recorder.append(batch_times[:n], batch_keys[:n], batch[:n])
+                # Publish a copy; the batch buffer is reused
+                latest_csi = batch[n - 1].copy()
+                latest_csi_seq += 1
+
+                # Run motion detection once per batch of packets
+                detect_motion()
+                detect_activity(batch_sources[:n], batch_times[:n], batch[:n])
+
+        except Exception as e:
+            print(f"An error occurred in the ingest loop: {e}")
+
+
+def render_loop(plot):
+    """
+    Redraws the plot at PLOT_FPS with whatever frame is newest.
+    """
+    frame_interval = 1.0 / PLOT_FPS
+    next_frame = time.monotonic()
+    drawn_seq = 0
+    while not stop_event.is_set() and plot.is_open():
+        if latest_csi_seq != drawn_seq:
+            drawn_seq = latest_csi_seq
+            plot.update(latest_csi)
+        else:
+            # Keep the window responsive even when no data arrives
+            plot.fig.canvas.flush_events()
+
+        next_frame += frame_interval
+        delay = next_frame - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        else:
+            next_frame = time.monotonic()
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Real-time CSI motion detection over UDP")
+    parser.add_argument("--headless", action="store_true",
+                        help="run without matplotlib (no plot at all)")
+    parser.add_argument("--record", metavar="DIR",
+                        help="append every decoded frame to memory-mapped files in DIR "
+                             "for offline tuning with CSI_Offline_Analyzer.py")
+    return parser.parse_args()
+
 def main():
     """
     Main function to set up UDP server and process incoming data.
     """
+    args = parse_args()
+
     # Create a UDP socket
     sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
     # Bind the socket to the IP and port
     sock.bind((UDP_IP, UDP_PORT))
     print(f"Listening for CSI data on UDP port {UDP_PORT}...")
 
-    packet_count = 0
-    while True:
-        try:
-            # Receive data, buffer size is set to handle large packets
-            data, addr = sock.recvfrom(4096)
-            packet_count += 1
-
-            csi_values = process_csi_data(data)
+    recorder = None
+    if args.record:
+        from CSI_Recorder import CSIRecorder
+        recorder = CSIRecorder(args.record, NUM_SUBCARRIERS)
 
-            if csi_values is not None:
-                csi_data_deque.append(csi_values)
+    # Ingest runs on its own thread; the GUI (if any) stays on the main thread
+    ingest_thread = threading.Thread(target=ingest_loop, args=(sock, recorder), daemon=True)
+    ingest_thread.start()
 
-                # Update plot periodically to avoid overwhelming the CPU
-                # A high packet rate can make matplotlib slow.
-                if packet_count % 10 == 0:
-                    line.set_ydata(csi_values)
-                    line.set_xdata(np.arange(len(csi_values)))
-                    fig.canvas.draw()
-                    fig.canvas.flush_events()
-
-                # Run motion detection algorithm on every packet
-                detect_motion()
-
-        except KeyboardInterrupt:
-            print("\nStopping receiver...")
-            break
-        except Exception as e:
-            print(f"An error occurred in the main loop: {e}")
+    plot = None
+    try:
+        if args.headless:
+            print("Running headless (no plot)")
+            while ingest_thread.is_alive():
+                ingest_thread.join(timeout=1.0)
+        else:
+            plot = CSIPlot()
+            render_loop(plot)
+    except KeyboardInterrupt:
+        print("\nStopping receiver...")
 
+    stop_event.set()
+    ingest_thread.join(timeout=2.0)
     sock.close()
-    plt.close('all')
+    if recorder is not None:
+        recorder.close()
+    if plot is not None:
+        plot.close()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
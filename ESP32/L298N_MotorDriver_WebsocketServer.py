@@ -1,65 +1,36 @@
 import asyncio
 import websockets
-import socket
-import threading
-import json
+import time
 from datetime import datetime
 
+from ws_broadcast import Broadcaster
+from udp_discovery import start_discovery, default_ip
+from command_tracker import CommandTracker
+
+# Watchdog configuration
+REFRESH_HZ = 2              # Resend the current command this often so the ESP32 timeout never fires
+COMMAND_HOLD_SECONDS = 3.0  # Typed movement commands stop after this unless re-entered
+STATUS_SECONDS = 10         # Print per-ESP32 command age and RTT this often
+
 class RobotControlServer:
     def __init__(self):
         self.running = True
         self.client_connected = False
         self.last_command = 'S'
         self.command_count = 0
+        self.last_entered_time = 0.0      # When the operator last entered a command (monotonic)
+        self.tracker = CommandTracker()   # Sequence numbers, acks and RTT per ESP32
         
-    def start_udp_discovery(self, udp_port=8888, ws_port=8765):
-        """UDP discovery service - responds to ESP32 discovery packets"""
-        udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        udp_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        udp_socket.bind(('0.0.0.0', udp_port))
-        udp_socket.settimeout(1.0)
-        
-        print(f"🔍 UDP Discovery service running on port {udp_port}")
-        
-        while self.running:
-            try:
-                data, addr = udp_socket.recvfrom(1024)
-                message = data.decode('utf-8').strip()
-                
-                if message == "DISCOVER_SERVER":
-                    print(f"📡 Discovery request from {addr[0]}:{addr[1]}")
-                    
-                    # Send server info back
-                    response = json.dumps({
-                        "type": "SERVER_INFO",
-                        "ws_port": ws_port,
-                        "ip": self.get_local_ip()
-                    })
-                    
-                    udp_socket.sendto(response.encode('utf-8'), addr)
-                    print(f"✅ Sent server info to {addr[0]}")
-                    
-            except socket.timeout:
-                continue
-            except Exception as e:
-                if self.running:
-                    print(f"❌ UDP Discovery error: {e}")
-        
-        udp_socket.close()
-        print("🔍 UDP Discovery service stopped")
+    def on_discovery(self, message, addr, reply):
+        """Log a discovery request answered by the asyncio responder"""
+        print(f"📡 Discovery request ({message}) from {addr[0]}:{addr[1]}")
+        print(f"✅ Sent {reply.decode()} to {addr[0]}")
     
     def get_local_ip(self):
-        """Get local IP address"""
-        try:
-            s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-            s.connect(("8.8.8.8", 80))
-            ip = s.getsockname()[0]
-            s.close()
-            return ip
-        except:
-            return "192.168.137.1"
+        """Get local IP address (default-route interface, looked up once)"""
+        return default_ip()
     
-    async def handle_client(self, websocket):
+    async def handle_client(self, websocket, channel):
         """Handle WebSocket connection from ESP32"""
         client_ip = websocket.remote_address[0] if websocket.remote_address else "unknown"
         print(f"\n🤖 ESP32 connected from {client_ip}")
@@ -67,16 +38,18 @@ class RobotControlServer:
         self.client_connected = True
         
         # Send initial STOP command
-        try:
-            await websocket.send('S')
-            print("📤 Sent initial STOP command")
-        except:
-            pass
+        channel.put('S')
+        print("📤 Sent initial STOP command")
+        self.tracker.add(websocket)
         
         try:
             # Keep connection alive and handle any responses from ESP32
             async for message in websocket:
-                print(f"📥 Received from ESP32: {message}")
+                if not self.tracker.on_message(websocket, message, time.monotonic()):
+                    print(f"📥 Received from ESP32: {message}")
+                    if self.tracker.is_enveloped(websocket) and channel.format is None:
+                        channel.format = "seq"
+                        print(f"🔢 ESP32 {client_ip} acknowledges sequence-numbered commands")
                 
         except websockets.exceptions.ConnectionClosed:
             print(f"\n🔌 ESP32 {client_ip} disconnected")
@@ -84,19 +57,56 @@ class RobotControlServer:
         except Exception as e:
             print(f"❌ Error with ESP32 {client_ip}: {e}")
             self.client_connected = False
+        finally:
+            self.tracker.remove(websocket)
     
-    async def send_command(self, websocket, command):
-        """Send command to ESP32"""
-        try:
-            await websocket.send(command.upper())
-            self.command_count += 1
-            self.last_command = command.upper()
-            timestamp = datetime.now().strftime('%H:%M:%S.%f')[:-3]
-            print(f"📤 [{timestamp}] Sent: '{command.upper()}' (#{self.command_count})")
-            return True
-        except Exception as e:
-            print(f"❌ Failed to send command: {e}")
-            return False
+    def report_rtt(self, connected_clients, now):
+        """Print command age and live p50/p99 RTT for each ESP32"""
+        for websocket in connected_clients.channels:
+            client_ip = websocket.remote_address[0] if websocket.remote_address else "unknown"
+            print(f"⏱️  {client_ip}: {self.tracker.summary(websocket, now)}")
+    
+    def send_command(self, connected_clients, command):
+        """Queue command for every connected ESP32; each client's writer task sends it"""
+        now = time.monotonic()
+        count = connected_clients.broadcast(command.upper(), {"seq": self.tracker.sent(command.upper(), now)})
+        self.command_count += 1
+        self.last_command = command.upper()
+        self.last_entered_time = now
+        timestamp = datetime.now().strftime('%H:%M:%S.%f')[:-3]
+        print(f"📤 [{timestamp}] Sent: '{command.upper()}' to {count} client(s) (#{self.command_count})")
+        return count > 0
+    
+    def on_evict(self, websocket, reason):
+        client_ip = websocket.remote_address[0] if websocket.remote_address else "unknown"
+        print(f"⚠️  Dropping slow ESP32 {client_ip}: {reason}")
+    
+    async def watchdog_loop(self, connected_clients):
+        """Refresh the current command, stop held commands that expire, check acks"""
+        interval = 1.0 / REFRESH_HZ
+        next_status = time.monotonic() + STATUS_SECONDS
+        while self.running:
+            await asyncio.sleep(interval)
+            now = time.monotonic()
+            if self.last_command != 'S' and now - self.last_entered_time > COMMAND_HOLD_SECONDS:
+                print(f"\n⏱️  '{self.last_command}' held for {COMMAND_HOLD_SECONDS} s - stopping "
+                      f"(re-enter the command or press Enter to keep going)")
+                self.send_command(connected_clients, 'S')
+            elif connected_clients:
+                connected_clients.broadcast(self.last_command, {"seq": self.tracker.sent(self.last_command, now)})
+            
+            # Lost commands: resend the current state (commands are idempotent)
+            for websocket in self.tracker.expire(now):
+                channel = connected_clients.channels.get(websocket)
+                if channel is not None:
+                    channel.put(self.tracker.sent(self.last_command, now, [websocket]))
+            for websocket, age in self.tracker.stale_clients(now):
+                client_ip = websocket.remote_address[0] if websocket.remote_address else "unknown"
+                print(f"⚠️  ESP32 {client_ip} has not acknowledged a command for {age:.1f} s")
+            
+            if now >= next_status:
+                self.report_rtt(connected_clients, now)
+                next_status = now + STATUS_SECONDS
     
     async def command_input_handler(self, connected_clients):
         """Handle terminal input and send commands to ESP32"""
@@ -111,7 +121,8 @@ class RobotControlServer:
         print("  X - Backward")
         print("  Q - Quit server")
         print("="*60)
-        print("💡 Type command and press Enter\n")
+        print("💡 Type command and press Enter")
+        print(f"💡 Movement stops after {COMMAND_HOLD_SECONDS:g} s; press Enter to repeat the last command\n")
         
         loop = asyncio.get_event_loop()
         
@@ -119,7 +130,7 @@ class RobotControlServer:
             try:
                 # Read input asynchronously
                 command = await loop.run_in_executor(None, input, "Enter command: ")
-                command = command.strip().upper()
+                command = command.strip().upper() or self.last_command
                 
                 if command == 'Q':
                     print("\n🛑 Shutting down server...")
@@ -128,9 +139,7 @@ class RobotControlServer:
                 
                 if command in ['W', 'S', 'A', 'D', 'X']:
                     if connected_clients:
-                        # Send to all connected clients
-                        for client in connected_clients:
-                            await self.send_command(client, command)
+                        self.send_command(connected_clients, command)
                     else:
                         print("⚠️  No ESP32 connected!")
                 else:
@@ -155,20 +164,17 @@ class RobotControlServer:
         print(f"📡 ESP32 will auto-discover this server")
         print("="*60 + "\n")
         
-        # Start UDP discovery in separate thread
-        udp_thread = threading.Thread(
-            target=self.start_udp_discovery,
-            args=(udp_port, ws_port),
-            daemon=True
-        )
-        udp_thread.start()
+        # UDP discovery answers on this event loop
+        discovery, _ = await start_discovery(udp_port, ws_port, self.on_discovery)
+        print(f"🔍 UDP Discovery service running on port {udp_port}")
         
-        connected_clients = set()
+        # Latest-value outbox per client: only the newest command is worth sending
+        connected_clients = Broadcaster(latest_only=True, on_evict=self.on_evict)
         
         async def handle_client_wrapper(websocket):
-            connected_clients.add(websocket)
+            channel = connected_clients.add(websocket)
             try:
-                await self.handle_client(websocket)
+                await self.handle_client(websocket, channel)
             finally:
                 connected_clients.remove(websocket)
         
@@ -185,13 +191,18 @@ class RobotControlServer:
                 print(f"✅ WebSocket server running on port {ws_port}")
                 print("⏳ Waiting for ESP32 connection...\n")
                 
-                # Start command input handler
-                await self.command_input_handler(connected_clients)
+                # Start command input handler alongside the watchdog
+                watchdog = asyncio.create_task(self.watchdog_loop(connected_clients))
+                try:
+                    await self.command_input_handler(connected_clients)
+                finally:
+                    watchdog.cancel()
                 
         except Exception as e:
             print(f"❌ Server error: {e}")
         finally:
             self.running = False
+            discovery.close()
             print("\n🔚 Server shutdown complete")
 
 def main():
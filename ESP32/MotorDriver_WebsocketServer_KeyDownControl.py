@@ -1,68 +1,86 @@
+import argparse
 import asyncio
 import websockets
-import socket
-import threading
-import json
+import struct
+import time
 from datetime import datetime
 from pynput import keyboard
 
+from ws_broadcast import Broadcaster
+from udp_discovery import start_discovery, default_ip
+from command_tracker import CommandTracker
+
+# Control loop configuration
+CONTROL_HZ = 50           # Key state is turned into at most one command per tick
+KEEPALIVE_SECONDS = 0.5   # Resend the current command this often even if unchanged
+# Dead-man: held keys are released together when no movement key event (press, auto-repeat
+# or release) arrives for this long (--key-timeout SECONDS; --no-key-timeout for keyboards
+# that send no auto-repeat). Only the last pressed key repeats, so after letting go of one of
+# two held keys the other one stops after this timeout; pressing it again resumes.
+KEY_STALE_SECONDS = 0.75
+STATUS_SECONDS = 10       # Print per-ESP32 command age and RTT this often
+
+MOVEMENT_KEYS = ['W', 'A', 'S', 'D', 'X']
+
+# Proportional drive (--proportional): keys ramp speed/steer instead of switching letters
+RAMP_UP_PER_SECOND = 2.0     # Holding a key reaches full speed/steer in 0.5 s
+RAMP_DOWN_PER_SECOND = 4.0   # Releasing it returns to zero in 0.25 s
+DEADBAND = 10                # Percent change needed before a new frame is sent
+LETTER_THRESHOLD = 20        # Percent below which letter-only clients get 'S'
+PROP_MAGIC = 0xD1
+PROP_FRAME = struct.Struct('<BHbb')  # magic, seq, speed %, steer % (5 bytes)
+
+
+def ramp(value, target, dt):
+    """Move value toward target; faster when heading back toward zero"""
+    rate = RAMP_UP_PER_SECOND if abs(target) > abs(value) and target * value >= 0 else RAMP_DOWN_PER_SECOND
+    step = rate * dt
+    return value + max(-step, min(step, target - value))
+
+
+def letter_for(drive):
+    """Nearest W/A/S/D/X command for a (speed %, steer %) pair"""
+    speed, steer = drive
+    if max(abs(speed), abs(steer)) < LETTER_THRESHOLD:
+        return 'S'
+    if abs(steer) > abs(speed):
+        return 'D' if steer > 0 else 'A'
+    return 'W' if speed > 0 else 'X'
+
+
 class RobotControlServer:
-    def __init__(self):
+    def __init__(self, proportional=False, key_timeout=KEY_STALE_SECONDS):
         self.running = True
+        self.proportional = proportional
+        self.key_timeout = key_timeout  # None disables the dead-man key check
         self.client_connected = False
         self.last_command = 'S'
+        self.last_sent_time = 0.0
+        self.last_letter_time = 0.0  # Letter-only clients get keepalives on their own clock
         self.command_count = 0
-        self.connected_clients = set()
-        self.pressed_keys = set()  # Track currently pressed keys
+        # Per-client latest-value outboxes; a slow ESP32 cannot stall the tick
+        self.connected_clients = Broadcaster(latest_only=True, on_evict=self.on_evict)
+        self.pressed_keys = []  # Currently pressed keys, most recent last (loop thread only)
+        self.last_key_event = 0.0  # Monotonic time of the latest movement key event
+        self.tracker = CommandTracker()  # Sequence numbers, acks and RTT per ESP32
         
-    def start_udp_discovery(self, udp_port=8888, ws_port=8765):
-        """UDP discovery service - responds to ESP32 discovery packets"""
-        udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        udp_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        udp_socket.bind(('0.0.0.0', udp_port))
-        udp_socket.settimeout(1.0)
-        
-        print(f"🔍 UDP Discovery service running on port {udp_port}")
-        
-        while self.running:
-            try:
-                data, addr = udp_socket.recvfrom(1024)
-                message = data.decode('utf-8').strip()
-                
-                if message == "DISCOVER_SERVER":
-                    print(f"📡 Discovery request from {addr[0]}:{addr[1]}")
-                    
-                    # Send server info back
-                    response = json.dumps({
-                        "type": "SERVER_INFO",
-                        "ws_port": ws_port,
-                        "ip": self.get_local_ip()
-                    })
-                    
-                    udp_socket.sendto(response.encode('utf-8'), addr)
-                    print(f"✅ Sent server info to {addr[0]}")
-                    
-            except socket.timeout:
-                continue
-            except Exception as e:
-                if self.running:
-                    print(f"❌ UDP Discovery error: {e}")
+        # Proportional drive state (fractions of full scale) and bandwidth accounting
+        self.speed = 0.0
+        self.steer = 0.0
+        self.sent_drive = (0, 0)  # Last (speed %, steer %) sent
+        self.drive_ticks = 0      # Ticks with a client connected (naive streaming would send each)
+        self.drive_frames = 0     # Frames actually sent
         
-        udp_socket.close()
-        print("🔍 UDP Discovery service stopped")
+    def on_discovery(self, message, addr, reply):
+        """Log a discovery request answered by the asyncio responder"""
+        print(f"📡 Discovery request ({message}) from {addr[0]}:{addr[1]}")
+        print(f"✅ Sent {reply.decode()} to {addr[0]}")
     
     def get_local_ip(self):
-        """Get local IP address"""
-        try:
-            s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-            s.connect(("8.8.8.8", 80))
-            ip = s.getsockname()[0]
-            s.close()
-            return ip
-        except:
-            return "192.168.137.1"
+        """Get local IP address (default-route interface, looked up once)"""
+        return default_ip()
     
-    async def handle_client(self, websocket):
+    async def handle_client(self, websocket, channel):
         """Handle WebSocket connection from ESP32"""
         client_ip = websocket.remote_address[0] if websocket.remote_address else "unknown"
         print(f"\n🤖 ESP32 connected from {client_ip}")
@@ -70,16 +88,22 @@ class RobotControlServer:
         self.client_connected = True
         
         # Send initial STOP command
-        try:
-            await websocket.send('S')
-            print("📤 Sent initial STOP command")
-        except:
-            pass
+        channel.put('S')
+        print("📤 Sent initial STOP command")
+        self.tracker.add(websocket)
         
         try:
             # Keep connection alive and handle any responses from ESP32
             async for message in websocket:
-                print(f"📥 Received from ESP32: {message}")
+                if not self.tracker.on_message(websocket, message, time.monotonic()):
+                    print(f"📥 Received from ESP32: {message}")
+                    if self.proportional and "PROP" in self.tracker.capabilities(websocket) \
+                            and channel.format != "prop":
+                        channel.format = "prop"
+                        print(f"🎚️  ESP32 {client_ip} takes proportional speed/steer frames")
+                    elif self.tracker.is_enveloped(websocket) and channel.format is None:
+                        channel.format = "seq"
+                        print(f"🔢 ESP32 {client_ip} acknowledges sequence-numbered commands")
                 
         except websockets.exceptions.ConnectionClosed:
             print(f"\n🔌 ESP32 {client_ip} disconnected")
@@ -87,25 +111,72 @@ class RobotControlServer:
         except Exception as e:
             print(f"❌ Error with ESP32 {client_ip}: {e}")
             self.client_connected = False
+        finally:
+            self.tracker.remove(websocket)
+    
+    def report_rtt(self, now):
+        """Print command age and live p50/p99 RTT for each ESP32"""
+        for websocket in self.connected_clients.channels:
+            client_ip = websocket.remote_address[0] if websocket.remote_address else "unknown"
+            print(f"⏱️  {client_ip}: {self.tracker.summary(websocket, now)}")
+        if self.proportional and self.drive_ticks:
+            sent = self.drive_frames * PROP_FRAME.size
+            naive = self.drive_ticks * PROP_FRAME.size
+            print(f"📉 Drive frames: {self.drive_frames} sent in {self.drive_ticks} ticks, "
+                  f"{sent} B vs {naive} B streaming at {CONTROL_HZ} Hz ({100 * (1 - sent / naive):.0f}% saved)")
+    
+    def encode_state(self, command, now, websockets=None, letters=True):
+        """Per-format encodings of the current state, under a new sequence number"""
+        if not letters:
+            # Drive-only update: track it for the proportional clients that receive it
+            websockets = [ws for ws, channel in self.connected_clients.channels.items()
+                          if channel.format == "prop"]
+        variants = {"seq": self.tracker.sent(command, now, websockets)}
+        if self.proportional:
+            variants["prop"] = PROP_FRAME.pack(PROP_MAGIC, self.tracker.seq, *self.sent_drive)
+        if not letters:
+            del variants["seq"]
+        return variants
     
-    async def send_command(self, command):
-        """Send command to all connected ESP32 clients"""
+    def check_acks(self, now):
+        """Resend current state to clients with lost commands; warn about silent ones"""
+        for websocket in self.tracker.expire(now):
+            channel = self.connected_clients.channels.get(websocket)
+            if channel is not None:
+                channel.put(channel.choose(self.last_command, self.encode_state(self.last_command, now, [websocket])))
+        for websocket, age in self.tracker.stale_clients(now):
+            client_ip = websocket.remote_address[0] if websocket.remote_address else "unknown"
+            print(f"⚠️  ESP32 {client_ip} has not acknowledged a command for {age:.1f} s")
+    
+    def on_evict(self, websocket, reason):
+        client_ip = websocket.remote_address[0] if websocket.remote_address else "unknown"
+        print(f"⚠️  Dropping slow ESP32 {client_ip}: {reason}")
+    
+    def send_command(self, command, drive=None, letters=True):
+        """
+        Queue command (and drive frame) for all connected ESP32 clients (never waits on the network).
+        With letters=False only proportional clients get the update.
+        """
         command = command.upper()
         
         if not self.connected_clients:
-            print(f"⚠️  No ESP32 connected! Command '{command}' not sent.")
             return False
-            
-        if command == self.last_command:
-            return True  # Skip duplicate commands
-            
-        try:
-            # Send to all connected clients
-            for websocket in self.connected_clients:
-                await websocket.send(command)
-            
+        
+        changed = command != self.last_command
+        self.last_command = command
+        self.last_sent_time = time.monotonic()
+        if drive is not None:
+            self.sent_drive = drive
+            self.drive_frames += 1
+        
+        if letters:
+            self.last_letter_time = self.last_sent_time
+        variants = self.encode_state(command, self.last_sent_time, letters=letters)
+        self.connected_clients.broadcast(command if letters else None, variants)
+        
+        # Keepalive resends are not worth a console line
+        if changed:
             self.command_count += 1
-            self.last_command = command
             timestamp = datetime.now().strftime('%H:%M:%S.%f')[:-3]
             
             # Print what command means
@@ -117,11 +188,98 @@ class RobotControlServer:
                 'X': 'BACKWARD'
             }
             command_name = command_names.get(command, command)
-            print(f"📤 [{timestamp}] Sent: '{command}' ({command_name}) [#{self.command_count}]")
-            return True
-        except Exception as e:
-            print(f"❌ Failed to send command: {e}")
-            return False
+            drive_info = f" speed {drive[0]:+d}% steer {drive[1]:+d}%" if drive is not None else ""
+            print(f"📤 [{timestamp}] Sent: '{command}' ({command_name}){drive_info} [#{self.command_count}]")
+        return True
+    
+    def desired_command(self):
+        """Command for the current key state: the most recently pressed key, else STOP"""
+        return self.pressed_keys[-1] if self.pressed_keys else 'S'
+    
+    def key_down(self, char, seen):
+        self.last_key_event = seen
+        if char not in self.pressed_keys:
+            self.pressed_keys.append(char)
+    
+    def key_up(self, char, seen):
+        self.last_key_event = seen
+        if char in self.pressed_keys:
+            self.pressed_keys.remove(char)
+    
+    def expire_stale_keys(self, now):
+        """
+        Dead-man check: while a key is held the OS auto-repeats the last one
+        pressed, so no key event at all for key_timeout seconds means a release
+        was lost. Every held key is released at once.
+        """
+        if self.key_timeout is None or not self.pressed_keys:
+            return
+        if now - self.last_key_event > self.key_timeout:
+            held = "', '".join(self.pressed_keys)
+            print(f"⚠️  No key events for {self.key_timeout} s - treating '{held}' as released")
+            self.pressed_keys.clear()
+    
+    def drive_targets(self):
+        """Target (speed, steer) for held keys, or None for a hard stop (S held)"""
+        keys = self.pressed_keys
+        if 'S' in keys:
+            return None
+        return (('W' in keys) - ('X' in keys), ('D' in keys) - ('A' in keys))
+    
+    def drive_tick(self, now, dt):
+        """Ramp speed/steer toward the key targets; send only changes beyond the deadband"""
+        targets = self.drive_targets()
+        if targets is None:
+            targets = (0, 0)
+            self.speed = self.steer = 0.0
+        else:
+            self.speed = ramp(self.speed, targets[0], dt)
+            self.steer = ramp(self.steer, targets[1], dt)
+        
+        if not self.connected_clients:
+            return
+        self.drive_ticks += 1
+        drive = (round(100 * self.speed), round(100 * self.steer))
+        delta = max(abs(drive[0] - self.sent_drive[0]), abs(drive[1] - self.sent_drive[1]))
+        settled = (self.speed, self.steer) == targets
+        letter = letter_for(drive)
+        letters_due = letter != self.last_command or now - self.last_letter_time >= KEEPALIVE_SECONDS
+        if letters_due or delta >= DEADBAND or (settled and delta) \
+                or now - self.last_sent_time >= KEEPALIVE_SECONDS:
+            self.send_command(letter, drive, letters=letters_due)
+    
+    async def control_loop(self):
+        """Fixed-rate tick: merge key state into one command, resend as keepalive"""
+        tick = 1.0 / CONTROL_HZ
+        next_tick = time.monotonic()
+        next_status = next_tick + STATUS_SECONDS
+        last_tick = next_tick
+        while self.running:
+            now = time.monotonic()
+            self.expire_stale_keys(now)
+            if self.proportional:
+                self.drive_tick(now, now - last_tick)
+            else:
+                command = self.desired_command()
+                if self.connected_clients and (
+                    command != self.last_command or now - self.last_sent_time >= KEEPALIVE_SECONDS
+                ):
+                    self.send_command(command)
+            last_tick = now
+            
+            self.check_acks(now)
+            if now >= next_status:
+                self.report_rtt(now)
+                next_status = now + STATUS_SECONDS
+            
+            next_tick += tick
+            delay = next_tick - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            else:
+                # Overran; skip missed ticks instead of bursting
+                next_tick = time.monotonic()
+                await asyncio.sleep(0)
     
     def on_press(self, key):
         """Handle key press events"""
@@ -130,21 +288,17 @@ class RobotControlServer:
             if hasattr(key, 'char') and key.char:
                 char = key.char.upper()
                 
-                # Only process W, A, S, D, X keys
-                if char in ['W', 'A', 'S', 'D', 'X']:
-                    if char not in self.pressed_keys:
-                        self.pressed_keys.add(char)
-                        # Schedule command sending in the asyncio loop
-                        asyncio.run_coroutine_threadsafe(
-                            self.send_command(char),
-                            self.loop
-                        )
+                # Only track W, A, S, D, X keys; the control tick sends commands
+                if char in MOVEMENT_KEYS:
+                    self.loop.call_soon_threadsafe(self.key_down, char, time.monotonic())
         except AttributeError:
-            # Special keys (like Esc, Ctrl, etc.)
-            if key == keyboard.Key.esc:
-                print("\n🛑 ESC pressed - Shutting down server...")
-                self.running = False
-                return False  # Stop listener
+            pass
+        
+        # Special keys (like Esc, Ctrl, etc.)
+        if key == keyboard.Key.esc:
+            print("\n🛑 ESC pressed - Shutting down server...")
+            self.running = False
+            return False  # Stop listener
     
     def on_release(self, key):
         """Handle key release events"""
@@ -152,15 +306,9 @@ class RobotControlServer:
             if hasattr(key, 'char') and key.char:
                 char = key.char.upper()
                 
-                # When any movement key is released, send STOP
-                if char in ['W', 'A', 'S', 'D', 'X']:
-                    if char in self.pressed_keys:
-                        self.pressed_keys.remove(char)
-                        # Send stop command
-                        asyncio.run_coroutine_threadsafe(
-                            self.send_command('S'),
-                            self.loop
-                        )
+                # Releasing every movement key leaves STOP as the desired command
+                if char in MOVEMENT_KEYS:
+                    self.loop.call_soon_threadsafe(self.key_up, char, time.monotonic())
         except AttributeError:
             pass
     
@@ -174,11 +322,6 @@ class RobotControlServer:
         print("⌨️  Keyboard listener started")
         return listener
     
-    async def keep_alive(self):
-        """Keep the server running and monitor status"""
-        while self.running:
-            await asyncio.sleep(1)
-    
     async def start_server(self, ws_port=8765, udp_port=8888):
         """Start WebSocket server and UDP discovery"""
         server_ip = "0.0.0.0"
@@ -199,28 +342,26 @@ class RobotControlServer:
         print("  D - Turn Right")
         print("  X - Backward")
         print("  ESC - Quit server")
+        if self.proportional:
+            print("🎚️  Proportional mode: hold keys to ramp speed/steer, combine W/X with A/D")
         print("="*60 + "\n")
         
         # Store event loop for keyboard callbacks
         self.loop = asyncio.get_event_loop()
         
-        # Start UDP discovery in separate thread
-        udp_thread = threading.Thread(
-            target=self.start_udp_discovery,
-            args=(udp_port, ws_port),
-            daemon=True
-        )
-        udp_thread.start()
+        # UDP discovery answers on this event loop
+        discovery, _ = await start_discovery(udp_port, ws_port, self.on_discovery)
+        print(f"🔍 UDP Discovery service running on port {udp_port}")
         
         # Start keyboard listener
         kb_listener = self.start_keyboard_listener()
         
         async def handle_client_wrapper(websocket):
-            self.connected_clients.add(websocket)
+            channel = self.connected_clients.add(websocket)
             try:
-                await self.handle_client(websocket)
+                await self.handle_client(websocket, channel)
             finally:
-                self.connected_clients.discard(websocket)
+                self.connected_clients.remove(websocket)
         
         try:
             async with websockets.serve(
@@ -236,19 +377,41 @@ class RobotControlServer:
                 print("⏳ Waiting for ESP32 connection...")
                 print("💡 Press W/A/S/D/X to control robot, ESC to quit\n")
                 
-                # Keep server running
-                await self.keep_alive()
+                # Run the control tick until ESC
+                await self.control_loop()
                 
         except Exception as e:
             print(f"❌ Server error: {e}")
         finally:
             self.running = False
+            discovery.close()
             kb_listener.stop()
             print("\n🔚 Server shutdown complete")
 
+def positive_float(text):
+    value = float(text)
+    if not value > 0:
+        raise argparse.ArgumentTypeError(f"must be greater than 0, got {text}")
+    return value
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Keyboard (WASD/X) motor control server for the ESP32")
+    parser.add_argument("--proportional", action="store_true",
+                        help="ramp speed/steer frames instead of switching W/A/S/D/X letters")
+    timeout = parser.add_mutually_exclusive_group()
+    timeout.add_argument("--key-timeout", metavar="SECONDS", type=positive_float, default=KEY_STALE_SECONDS,
+                         help=f"release held keys after this long without key events (default {KEY_STALE_SECONDS})")
+    timeout.add_argument("--no-key-timeout", action="store_true",
+                         help="never release held keys on silence (keyboards without auto-repeat)")
+    return parser.parse_args()
+
+
 def main():
     """Main function"""
-    server = RobotControlServer()
+    args = parse_args()
+    server = RobotControlServer(proportional=args.proportional,
+                                key_timeout=None if args.no_key_timeout else args.key_timeout)
     
     try:
         asyncio.run(server.start_server())
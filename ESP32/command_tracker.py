@@ -0,0 +1,185 @@
+"""
+Command sequence numbers, ack matching and round-trip statistics for the
+WebSocket motor servers.
+
+Envelope (opt-in, so older firmware keeps working):
+  - ESP32 says "ESP32_READY:<capabilities>" after connecting, e.g.
+    "ESP32_READY:SEQ" or "ESP32_READY:SEQ,PROP"
+  - with SEQ, the server sends commands as "<cmd>#<seq>", e.g. "W#1042"
+  - ESP32 replies "ACK:<cmd>#<seq>" once the command reached the motors
+  - seq is 16 bits and wraps, so binary frames can carry it too
+Firmware that only says "ESP32_READY" keeps receiving bare letters. If it
+replies "ACK:<cmd>", the time from a command change to its first ack is
+used as the round-trip time instead.
+
+Commands are motor state, so they are idempotent: a command that is not
+acked within LOST_SECONDS is counted lost and the caller resends the
+current state with a new sequence number. Unacked commands older than an
+acked one were replaced in the client's latest-value outbox (see
+ws_broadcast.py) and are counted as superseded, not lost.
+"""
+
+import bisect
+
+READY_PREFIX = "ESP32_READY:"
+SEQ_SEPARATOR = "#"
+LOST_SECONDS = 1.0       # No ack within this means the command is lost
+ACK_STALE_SECONDS = 1.5  # Warn when an ESP32 has not acknowledged anything for this long
+
+# RTT histogram: geometric buckets from 0.1 ms, 25% apart (last bucket is ~2.6 min)
+HIST_MIN_SECONDS = 0.0001
+HIST_GROWTH = 1.25
+HIST_BUCKETS = 64
+
+
+class RttHistogram:
+    """Fixed-bucket histogram; percentiles are accurate to one bucket (25%)."""
+
+    edges = [HIST_MIN_SECONDS * HIST_GROWTH ** i for i in range(HIST_BUCKETS)]
+
+    def __init__(self):
+        self.counts = [0] * (HIST_BUCKETS + 1)
+        self.count = 0
+        self.worst = 0.0
+
+    def add(self, seconds):
+        self.counts[bisect.bisect_left(self.edges, seconds)] += 1
+        self.count += 1
+        self.worst = max(self.worst, seconds)
+
+    def percentile(self, p):
+        """Upper edge of the bucket holding the p-th percentile (seconds), or None"""
+        if not self.count:
+            return None
+        rank = p / 100 * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank and n:
+                return min(self.edges[i], self.worst) if i < HIST_BUCKETS else self.worst
+        return self.worst
+
+
+class ClientStats:
+    def __init__(self):
+        self.capabilities = set()
+        self.enveloped = False
+        self.pending = {}       # seq -> (command, sent time); insertion order is seq order
+        self.rtt = RttHistogram()
+        self.command = None     # Last command the ESP32 acknowledged
+        self.ack_time = None
+        self.acked_change = None
+        self.lost = 0
+        self.superseded = 0
+        self.stale = False
+
+
+class CommandTracker:
+    """Per-client ack bookkeeping for one server; all times are time.monotonic()."""
+
+    def __init__(self):
+        self.seq = 0
+        self.clients = {}  # websocket -> ClientStats
+        self.last_command = None
+        self.last_change_time = 0.0
+        self.change_id = 0
+
+    def add(self, websocket):
+        self.clients[websocket] = ClientStats()
+
+    def remove(self, websocket):
+        self.clients.pop(websocket, None)
+
+    def is_enveloped(self, websocket):
+        stats = self.clients.get(websocket)
+        return stats is not None and stats.enveloped
+
+    def capabilities(self, websocket):
+        stats = self.clients.get(websocket)
+        return stats.capabilities if stats is not None else set()
+
+    def frame(self, command, seq):
+        return f"{command}{SEQ_SEPARATOR}{seq}"
+
+    def sent(self, command, now, websockets=None):
+        """
+        Record a command queued for websockets (default: every client).
+        Returns the envelope to send to clients that speak it.
+        """
+        if command != self.last_command:
+            self.last_command = command
+            self.last_change_time = now
+            self.change_id += 1
+        self.seq = (self.seq + 1) & 0xFFFF
+        for websocket in (self.clients if websockets is None else websockets):
+            stats = self.clients.get(websocket)
+            if stats is not None and stats.enveloped:
+                stats.pending[self.seq] = (command, now)
+        return self.frame(command, self.seq)
+
+    def on_message(self, websocket, message, now):
+        """Handle READY/ACK messages; returns False for anything else."""
+        stats = self.clients.get(websocket)
+        if stats is None:
+            return False
+        if message.startswith(READY_PREFIX):
+            stats.capabilities = set(message[len(READY_PREFIX):].split(","))
+            stats.enveloped = "SEQ" in stats.capabilities
+            return False  # Still worth printing
+        if not message.startswith("ACK:"):
+            return False
+
+        body = message[4:]
+        command, _, seq = body.partition(SEQ_SEPARATOR)
+        stats.command = command
+        stats.ack_time = now
+        if seq.isdigit() and int(seq) in stats.pending:
+            seq = int(seq)
+            for pending_seq in list(stats.pending):
+                _, sent_time = stats.pending.pop(pending_seq)
+                if pending_seq == seq:
+                    stats.rtt.add(now - sent_time)
+                    break
+                stats.superseded += 1
+        elif not seq and self.change_id and command == self.last_command \
+                and stats.acked_change != self.change_id:
+            # Bare ACK: first ack after a change gives its latency
+            stats.acked_change = self.change_id
+            stats.rtt.add(now - self.last_change_time)
+        return True
+
+    def expire(self, now):
+        """Count commands unacked for LOST_SECONDS; returns the clients that need a resend."""
+        resend = []
+        for websocket, stats in self.clients.items():
+            lost = [seq for seq, (_, sent_time) in stats.pending.items() if now - sent_time > LOST_SECONDS]
+            for seq in lost:
+                del stats.pending[seq]
+            if lost:
+                stats.lost += len(lost)
+                resend.append(websocket)
+        return resend
+
+    def stale_clients(self, now):
+        """Clients that just went ACK_STALE_SECONDS without an ack (reported once), with the age"""
+        newly_stale = []
+        for websocket, stats in self.clients.items():
+            if stats.ack_time is None:
+                continue
+            age = now - stats.ack_time
+            if age > ACK_STALE_SECONDS and not stats.stale:
+                newly_stale.append((websocket, age))
+            stats.stale = age > ACK_STALE_SECONDS
+        return newly_stale
+
+    def summary(self, websocket, now):
+        """One status line for a client"""
+        stats = self.clients.get(websocket)
+        if stats is None or stats.ack_time is None:
+            return "no ACK yet (firmware without ACK support?)"
+        p50, p99 = stats.rtt.percentile(50), stats.rtt.percentile(99)
+        rtt = "-" if p50 is None else \
+            f"p50 {1000 * p50:.1f} ms, p99 {1000 * p99:.1f} ms, worst {1000 * stats.rtt.worst:.1f} ms"
+        mode = "seq" if stats.enveloped else "bare"
+        return (f"running '{stats.command}', confirmed {now - stats.ack_time:.2f} s ago, "
+                f"RTT {rtt} ({stats.rtt.count} {mode} acks, {stats.lost} lost, {stats.superseded} superseded)")
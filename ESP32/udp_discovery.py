@@ -0,0 +1,98 @@
+"""
+Asyncio UDP discovery responder for the ESP32 control servers.
+
+Runs on the server's event loop as a DatagramProtocol (no thread, no
+polling timeout) and answers:
+  DISCOVER_SERVER     -> {"type": "SERVER_INFO", "ws_port": ..., "ip": ...}
+
+The ESP32-CAM's ESP32CAM_DISCOVERY handshake is not handled here: the
+camera broadcasts it on its frame port (1234), and the UDP camera
+receivers (UDP.py, ESP32_CAM/UDP_server.py, ...) answer it on the same
+socket they receive frames on.
+
+"ip" is this machine's address on the interface the ESP32 talks to, so a
+PC that is both on a LAN and running a hotspot hands out the right one.
+The interface is found once per ESP32 with a routing lookup (connect() on a
+UDP socket sends nothing), and the encoded reply is cached per interface
+address, so repeated discovery broadcasts cost one dict lookup each.
+"""
+
+import asyncio
+import json
+import socket
+
+FALLBACK_IP = "192.168.137.1"  # Windows mobile hotspot address
+
+_default_ip = None
+
+
+def route_ip(peer_ip):
+    """Local address the OS would use to reach peer_ip, or None"""
+    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        s.connect((peer_ip, 9))
+        return s.getsockname()[0]
+    except OSError:
+        return None
+    finally:
+        s.close()
+
+
+def default_ip():
+    """Address of the default-route interface (computed once)"""
+    global _default_ip
+    if _default_ip is None:
+        _default_ip = route_ip("8.8.8.8") or FALLBACK_IP
+    return _default_ip
+
+
+class DiscoveryResponder(asyncio.DatagramProtocol):
+    def __init__(self, ws_port, on_request=None):
+        self.ws_port = ws_port
+        self.on_request = on_request  # Called as on_request(message, addr, reply)
+        self.transport = None
+        self.interface_for_peer = {}  # ESP32 IP -> our address on its interface
+        self.replies = {}             # Interface address -> encoded SERVER_INFO
+        self.requests = 0
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        message = data.strip()
+        if message != b"DISCOVER_SERVER":
+            return
+        reply = self.server_info(addr[0])
+        self.transport.sendto(reply, addr)
+        self.requests += 1
+        if self.on_request is not None:
+            self.on_request(message.decode(), addr, reply)
+
+    def error_received(self, exc):
+        print(f"❌ UDP Discovery error: {exc}")
+
+    def server_info(self, peer_ip):
+        ip = self.interface_for_peer.get(peer_ip)
+        if ip is None:
+            ip = route_ip(peer_ip) or default_ip()
+            self.interface_for_peer[peer_ip] = ip
+        reply = self.replies.get(ip)
+        if reply is None:
+            reply = json.dumps({
+                "type": "SERVER_INFO",
+                "ws_port": self.ws_port,
+                "ip": ip
+            }).encode('utf-8')
+            self.replies[ip] = reply
+        return reply
+
+
+async def start_discovery(udp_port, ws_port, on_request=None):
+    """Bind the responder on the running loop; returns (transport, protocol)"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind(('0.0.0.0', udp_port))
+    loop = asyncio.get_running_loop()
+    return await loop.create_datagram_endpoint(
+        lambda: DiscoveryResponder(ws_port, on_request), sock=sock
+    )
@@ -0,0 +1,154 @@
+"""
+Non-blocking WebSocket broadcast with one outgoing queue and writer task per client.
+
+broadcast() only enqueues, so a slow or stalled ESP32 never delays the
+caller or the other clients. Each client's writer task drains its own queue.
+Clients that cannot keep up are detected and evicted.
+
+Queue modes:
+  - latest_only=True  (control messages): only the newest pending message is
+    kept; anything not yet sent is replaced, since stale commands are useless.
+  - latest_only=False: bounded FIFO of `maxsize`; the oldest message is
+    dropped when the queue is full.
+
+broadcast() can also take encoded variants of the message keyed by format
+name. A channel whose `format` names one of them gets that variant instead,
+which lets clients that negotiated a newer wire format share a broadcast
+with older ones. A message of None means "only clients with a variant".
+
+This is the only copy: the motor servers here and the robotic arm's
+cottonv2.py (which adds this folder to sys.path) both import it.
+"""
+
+import asyncio
+import collections
+import time
+
+SEND_TIMEOUT = 0.5       # One send taking longer than this counts as a stall
+MAX_STALLS = 3           # Consecutive stalled sends before the client is evicted
+MAX_QUEUE_AGE = 2.0      # Evict if the oldest pending message waited this long
+
+
+class ClientChannel:
+    """Outgoing queue plus writer task for one WebSocket connection."""
+
+    def __init__(self, websocket, on_evict=None, latest_only=True, maxsize=32):
+        self.websocket = websocket
+        self.on_evict = on_evict
+        self.queue = collections.deque(maxlen=1 if latest_only else maxsize)
+        self.wakeup = asyncio.Event()
+        self.oldest_pending = None  # monotonic time the oldest queued message was added
+        self.stalls = 0
+        self.sent = 0
+        self.replaced = 0  # Messages superseded or dropped before they were sent
+        self.closed = False
+        self.format = None  # Negotiated wire format; picks a broadcast variant
+        self.last_error = None
+        self.task = asyncio.create_task(self._writer())
+
+    def put(self, message):
+        """Queue a message without waiting; never blocks the caller."""
+        if self.closed:
+            return
+        if len(self.queue) == self.queue.maxlen:
+            self.replaced += 1
+        if not self.queue:
+            self.oldest_pending = time.monotonic()
+        self.queue.append(message)
+        self.wakeup.set()
+
+    def choose(self, message, variants=None):
+        """The encoding of a message this client should receive"""
+        if variants and self.format in variants:
+            return variants[self.format]
+        return message
+
+    def queue_age(self):
+        """Seconds the oldest unsent message has been waiting (0 if none)."""
+        return time.monotonic() - self.oldest_pending if self.queue else 0.0
+
+    async def _writer(self):
+        try:
+            while not self.closed:
+                await self.wakeup.wait()
+                self.wakeup.clear()
+                while self.queue and not self.closed:
+                    message = self.queue.popleft()
+                    if self.queue:
+                        self.oldest_pending = time.monotonic()
+                    try:
+                        await asyncio.wait_for(self.websocket.send(message), SEND_TIMEOUT)
+                        self.sent += 1
+                        self.stalls = 0
+                    except asyncio.TimeoutError:
+                        self.stalls += 1
+                        if self.stalls >= MAX_STALLS:
+                            await self.evict(f"{self.stalls} stalled sends")
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            # ConnectionClosed and friends: the connection handler cleans up
+            self.closed = True
+            self.last_error = e
+
+    async def evict(self, reason):
+        """Drop a slow consumer and close its connection."""
+        if self.closed:
+            return
+        self.closed = True
+        self.queue.clear()
+        if self.on_evict is not None:
+            self.on_evict(self, reason)
+        try:
+            await asyncio.wait_for(self.websocket.close(code=1008, reason="slow consumer"), 1.0)
+        except Exception:
+            pass
+
+    def close(self):
+        self.closed = True
+        self.queue.clear()
+        if self.task is not asyncio.current_task():
+            self.task.cancel()
+
+
+class Broadcaster:
+    """Set of ClientChannels with O(clients) non-blocking fan-out."""
+
+    def __init__(self, latest_only=True, maxsize=32, on_evict=None):
+        self.latest_only = latest_only
+        self.maxsize = maxsize
+        self.channels = {}
+        self.on_evict = on_evict
+        self.evicted = 0
+
+    def add(self, websocket):
+        channel = ClientChannel(websocket, self._evicted, self.latest_only, self.maxsize)
+        self.channels[websocket] = channel
+        return channel
+
+    def remove(self, websocket):
+        channel = self.channels.pop(websocket, None)
+        if channel is not None:
+            channel.close()
+
+    def _evicted(self, channel, reason):
+        self.channels.pop(channel.websocket, None)
+        self.evicted += 1
+        if self.on_evict is not None:
+            self.on_evict(channel.websocket, reason)
+
+    def broadcast(self, message, variants=None):
+        """Queue message for every client and check for slow consumers. Returns client count."""
+        for channel in list(self.channels.values()):
+            chosen = channel.choose(message, variants)
+            if chosen is not None:
+                channel.put(chosen)
+            if channel.queue_age() > MAX_QUEUE_AGE:
+                asyncio.ensure_future(channel.evict(f"queue stalled {channel.queue_age():.1f} s"))
+        return len(self.channels)
+
+    def __len__(self):
+        return len(self.channels)
+
+    def __bool__(self):
+        return bool(self.channels)
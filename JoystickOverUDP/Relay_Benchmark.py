@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+"""
+Relay latency/jitter benchmark for UDP_Server.py
+
+Spawns the relay (or targets one that is already running), registers
+simulated C3 senders and WROOM receivers on loopback, and streams binary
+joystick frames through it. Every send is stamped with perf_counter_ns and
+matched by sequence number on arrival, so the report is one-way relay
+latency (p50 / p99 / p99.9), jitter and loss.
+
+Frames superseded by the relay's burst coalescing count as lost, so run
+below saturation when comparing latency. --text streams "C3:<seq>" text
+commands instead, which every relay version understands.
+
+Examples:
+    python Relay_Benchmark.py                           # spawn UDP_Server.py
+    python Relay_Benchmark.py --pairs 20 --rate 200     # 20 cars at 200 Hz
+    python Relay_Benchmark.py --no-spawn --port 4210    # relay already running
+    python Relay_Benchmark.py --relay "./faster_relay"  # any other relay command
+    python Relay_Benchmark.py --max-p99-us 500          # fail (exit 1) above budget
+    python Relay_Benchmark.py --text                    # text protocol (older relays)
+"""
+
+import argparse
+import os
+import selectors
+import shlex
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+from UDP_Server import pack_frame, FRAME_SIZE
+
+PING_INTERVAL = 5.0  # Matches the ESP32 firmware heartbeat
+
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return float('nan')
+    k = min(len(sorted_values) - 1, max(0, int(round(p / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[k]
+
+
+def make_socket():
+    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    s.bind(('127.0.0.1', 0))
+    s.settimeout(1.0)
+    return s
+
+
+def handshake(sock, message, relay, expected):
+    """Send a registration message until the relay answers."""
+    for _ in range(5):
+        sock.sendto(message, relay)
+        try:
+            if sock.recv(64) == expected:
+                return True
+        except socket.timeout:
+            pass
+    return False
+
+
+class Benchmark:
+    def __init__(self, relay, pairs, rate, duration, text=False):
+        self.relay = relay
+        self.text = text
+        self.pairs = pairs
+        self.rate = rate
+        self.duration = duration
+        self.senders = [make_socket() for _ in range(pairs)]
+        self.receivers = [make_socket() for _ in range(pairs)]
+        # Send timestamp per (pair, sequence number); uint16 seq indexes directly
+        self.sent_at = [[0] * 65536 for _ in range(pairs)]
+        self.sent = 0
+        self.latencies_ns = []
+        self.running = True
+
+    def pair_id(self, i):
+        # A single pair uses the default pair so the original relay also works
+        return "" if self.pairs == 1 else f":bench{i}"
+
+    def register(self):
+        for i in range(self.pairs):
+            pair = self.pair_id(i).encode()
+            if not handshake(self.receivers[i], b"WROOM:READY" + pair, self.relay, b"ACK"):
+                return False
+            if not handshake(self.senders[i], b"PING_C3" + pair, self.relay, b"PONG"):
+                return False
+        return True
+
+    def send_loop(self):
+        """Round-robin sender pacing every C3 at self.rate on one clock."""
+        interval_ns = int(1e9 / self.rate)
+        start = time.perf_counter_ns()
+        end = start + int(self.duration * 1e9)
+        next_ping = time.monotonic() + PING_INTERVAL
+        seq = 0
+        next_send = start
+        while True:
+            now = time.perf_counter_ns()
+            if now >= end:
+                break
+            if now < next_send:
+                delay = (next_send - now) / 1e9
+                if delay > 0.0005:
+                    time.sleep(delay - 0.0003)
+                continue  # Spin for the last few hundred microseconds
+            frame_seq = seq & 0xFFFF
+            for i, sock in enumerate(self.senders):
+                frame = b"C3:%d" % frame_seq if self.text else pack_frame(frame_seq, i, 0, 0)
+                self.sent_at[i][frame_seq] = time.perf_counter_ns()
+                sock.sendto(frame, self.relay)
+                self.sent += 1
+            seq += 1
+            next_send += interval_ns
+
+            # Keep the receivers' leases alive on long runs
+            if time.monotonic() > next_ping:
+                for i, sock in enumerate(self.receivers):
+                    sock.sendto(b"PING_WROOM" + self.pair_id(i).encode(), self.relay)
+                next_ping += PING_INTERVAL
+
+    def receive_loop(self):
+        sel = selectors.DefaultSelector()
+        for i, sock in enumerate(self.receivers):
+            sock.setblocking(False)
+            sel.register(sock, selectors.EVENT_READ, i)
+        latencies = self.latencies_ns
+        while self.running:
+            for key, _ in sel.select(timeout=0.1):
+                sock, i = key.fileobj, key.data
+                while True:
+                    try:
+                        data = sock.recv(64)
+                    except (BlockingIOError, InterruptedError):
+                        break
+                    received = time.perf_counter_ns()
+                    if self.text:
+                        if not data.isdigit():
+                            continue  # PONG replies to the keepalive pings
+                        seq = int(data)
+                    elif len(data) != FRAME_SIZE:
+                        continue  # PONG replies to the keepalive pings
+                    else:
+                        seq = data[2] | (data[3] << 8)
+                    latencies.append(received - self.sent_at[i][seq])
+        sel.close()
+
+    def run(self):
+        receiver = threading.Thread(target=self.receive_loop, daemon=True)
+        receiver.start()
+        self.send_loop()
+        time.sleep(0.2)  # Let in-flight frames land
+        self.running = False
+        receiver.join()
+
+    def report(self):
+        lat_us = sorted(ns / 1000 for ns in self.latencies_ns)
+        received = len(lat_us)
+        loss = 1 - received / self.sent if self.sent else 0.0
+        p50, p99, p999 = (percentile(lat_us, p) for p in (50, 99, 99.9))
+        mean = sum(lat_us) / received if received else float('nan')
+        jitter = (sum((x - mean) ** 2 for x in lat_us) / received) ** 0.5 if received else float('nan')
+
+        print("\n" + "="*60)
+        print(f"📊 Relay benchmark: {self.pairs} pair(s) x {self.rate:g} Hz for {self.duration:g} s "
+              f"({'text' if self.text else 'binary'} frames)")
+        print("="*60)
+        print(f"Frames sent:     {self.sent}")
+        print(f"Frames received: {received}  (loss {100 * loss:.2f}%)")
+        print(f"Latency p50:     {p50:8.1f} µs")
+        print(f"Latency p99:     {p99:8.1f} µs")
+        print(f"Latency p99.9:   {p999:8.1f} µs")
+        print(f"Latency max:     {lat_us[-1] if lat_us else float('nan'):8.1f} µs")
+        print(f"Jitter (stdev):  {jitter:8.1f} µs")
+        print("="*60)
+        return p99, loss
+
+
+def main():
+    parser = argparse.ArgumentParser(description="UDP joystick relay latency benchmark")
+    parser.add_argument("--relay", default=f"{shlex.quote(sys.executable)} UDP_Server.py",
+                        help="command that starts the relay (default: UDP_Server.py)")
+    parser.add_argument("--no-spawn", action="store_true", help="use a relay that is already running")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=4210)
+    parser.add_argument("--pairs", type=int, default=1, help="simulated C3/WROOM pairs")
+    parser.add_argument("--rate", type=float, default=50, help="frames per second per C3")
+    parser.add_argument("--duration", type=float, default=10, help="seconds to stream")
+    parser.add_argument("--text", action="store_true", help="send text C3:<seq> commands")
+    parser.add_argument("--max-p99-us", type=float, default=None, help="fail if p99 exceeds this")
+    parser.add_argument("--max-loss", type=float, default=None, help="fail if loss fraction exceeds this")
+    args = parser.parse_args()
+
+    relay_proc = None
+    if not args.no_spawn:
+        here = os.path.dirname(os.path.abspath(__file__))
+        relay_proc = subprocess.Popen(shlex.split(args.relay), cwd=here,
+                                      stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        time.sleep(1.0)  # Give the relay time to bind
+
+    try:
+        bench = Benchmark((args.host, args.port), args.pairs, args.rate, args.duration, args.text)
+        print(f"🔗 Registering {args.pairs} pair(s) with relay at {args.host}:{args.port}...")
+        if not bench.register():
+            print("❌ Relay did not answer registration")
+            sys.exit(2)
+        print(f"🚀 Streaming for {args.duration:.0f} s...")
+        bench.run()
+        p99, loss = bench.report()
+    finally:
+        if relay_proc is not None:
+            relay_proc.terminate()
+            relay_proc.wait(timeout=5)
+
+    failed = False
+    if args.max_p99_us is not None and not p99 <= args.max_p99_us:
+        print(f"❌ p99 {p99:.1f} µs exceeds {args.max_p99_us:.1f} µs")
+        failed = True
+    if args.max_loss is not None and loss > args.max_loss:
+        print(f"❌ loss {100 * loss:.2f}% exceeds {100 * args.max_loss:.2f}%")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,24 +1,360 @@
 #!/usr/bin/env python3
 """
 Python UDP Server - Message Forwarder
-Receives commands from C3 and forwards to WROOM32
+Receives commands from C3 senders and forwards them to WROOM32 receivers
+
+Senders and receivers are grouped by a pairing ID, so one relay can serve a
+whole fleet of cars. Every C3 in a pair is forwarded to every WROOM in the
+same pair. Clients join a pair through their registration and heartbeat
+messages; without an ID they join the "default" pair, which keeps the
+existing single-car firmware working unchanged:
+
+    PING_C3[:<pair>]           C3 heartbeat (answered with PONG)
+    PING_WROOM[:<pair>]        WROOM heartbeat (answered with PONG)
+    WROOM:READY[:<pair>]       WROOM registration (answered with ACK)
+
+A heartbeat without an ID renews the client's lease in the pair it already
+belongs to, so firmware that registers with an ID but pings without one
+keeps its pairing; only unknown clients join the default pair this way.
+
+Registrations are leases: a client that misses LEASE_SECONDS worth of
+heartbeats is removed from the routing table. Any packet from a C3 renews
+its lease too, so a sender that only streams commands stays registered.
+
+Two message formats are accepted from the C3:
+  - Text:   "C3:<command>"  (forwarded as "<command>")
+  - Binary: a fixed 10-byte frame, little-endian
+
+        offset  size  field
+        0       1     magic (0xA5)
+        1       1     type  (0x01 = joystick state from C3)
+        2       2     sequence number (uint16, wraps)
+        4       2     X axis (int16)
+        6       2     Y axis (int16)
+        8       2     buttons (uint16 bitmask)
+
+    Binary frames are forwarded without decoding: only the type byte is
+    rewritten (FRAME_FORWARDED_FLAG set) so the WROOM can tell relayed
+    frames apart from anything else it receives.
+
+Binary frames carry a sequence number, so the relay drops duplicates and
+frames older than the last one forwarded for that C3. Every wake-up drains
+all queued packets first and forwards only the newest state per C3, so a
+burst of joystick updates costs the WROOM one packet.
 """
 
+import asyncio
 import socket
+import struct
+import sys
+import threading
+import queue
 import time
 from datetime import datetime
 
 # Server configuration
 SERVER_IP = '0.0.0.0'  # Listen on all interfaces
 SERVER_PORT = 4210
+VERBOSE = False        # Log every forwarded packet (off keeps the hot path lean)
+
+# Binary frame format
+FRAME_MAGIC = 0xA5
+FRAME_JOYSTICK = 0x01
+FRAME_FORWARDED_FLAG = 0x80
+FRAME_STRUCT = struct.Struct('<BBHhhH')  # magic, type, seq, x, y, buttons
+FRAME_SIZE = FRAME_STRUCT.size
+
+# Sequence tracking
+SEQ_HALF_RANGE = 0x8000  # uint16 serial arithmetic: "newer" means ahead by < 2^15
+SEQ_RESET_SECONDS = 1.0  # A sender silent this long may have rebooted; accept any seq
+MAX_DRAIN = 64           # Max packets drained per wake-up before forwarding
+
+# Routing
+DEFAULT_PAIR = "default"
+LEASE_SECONDS = 15.0     # Three missed PING_* heartbeats (sent every 5 s)
+SWEEP_INTERVAL = 1.0     # How often expired leases are removed
+
+SENDER = "C3"
+RECEIVER = "WROOM"
+
+# Console output is formatted and printed by a background thread so
+# string formatting and terminal I/O never delay forwarding.
+log_queue = queue.SimpleQueue()
+
+
+def log(fmt, *args):
+    """Queue a log line; fmt is formatted later on the logger thread."""
+    log_queue.put((time.time(), fmt, args))
+
+
+def log_worker(relay, stop_event, status_interval=10):
+    """Prints queued log lines and the periodic status block."""
+    last_status_print = time.time()
+    while not stop_event.is_set():
+        try:
+            ts, fmt, args = log_queue.get(timeout=0.5)
+            timestamp = datetime.fromtimestamp(ts).strftime("%H:%M:%S.%f")[:-3]
+            print(f"[{timestamp}] " + fmt.format(*args))
+        except queue.Empty:
+            pass
+
+        # Print status every 10 seconds
+        if time.time() - last_status_print > status_interval:
+            relay.print_status()
+            last_status_print = time.time()
+
+
+def pack_frame(seq, x, y, buttons, frame_type=FRAME_JOYSTICK):
+    """Build a binary joystick frame (used by test clients and tools)."""
+    return FRAME_STRUCT.pack(FRAME_MAGIC, frame_type, seq & 0xFFFF, x, y, buttons)
+
+
+def unpack_frame(data):
+    """Decode a binary frame into (type, seq, x, y, buttons)."""
+    _, frame_type, seq, x, y, buttons = FRAME_STRUCT.unpack(data)
+    return frame_type, seq, x, y, buttons
+
+
+class Route:
+    """Senders and receivers of one pairing ID, each mapped to its lease expiry."""
+
+    __slots__ = ("pair_id", "senders", "receivers")
+
+    def __init__(self, pair_id):
+        self.pair_id = pair_id
+        self.senders = {}
+        self.receivers = {}
+
+
+class UDPRelay:
+    """
+    Many-to-many C3 -> WROOM forwarder driven by an asyncio event loop.
+
+    The socket is registered with loop.add_reader rather than wrapped in a
+    DatagramProtocol so each wake-up can drain a whole burst before
+    forwarding (a protocol is handed one datagram per callback).
+    """
+
+    def __init__(self):
+        self.routes = {}      # pair ID -> Route
+        self.endpoints = {}   # address -> (pair ID, role); O(1) lookup per packet
+        self.sequence_state = {}  # C3 address -> [last accepted seq, time accepted]
+        self.sock = None
+        self.buf = bytearray(1024)  # Reused receive buffer
+        self.view = memoryview(self.buf)
+        self.pending = {}     # C3 address -> newest payload to forward this wake-up
+
+        # Statistics
+        self.packets_received = 0
+        self.packets_forwarded = 0
+        self.binary_forwarded = 0
+        self.packets_duplicate = 0  # Same sequence number as the last forwarded frame
+        self.packets_reordered = 0  # Older than the last forwarded frame (arrived late)
+        self.packets_coalesced = 0  # Superseded by a newer frame in the same burst
+        self.packets_dropped = 0    # Not forwarded because the pair has no WROOM
+
+    # --- Routing table ---
 
-# Client tracking
-c3_address = None
-wroom_address = None
+    def register(self, addr, pair_id, role, now):
+        """Add or renew addr's lease in a pair, moving it if its pair or role changed."""
+        current = self.endpoints.get(addr)
+        if current != (pair_id, role):
+            if current is not None:
+                self._remove(addr)
+            self.endpoints[addr] = (pair_id, role)
+            log("🔗 {} registered in pair '{}': {}:{}", role, pair_id, addr[0], addr[1])
+        route = self.routes.get(pair_id)
+        if route is None:
+            route = self.routes[pair_id] = Route(pair_id)
+        members = route.senders if role == SENDER else route.receivers
+        members[addr] = now + LEASE_SECONDS
+
+    def _remove(self, addr):
+        pair_id, role = self.endpoints.pop(addr)
+        self.sequence_state.pop(addr, None)
+        route = self.routes.get(pair_id)
+        if route is not None:
+            (route.senders if role == SENDER else route.receivers).pop(addr, None)
+            if not route.senders and not route.receivers:
+                del self.routes[pair_id]
+
+    def expire(self, now):
+        """Drop every client whose lease has run out."""
+        expired = [addr for route in self.routes.values()
+                   for members in (route.senders, route.receivers)
+                   for addr, expiry in members.items() if expiry < now]
+        for addr in expired:
+            pair_id, role = self.endpoints[addr]
+            self._remove(addr)
+            log("⌛ {} lease expired in pair '{}': {}:{}", role, pair_id, addr[0], addr[1])
+
+    def current_pair(self, addr, role):
+        """Pair addr holds a lease in for role, else DEFAULT_PAIR (for bare heartbeats)."""
+        endpoint = self.endpoints.get(addr)
+        return endpoint[0] if endpoint is not None and endpoint[1] == role else DEFAULT_PAIR
+
+    def sender_route(self, addr, now):
+        """
+        Route of a C3, registering unknown senders in the default pair.
+        Any traffic from a known C3 renews its lease, like a heartbeat.
+        """
+        endpoint = self.endpoints.get(addr)
+        if endpoint is None or endpoint[1] != SENDER:
+            self.register(addr, DEFAULT_PAIR, SENDER, now)
+            endpoint = self.endpoints[addr]
+        route = self.routes[endpoint[0]]
+        route.senders[addr] = now + LEASE_SECONDS
+        return route
+
+    # --- Packet handling ---
+
+    def accept_sequence(self, addr, seq, now):
+        """
+        True if seq is newer than the last frame accepted from addr.
+        Counts duplicates and late (reordered) frames.
+        """
+        state = self.sequence_state.get(addr)
+        if state is None or now - state[1] > SEQ_RESET_SECONDS:
+            self.sequence_state[addr] = [seq, now]
+            return True
+        delta = (seq - state[0]) & 0xFFFF
+        if delta == 0:
+            self.packets_duplicate += 1
+            return False
+        if delta >= SEQ_HALF_RANGE:
+            self.packets_reordered += 1
+            return False
+        state[0] = seq
+        state[1] = now
+        return True
+
+    def handle_text(self, data, addr, now):
+        """
+        Handles a text message. Returns the encoded command to forward for
+        "C3:<command>" messages, otherwise None.
+        """
+        try:
+            message = data.decode('utf-8').strip()
+        except UnicodeDecodeError:
+            log("⚠️  Received non-UTF8 data from {}:{}", addr[0], addr[1])
+            return None
+
+        # Identify client type based on message
+        if message.startswith("C3:"):
+            # Message from C3 (sender); keeps the pair it registered with
+            self.sender_route(addr, now)
+            command = message.split(":", 1)[1]
+            if VERBOSE:
+                log("📤 C3 → Server: '{}' from {}:{}", command, addr[0], addr[1])
+            return command.encode('utf-8')
+
+        elif message.startswith("WROOM:"):
+            # Registration from WROOM32 (receiver): WROOM:READY[:<pair>]
+            parts = message.split(":")
+            pair_id = parts[2] if len(parts) > 2 and parts[2] else DEFAULT_PAIR
+            self.register(addr, pair_id, RECEIVER, now)
+
+            # Send acknowledgment
+            self.sock.sendto(b"ACK", addr)
+
+        elif message == "PING_C3" or message.startswith("PING_C3:"):
+            # Heartbeat from C3: PING_C3[:<pair>]
+            pair_id = message[len("PING_C3:"):] or self.current_pair(addr, SENDER)
+            self.register(addr, pair_id, SENDER, now)
+            self.sock.sendto(b"PONG", addr)
+
+        elif message == "PING_WROOM" or message.startswith("PING_WROOM:"):
+            # Heartbeat from WROOM: PING_WROOM[:<pair>]
+            pair_id = message[len("PING_WROOM:"):] or self.current_pair(addr, RECEIVER)
+            self.register(addr, pair_id, RECEIVER, now)
+            self.sock.sendto(b"PONG", addr)
+
+        else:
+            log("❓ Unknown message: '{}' from {}:{}", message, addr[0], addr[1])
+
+        return None
+
+    def on_readable(self):
+        """Drains a burst of datagrams, then forwards the newest state per C3."""
+        sock, buf, view, pending = self.sock, self.buf, self.view, self.pending
+        now = time.monotonic()
+
+        for _ in range(MAX_DRAIN):
+            try:
+                nbytes, addr = sock.recvfrom_into(buf)
+            except (BlockingIOError, InterruptedError):
+                break
+            except ConnectionResetError:
+                # Windows reports ICMP port-unreachable from an earlier sendto here
+                continue
+            self.packets_received += 1
+
+            # Fast path: binary joystick frame, never decoded to text
+            if nbytes == FRAME_SIZE and buf[0] == FRAME_MAGIC and buf[1] == FRAME_JOYSTICK:
+                self.sender_route(addr, now)
+                if self.accept_sequence(addr, buf[2] | (buf[3] << 8), now):
+                    if addr in pending:
+                        self.packets_coalesced += 1
+                    buf[1] = FRAME_JOYSTICK | FRAME_FORWARDED_FLAG
+                    pending[addr] = bytes(view[:nbytes])
+            else:
+                command = self.handle_text(bytes(view[:nbytes]), addr, now)
+                if command is not None:
+                    if addr in pending:
+                        self.packets_coalesced += 1
+                    pending[addr] = command
+
+        # Forward only the newest state of each C3 to every WROOM in its pair
+        for src, payload in pending.items():
+            endpoint = self.endpoints.get(src)
+            route = self.routes.get(endpoint[0]) if endpoint else None
+            if not route or not route.receivers:
+                self.packets_dropped += 1
+                if VERBOSE:
+                    log("⚠️  No WROOM in pair for {}:{}, message dropped", src[0], src[1])
+                continue
+            for dst in route.receivers:
+                sock.sendto(payload, dst)
+                self.packets_forwarded += 1
+                if payload[0] == FRAME_MAGIC:
+                    self.binary_forwarded += 1
+                if VERBOSE:
+                    log("📥 Server → WROOM: {!r} from {}:{} to {}:{}",
+                        payload, src[0], src[1], dst[0], dst[1])
+        pending.clear()
+
+    async def serve(self, host=SERVER_IP, port=SERVER_PORT):
+        """Runs the relay on the current event loop until cancelled."""
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind((host, port))
+        self.sock.setblocking(False)
+
+        loop = asyncio.get_running_loop()
+        loop.add_reader(self.sock.fileno(), self.on_readable)
+        try:
+            while True:
+                await asyncio.sleep(SWEEP_INTERVAL)
+                self.expire(time.monotonic())
+        finally:
+            loop.remove_reader(self.sock.fileno())
+            self.sock.close()
+
+    # --- Console ---
+
+    def print_status(self):
+        print("\n" + "-"*50)
+        if not self.routes:
+            print("Pairs: none connected")
+        for pair_id, route in list(self.routes.items()):
+            c3 = ", ".join(f"{a[0]}:{a[1]}" for a in route.senders) or "Not connected"
+            wroom = ", ".join(f"{a[0]}:{a[1]}" for a in route.receivers) or "Not connected"
+            print(f"Pair '{pair_id}': C3 [{c3}] → WROOM [{wroom}]")
+        print(f"Packets Received: {self.packets_received}")
+        print(f"Packets Forwarded: {self.packets_forwarded} ({self.binary_forwarded} binary)")
+        print(f"Duplicate: {self.packets_duplicate}  Reordered: {self.packets_reordered}  "
+              f"Coalesced: {self.packets_coalesced}  Dropped: {self.packets_dropped}")
+        print("-"*50 + "\n")
 
-# Statistics
-packets_received = 0
-packets_forwarded = 0
 
 def print_header():
     print("\n" + "="*50)
@@ -28,93 +364,34 @@ def print_header():
     print(f"Server Port: {SERVER_PORT}")
     print("="*50 + "\n")
 
-def print_status():
-    print("\n" + "-"*50)
-    print(f"C3 Address: {c3_address if c3_address else 'Not connected'}")
-    print(f"WROOM Address: {wroom_address if wroom_address else 'Not connected'}")
-    print(f"Packets Received: {packets_received}")
-    print(f"Packets Forwarded: {packets_forwarded}")
-    print("-"*50 + "\n")
-
 def main():
-    global c3_address, wroom_address, packets_received, packets_forwarded
-    
     print_header()
-    
-    # Create UDP socket
-    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    sock.bind((SERVER_IP, SERVER_PORT))
-    
+
+    # add_reader needs a selector loop; Windows defaults to the proactor
+    if sys.platform == "win32":
+        asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+
+    relay = UDPRelay()
+    stop_event = threading.Event()
+    logger = threading.Thread(target=log_worker, args=(relay, stop_event), daemon=True)
+    logger.start()
+
     print(f"✅ Server started successfully!")
     print(f"🎧 Listening on port {SERVER_PORT}...")
     print("\nWaiting for clients to connect...\n")
-    
-    last_status_print = time.time()
-    
+
     try:
-        while True:
-            # Receive data
-            data, addr = sock.recvfrom(1024)
-            packets_received += 1
-            
-            try:
-                message = data.decode('utf-8').strip()
-                timestamp = datetime.now().strftime("%H:%M:%S.%f")[:-3]
-                
-                # Identify client type based on message
-                if message.startswith("C3:"):
-                    # Message from C3 (sender)
-                    c3_address = addr
-                    command = message.split(":", 1)[1] if ":" in message else message
-                    
-                    print(f"[{timestamp}] 📤 C3 → Server: '{command}' from {addr[0]}:{addr[1]}")
-                    
-                    # Forward to WROOM32 if connected
-                    if wroom_address:
-                        sock.sendto(command.encode('utf-8'), wroom_address)
-                        packets_forwarded += 1
-                        print(f"[{timestamp}] 📥 Server → WROOM: '{command}' to {wroom_address[0]}:{wroom_address[1]}")
-                    else:
-                        print(f"[{timestamp}] ⚠️  WROOM not connected, message dropped")
-                
-                elif message.startswith("WROOM:"):
-                    # Registration from WROOM32 (receiver)
-                    wroom_address = addr
-                    print(f"[{timestamp}] 🔗 WROOM32 registered: {addr[0]}:{addr[1]}")
-                    
-                    # Send acknowledgment
-                    sock.sendto(b"ACK", addr)
-                
-                elif message == "PING_C3":
-                    # Ping from C3
-                    c3_address = addr
-                    sock.sendto(b"PONG", addr)
-                
-                elif message == "PING_WROOM":
-                    # Ping from WROOM
-                    wroom_address = addr
-                    sock.sendto(b"PONG", addr)
-                
-                else:
-                    print(f"[{timestamp}] ❓ Unknown message: '{message}' from {addr[0]}:{addr[1]}")
-            
-            except UnicodeDecodeError:
-                print(f"[{timestamp}] ⚠️  Received non-UTF8 data from {addr[0]}:{addr[1]}")
-            
-            # Print status every 10 seconds
-            if time.time() - last_status_print > 10:
-                print_status()
-                last_status_print = time.time()
-    
+        asyncio.run(relay.serve())
+
     except KeyboardInterrupt:
         print("\n\n⛔ Server shutting down...")
-        print_status()
-        sock.close()
+        stop_event.set()
+        relay.print_status()
         print("✅ Server closed successfully")
-    
+
     except Exception as e:
         print(f"\n❌ Error: {e}")
-        sock.close()
+        stop_event.set()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
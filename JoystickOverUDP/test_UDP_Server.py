@@ -0,0 +1,68 @@
+"""
+Routing-table tests for UDP_Server.UDPRelay (no network: replies go to a fake socket).
+
+Run with: python -m pytest test_UDP_Server.py
+"""
+
+from UDP_Server import DEFAULT_PAIR, LEASE_SECONDS, RECEIVER, SENDER, UDPRelay
+
+
+class FakeSocket:
+    def __init__(self):
+        self.sent = []
+
+    def sendto(self, data, addr):
+        self.sent.append((data, addr))
+
+
+def make_relay():
+    relay = UDPRelay()
+    relay.sock = FakeSocket()
+    return relay
+
+
+WROOM = ("10.0.0.2", 4210)
+C3 = ("10.0.0.3", 4210)
+
+
+def test_bare_ping_keeps_the_registered_pair():
+    relay = make_relay()
+    relay.handle_text(b"WROOM:READY:carA", WROOM, 0.0)
+    relay.handle_text(b"PING_WROOM", WROOM, 5.0)
+    assert relay.endpoints[WROOM] == ("carA", RECEIVER)
+    assert relay.routes["carA"].receivers[WROOM] == 5.0 + LEASE_SECONDS
+    assert DEFAULT_PAIR not in relay.routes
+
+    relay.handle_text(b"PING_C3:carA", C3, 0.0)
+    relay.handle_text(b"PING_C3", C3, 5.0)
+    assert relay.endpoints[C3] == ("carA", SENDER)
+
+
+def test_bare_ping_from_unknown_client_joins_default_pair():
+    relay = make_relay()
+    relay.handle_text(b"PING_WROOM", WROOM, 0.0)
+    assert relay.endpoints[WROOM] == (DEFAULT_PAIR, RECEIVER)
+
+
+def test_ping_with_id_moves_the_client():
+    relay = make_relay()
+    relay.handle_text(b"WROOM:READY:carA", WROOM, 0.0)
+    relay.handle_text(b"PING_WROOM:carB", WROOM, 1.0)
+    assert relay.endpoints[WROOM] == ("carB", RECEIVER)
+    assert "carA" not in relay.routes
+
+
+def test_text_commands_renew_the_sender_lease():
+    relay = make_relay()
+    relay.handle_text(b"PING_C3:carA", C3, 0.0)
+    relay.handle_text(b"C3:F", C3, 10.0)
+    relay.expire(20.0)
+    assert relay.endpoints[C3] == ("carA", SENDER)
+    relay.expire(10.0 + LEASE_SECONDS + 1)
+    assert C3 not in relay.endpoints
+
+
+def test_ping_prefix_must_be_exact():
+    relay = make_relay()
+    relay.handle_text(b"PING_C3X", C3, 0.0)
+    assert C3 not in relay.endpoints